@@ -18,6 +18,7 @@ from streamlit_lottie import st_lottie
 from sys import path
 import os
 from utils.func_streamlit import *
+from utils import instrumentacion
 
 
 path.append(os.path.abspath(os.path.join('..')))
@@ -29,8 +30,9 @@ st.set_page_config(page_title="Hipparcos",
 st.set_option("deprecation.showPyplotGlobalUse", False)
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
-# Lectura de datos
-df_parallax, variables = load_data()
+# Handles de los catálogos: las figuras leen las columnas del fichero mapeado
+# en memoria, compartido por todos los procesos, sin crear DataFrames
+catalogo, catalogo_variables = load_catalogos()
 
 def main():
     # Cambiar la fuente de texto
@@ -72,10 +74,7 @@ def main():
             st.latex(r'''1 \,\text{pc} = 3,26 \,\text{años-luz}''')
 
         with cols[1]:
-            dist_hist = px.histogram(
-                df_parallax, x=df_parallax['d'], nbins=100)
-            dist_hist.update_layout(title="Distribución de la distancia",
-                                    xaxis_title="Distancia [pc]", yaxis_title="Recuento", template='plotly_dark', height=400, width=800)
+            dist_hist = create_distancia_fig(catalogo)
             st.plotly_chart(dist_hist,  use_container_width=True)
             st.markdown(
                 "Cuanto más lejanas son las estrellas más pequeño es el ángulo de la paralaje y por tanto menos medidas.")
@@ -93,7 +92,7 @@ def main():
 
         st.markdown("### Movimientos propios de las estrellas")
 
-        mov_propio = create_mov_propio_fig(df_parallax)
+        mov_propio = create_mov_propio_fig(catalogo)
 
         st.plotly_chart(mov_propio, use_container_width=True)
 
@@ -123,8 +122,8 @@ def main():
 
         # Mostrar los gráficos
         st.plotly_chart(create_tipo_espec_fig(
-            df_parallax), use_container_width=True)
-        st.plotly_chart(create_clase_fig(df_parallax),
+            catalogo), use_container_width=True)
+        st.plotly_chart(create_clase_fig(catalogo),
                         use_container_width=True)
 
         expander = st.expander("Ver explicación")
@@ -166,58 +165,31 @@ def main():
                         Por tanto, la magnitud visual de las estrellas es una medida importante para clasificar y comparar el brillo aparente de las estrellas.
                 """)
         
-        visible = filter_visible(df_parallax, cutoff_magnitude=6.5)
-
+        # Campos del cielo registrados en utils/cielo.py, de dos en dos
         cols = st.columns(2)
 
-        with cols[0]:
-            osa = custom_scatter(visible, 'RAdeg', 'DEdeg', 'Vmag', [220, 140], [40, 70], 'Greys', 1,
-                                 {'RAdeg': 'Ascensión recta [°]',
-                                     'DEdeg': 'Declinación [°]'},
-                                 'Constelación de la Osa Mayor', ['d', 'Vmag'],
-                                 '<br>'.join([
-                                     'RA: %{x:.2f}',
-                                     'Dec: %{y:.2f}',
-                                     'Distancia: %{customdata[0]:.2f} pc',
-                                     'Magnitud visual: %{customdata[1]:.2f}',
-                                 ]))
-            st.plotly_chart(osa, use_container_width=True)
-
-        with cols[1]:
-            orion = custom_scatter(visible, 'RAdeg', 'DEdeg', 'Vmag', [120, 40], [-20, 22], 'Greys', 1,
-                                   {'RAdeg': 'Ascensión recta [°]',
-                                       'DEdeg': 'Declinación [°]'},
-                                   'Constelación de Orión', ['d', 'Vmag'],
-                                   '<br>'.join([
-                                       'RA: %{x:.2f}',
-                                       'Dec: %{y:.2f}',
-                                       'Distancia: %{customdata[0]:.2f} pc',
-                                       'Magnitud visual: %{customdata[1]:.2f}',
-                                   ]))
-            st.plotly_chart(orion, use_container_width=True)
-            del visible
+        for i, vista in enumerate(VISTAS.values()):
+            with cols[i % 2]:
+                st.plotly_chart(create_vista_fig(catalogo, vista=vista), use_container_width=True)
 
 
         # Llamar a la función para crear las visualizaciones
-        mag, dist_type = create_visualizations(df_parallax)
+        mag, dist_type = create_visualizations(catalogo)
 
         # Mostrar las visualizaciones
         st.plotly_chart(mag, use_container_width=True)
         st.plotly_chart(dist_type, use_container_width=True)
 
-        # Resetear el índice del DataFrame
-        df_parallax.reset_index(drop=True, inplace=True)
-
 
         cols = st.columns(2)
 
         # Llamar a las funciones para crear las gráficas
         with cols[0]:
-            magnitudes = create_magnitudes_plot(df_parallax)
+            magnitudes = create_magnitudes_plot(catalogo)
             st.plotly_chart(magnitudes, use_container_width=True)
 
         with cols[1]:
-            cumulative = create_cumulative_plot(df_parallax)
+            cumulative = create_cumulative_plot(catalogo)
             st.plotly_chart(cumulative, use_container_width=True)
             expander = st.expander("Más información")
             expander.write("""
@@ -249,22 +221,8 @@ def main():
             - Estrellas eclipsantes: estrellas que parecen disminuir en brillo periódicamente debido al oscurecimiento mutuo de dos estrellas en órbita cercana. Ejemplos incluyen las binarias eclipsantes.
             - Estrellas variables cataclísmicas: estrellas que experimentan cambios dramáticos en su luminosidad debido a la transferencia de masa de una estrella a otra en un sistema binario cercano.
             """)
-        variab = px.histogram(variables, x="Period", nbins=200, log_y=True, template='plotly_dark',
-                              title="Histograma del período estelar en el catálogo Hipparcos")
-        tipo_espectral_order = ['O', 'B', 'A', 'F', 'G', 'K', 'M']
-        # Actualizar el diseño
-        variab.update_layout(xaxis_title="Período [Días]", yaxis_title="log(N)",
-                             height=600,
-                             width=1000)
+        variab, var_type = create_variabilidad_figs(catalogo_variables)
         st.plotly_chart(variab, use_container_width=True)
-
-        var_type = px.histogram(variables, x='HvarType', color='HvarType',
-                                title='Distribución del tipo de variabilidad estelar en el catálogo Hipparcos',
-                                template='plotly_dark')
-        var_type.update_layout(xaxis_title='Tipo de variabilidad',
-                               yaxis_title='Recuento',
-                               height=600,
-                               width=1000)
         st.plotly_chart(var_type, use_container_width=True)
         expander = st.expander(
             "¿Qué quieren decir estos tipos de variabilidad?")
@@ -313,20 +271,37 @@ def main():
                             """)
 
         st.latex(r'''T = \frac{8540\,\text{K}}{(B-V)+0.865}''')
+
+        # Con muchas estrellas en la región el diagrama se dibuja como imagen de densidad;
+        # al ampliar una región pequeña se muestran las estrellas individuales
+        expander = st.expander("Ampliar una región del diagrama HR o elegir tipos espectrales")
+        zoom_BV = expander.slider('B-V [mag]', min_value=zoom_HR[0][0],
+                                  max_value=zoom_HR[0][1], value=tuple(zoom_HR[0]))
+        zoom_Mv = expander.slider('Magnitud absoluta [mag]', min_value=zoom_HR[1][0],
+                                  max_value=zoom_HR[1][1], value=tuple(zoom_HR[1]))
+        tipos_HR = expander.multiselect('Tipos espectrales', tipo_espectral_order,
+                                        default=tipo_espectral_order)
         cols = st.columns(2)
 
         with cols[0]:
-            st.plotly_chart(generar_HR(df_parallax), use_container_width=True)
+            # Con todos los tipos marcados no se filtra, que es la figura precalculada
+            tipos = None if len(tipos_HR) == len(tipo_espectral_order) else tuple(tipos_HR)
+            st.plotly_chart(generar_HR(catalogo, range_x=list(zoom_BV), range_y=list(zoom_Mv),
+                                       tipos=tipos),
+                            use_container_width=True)
 
         with cols[1]:
-            st.plotly_chart(generar_HR2(df_parallax), use_container_width=True)
+            st.plotly_chart(generar_HR2(catalogo), use_container_width=True)
         col1, col2 = st.columns(2)
         with cols[0]:
-            st.plotly_chart(generar_HR3D(df_parallax),
+            st.plotly_chart(generar_HR3D(catalogo),
                             use_container_width=True)
 
         with cols[1]:
             st.image('img/HR.jpeg', use_column_width='auto')
 
+    mostrar_metricas_hash(catalogo)
+    instrumentacion.panel()
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,229 @@
+'''
+Benchmarks de las primitivas de preprocesamiento de utils/funciones.py.
+
+Genera catálogos sintéticos con la forma del catálogo Hipparcos (mismas
+columnas, proporción de nulos y cardinalidad de las categóricas) de 10k, 100k,
+1M y 10M filas, mide el tiempo (el mejor de varias repeticiones) y el pico de
+memoria (tracemalloc, en una ejecución aparte) de cada primitiva y escribe los
+resultados en JSON. Si se pasa una línea base, compara con ella y termina con
+código 1 cuando alguna medida empeora más que el umbral.
+
+Uso (desde la raíz del proyecto):
+
+    python -m benchmarks.funciones --tamanos 10000 100000 --guardar-base
+    python -m benchmarks.funciones --tamanos 10000 100000 --base benchmarks/base_funciones.json
+'''
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import sklearn
+
+from utils.funciones import (bravas, des_fritas, fritas, mojo_picon, papas_perdidas,
+                             pure, replace_outliers)
+
+
+TAMANOS = (10_000, 100_000, 1_000_000, 10_000_000)
+RUTA_RESULTADOS = 'benchmarks/resultados_funciones.json'
+RUTA_BASE = 'benchmarks/base_funciones.json'
+# Empeoramiento relativo a partir del cual una medida cuenta como regresión
+UMBRAL = 0.2
+# Tras este tiempo acumulado no se repite más una medida: en las primitivas
+# lentas el ruido relativo ya es pequeño
+PRESUPUESTO_SEGUNDOS = 10
+
+# Columnas numéricas: (media, desviación, fracción de nulos), como en hipparcos.csv
+NUMERICAS = {
+    'Vmag': (8.4, 1.3, 0.0), 'RAdeg': (180, 104, 0.002), 'DEdeg': (0, 41, 0.002),
+    'Plx': (7.4, 11.0, 0.002), 'pmRA': (-5, 160, 0.002), 'pmDE': (-45, 130, 0.002),
+    'e_Plx': (1.3, 0.8, 0.002), 'BTmag': (9.2, 1.5, 0.06), 'VTmag': (8.5, 1.3, 0.06),
+    'B-V': (0.7, 0.5, 0.01), 'V-I': (0.8, 0.5, 0.001), 'Hpmag': (8.5, 1.3, 0.0),
+    'Period': (50, 120, 0.98),
+}
+# Columnas categóricas: (cardinalidad, fracción de nulos)
+CATEGORICAS = {'SpType': (4000, 0.026), 'HvarType': (6, 0.39), 'MultFlag': (5, 0.85),
+               'moreVar': (2, 0.93), 'morePhoto': (3, 0.97)}
+
+
+def generar_catalogo(filas, semilla=0):
+    """
+    Catálogo sintético de `filas` estrellas con la forma de hipparcos.csv.
+    Las categóricas son columnas object que reutilizan un conjunto fijo de
+    cadenas, con frecuencias muy desiguales (Zipf) como los tipos espectrales.
+    """
+    rng = np.random.default_rng(semilla)
+    columnas = {'HIP': np.arange(1, filas + 1)}
+    for nombre, (media, desviacion, nulos) in NUMERICAS.items():
+        valores = rng.normal(media, desviacion, filas)
+        valores[rng.random(filas) < nulos] = np.nan
+        columnas[nombre] = valores
+    for nombre, (cardinalidad, nulos) in CATEGORICAS.items():
+        etiquetas = np.array([f'{nombre[:2]}{i}' for i in range(cardinalidad)], dtype=object)
+        indices = np.minimum(rng.zipf(1.3, filas) - 1, cardinalidad - 1)
+        valores = etiquetas[indices]
+        valores[rng.random(filas) < nulos] = np.nan
+        columnas[nombre] = valores
+    return pd.DataFrame(columnas)
+
+
+def _numericas(df):
+    return df[list(NUMERICAS)]
+
+
+def _codificado(df):
+    # Entrada numérica de las primitivas de vecinos, como en HipparcosPreprocessor
+    return fritas(df)[0].drop(columns='Period')
+
+
+def _preparar_des_fritas(df):
+    df_encoded, encoder_info = fritas(df)
+    return lambda: des_fritas(df_encoded, encoder_info)
+
+
+def _preparar_pure(df):
+    numericas = _numericas(df).fillna(0)
+    return lambda: pure(numericas)
+
+
+def _preparar_replace_outliers(df):
+    numericas = _numericas(df)
+    return lambda: replace_outliers(numericas, inplace=False)
+
+
+def _preparar_mojo_picon(df):
+    codificado = _codificado(df)
+    return lambda: mojo_picon(codificado, 5)
+
+
+def _preparar_bravas(df):
+    codificado = _codificado(df)
+    return lambda: bravas(codificado, 'SpType', 2, 5)
+
+
+# Primitiva -> (preparación no medida que devuelve la llamada a medir, filas máximas)
+PRIMITIVAS = {
+    'fritas': (lambda df: lambda: fritas(df), None),
+    'des_fritas': (_preparar_des_fritas, None),
+    'papas_perdidas': (lambda df: lambda: papas_perdidas(df), None),
+    'pure': (_preparar_pure, None),
+    'replace_outliers': (_preparar_replace_outliers, None),
+    # Las búsquedas de vecinos tardan minutos ya con 100k filas
+    'mojo_picon': (_preparar_mojo_picon, 100_000),
+    'bravas': (_preparar_bravas, 100_000),
+}
+
+
+def medir(funcion, repeticiones=3):
+    """
+    Devuelve el mejor tiempo de `repeticiones` llamadas a `funcion` (menos si
+    se agota `PRESUPUESTO_SEGUNDOS`) y el pico de memoria en MB de una llamada
+    más con tracemalloc activo.
+    """
+    tiempos = []
+    while len(tiempos) < repeticiones and sum(tiempos) < PRESUPUESTO_SEGUNDOS:
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    tracemalloc.start()
+    try:
+        funcion()
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return min(tiempos), pico / 2**20
+
+
+def ejecutar(tamanos=TAMANOS, primitivas=None, repeticiones=3, semilla=0):
+    """
+    Mide cada primitiva en cada tamaño de catálogo.
+
+    Returns:
+        dict: Entorno de la ejecución y una lista de resultados con primitiva,
+        filas, segundos y pico_mb (o `omitida` si supera sus filas máximas).
+    """
+    resultados = []
+    for filas in tamanos:
+        df = generar_catalogo(filas, semilla)
+        for nombre in primitivas or PRIMITIVAS:
+            preparar, max_filas = PRIMITIVAS[nombre]
+            if max_filas is not None and filas > max_filas:
+                resultados.append({'primitiva': nombre, 'filas': filas, 'omitida': True})
+                continue
+            segundos, pico = medir(preparar(df), repeticiones)
+            resultados.append({'primitiva': nombre, 'filas': filas,
+                               'segundos': segundos, 'pico_mb': pico})
+            print(f'{nombre:>16} {filas:>10,} filas: {segundos:9.4f} s {pico:9.1f} MB')
+        del df
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'entorno': {'python': platform.python_version(), 'numpy': np.__version__,
+                    'pandas': pd.__version__, 'sklearn': sklearn.__version__,
+                    'plataforma': platform.platform(), 'cpus': os.cpu_count()},
+        'repeticiones': repeticiones,
+        'resultados': resultados,
+    }
+
+
+def comparar(actual, base, umbral=UMBRAL):
+    """
+    Compara dos ejecuciones de `ejecutar` medida a medida.
+
+    Returns:
+        list: Una fila por (primitiva, filas, medida) que empeora más que
+        `umbral` (fracción) respecto a la línea base.
+    """
+    previos = {(r['primitiva'], r['filas']): r for r in base['resultados'] if not r.get('omitida')}
+    regresiones = []
+    for r in actual['resultados']:
+        previo = previos.get((r['primitiva'], r['filas']))
+        if previo is None or r.get('omitida'):
+            continue
+        for medida in ('segundos', 'pico_mb'):
+            if previo[medida] > 0 and r[medida] > previo[medida] * (1 + umbral):
+                regresiones.append({'primitiva': r['primitiva'], 'filas': r['filas'], 'medida': medida,
+                                    'base': previo[medida], 'actual': r[medida],
+                                    'cambio': r[medida] / previo[medida] - 1})
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks de las primitivas de preprocesamiento de utils/funciones.py.')
+    parser.add_argument('--tamanos', type=int, nargs='+', default=list(TAMANOS))
+    parser.add_argument('--primitivas', nargs='+', choices=list(PRIMITIVAS), default=None)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--salida', default=RUTA_RESULTADOS)
+    parser.add_argument('--base', default=None, help='JSON de una ejecución anterior con la que comparar')
+    parser.add_argument('--umbral', type=float, default=UMBRAL,
+                        help='Empeoramiento relativo que cuenta como regresión (0.2 = 20%%)')
+    parser.add_argument('--guardar-base', action='store_true',
+                        help=f'Guarda también los resultados como línea base en {RUTA_BASE}')
+    args = parser.parse_args(argv)
+
+    actual = ejecutar(args.tamanos, args.primitivas, args.repeticiones)
+    for ruta in [args.salida] + ([RUTA_BASE] if args.guardar_base else []):
+        os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+        with open(ruta, 'w', encoding='utf-8') as f:
+            json.dump(actual, f, indent=1)
+    print(f'Resultados en {args.salida}')
+
+    if args.base:
+        with open(args.base, encoding='utf-8') as f:
+            regresiones = comparar(actual, json.load(f), args.umbral)
+        for r in regresiones:
+            print(f'REGRESIÓN {r["primitiva"]} ({r["filas"]:,} filas) {r["medida"]}: '
+                  f'{r["base"]:.4g} -> {r["actual"]:.4g} ({r["cambio"]:+.0%})')
+        if regresiones:
+            sys.exit(1)
+        print(f'Sin regresiones por encima del {args.umbral:.0%}')
+
+
+if __name__ == '__main__':
+    main()
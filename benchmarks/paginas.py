@@ -0,0 +1,346 @@
+'''
+Benchmarks de las páginas de la app de Streamlit y de sus figuras.
+
+Para cada tamaño de catálogo monta un directorio de trabajo con la app (enlaces
+a app.py, pages/, utils/, img/ y output/) y un catálogo sintético con las
+columnas de data/hipparcos_final.parquet, y mide:
+
+- cada constructor de figuras de utils/func_streamlit.py sin cachés: tiempo de
+  construcción (el mejor de varias repeticiones), número de figuras, bytes del
+  JSON de Plotly y coste de guardarlo y leerlo de la caché en disco;
+- cada página ejecutada sin navegador con `AppTest` en tres escenarios: `fria`
+  (sin cachés en memoria ni en disco, como tras un despliegue), `disco` (solo la
+  caché en disco, como tras reiniciar el proceso) y `caliente` (segunda ejecución
+  en el mismo proceso). De cada ejecución guarda el tiempo, los bytes de las
+  gráficas que se enviarían al navegador y, por gráfica, las peticiones y los
+  aciertos y fallos de la caché de Streamlit y de la caché en disco.
+
+Las animaciones lottie se sustituyen por una vacía para no medir la red (salvo
+con --red). Escribe los resultados en JSON y, si se pasa una línea base,
+compara con ella y termina con código 1 cuando alguna medida empeora más que el
+umbral.
+
+Uso (desde la raíz del proyecto):
+
+    python -m benchmarks.paginas --tamanos 10000 100000 --guardar-base
+    python -m benchmarks.paginas --tamanos 10000 100000 --base benchmarks/base_paginas.json
+'''
+
+import argparse
+import collections
+import contextlib
+import glob
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import plotly
+import plotly.io as pio
+import requests
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.funciones import PRESUPUESTO_SEGUNDOS, UMBRAL
+from utils import cache_figuras, func_streamlit
+from utils.catalogo import DIRECTORIO_CACHE, RUTA_CATALOGO, RUTA_VARIABLES, Catalogo
+
+
+TAMANOS = (10_000, 100_000, 1_000_000)
+RUTA_RESULTADOS = 'benchmarks/resultados_paginas.json'
+RUTA_BASE = 'benchmarks/base_paginas.json'
+# Estrellas reales que se remuestrean para formar los catálogos sintéticos
+RUTA_MUESTRA = 'data/selected_data.parquet'
+# Lo que necesita la app en su directorio de trabajo, además de data/
+ENLACES = ('app.py', 'pages', 'utils', 'img', 'output')
+ESCENARIOS = ('fria', 'disco', 'caliente')
+# Segundos máximos de una ejecución de página
+TIMEOUT = 600
+ANIMACION_VACIA = {'v': '5.5.7', 'fr': 30, 'ip': 0, 'op': 1, 'w': 10, 'h': 10, 'layers': []}
+
+# Medidas comparadas con la línea base y campos que identifican cada resultado
+MEDIDAS = ('segundos', 'bytes')
+CLAVES = {'constructores': ('constructor', 'filas'), 'paginas': ('pagina', 'filas', 'escenario')}
+
+
+def paginas_app():
+    """Scripts de la app: la portada y los de pages/, en el orden del menú."""
+    return ['app.py'] + sorted(glob.glob('pages/*.py'))
+
+
+def generar_catalogo(filas, semilla=0):
+    """
+    Catálogo sintético de `filas` estrellas con las columnas de
+    data/hipparcos_final.parquet. La fotometría, distancias y tipos espectrales
+    se remuestrean de data/selected_data.parquet; las posiciones son uniformes
+    sobre la esfera y los movimientos propios normales, como en hipparcos.csv.
+
+    Returns:
+        tuple: (catálogo, catálogo de variables), ambos con `filas` filas.
+    """
+    rng = np.random.default_rng(semilla)
+    muestra = pd.read_parquet(RUTA_MUESTRA)
+    df = muestra.iloc[rng.integers(0, len(muestra), filas)].reset_index(drop=True)
+    tipo = df['Tipo_espectral'].astype(object)
+    df['Tipo_espectral'] = tipo
+    df['pmRA'] = rng.normal(-5, 160, filas)
+    df['pmDE'] = rng.normal(-45, 130, filas)
+    df['RAdeg'] = rng.uniform(0, 360, filas)
+    df['DEdeg'] = np.degrees(np.arcsin(rng.uniform(-1, 1, filas)))
+    df['Plx'] = (1000 / df['d']).astype('float32')
+    df['HIP'] = np.arange(1, filas + 1)
+    subclase = rng.integers(0, 10, filas).astype(str)
+    df['Clase_espectral'] = tipo.where(tipo.isna(), tipo.astype(str) + subclase)
+
+    variables = pd.read_parquet(RUTA_VARIABLES)
+    variables = variables.iloc[rng.integers(0, len(variables), filas)].reset_index(drop=True)
+    return df, variables
+
+
+def preparar_directorio(directorio, filas, semilla=0):
+    """Monta en `directorio` la app con un catálogo sintético de `filas` estrellas."""
+    for nombre in ENLACES:
+        os.symlink(os.path.abspath(nombre), os.path.join(directorio, nombre))
+    catalogo, variables = generar_catalogo(filas, semilla)
+    os.makedirs(os.path.join(directorio, 'data'))
+    catalogo.to_parquet(os.path.join(directorio, RUTA_CATALOGO), index=False)
+    variables.to_parquet(os.path.join(directorio, RUTA_VARIABLES), index=False)
+
+
+def medir_constructores(catalogos, repeticiones=3):
+    """
+    Mide cada constructor registrado en `cache_figuras` llamando directamente a
+    la función con el catálogo que le corresponde de `catalogos` (ruta ->
+    handle), sin la caché de Streamlit ni la caché en disco.
+
+    Returns:
+        list: Por constructor, segundos de construcción, número de figuras,
+        bytes del JSON y segundos de serializarlo y deserializarlo.
+    """
+    resultados = []
+    for envoltorio, variantes, ruta in cache_figuras.constructores:
+        construir = envoltorio.__wrapped__
+        catalogo = catalogos[ruta]
+        kwargs = variantes[0]
+        tiempos = []
+        while len(tiempos) < repeticiones and sum(tiempos) < PRESUPUESTO_SEGUNDOS:
+            inicio = time.perf_counter()
+            resultado = construir(catalogo, **kwargs)
+            tiempos.append(time.perf_counter() - inicio)
+
+        figuras = resultado if isinstance(resultado, tuple) else (resultado,)
+        inicio = time.perf_counter()
+        texto = cache_figuras.serializar(resultado)
+        serializar_s = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        cache_figuras.deserializar(texto)
+        deserializar_s = time.perf_counter() - inicio
+
+        resultados.append({
+            'constructor': envoltorio.__name__, 'filas': len(catalogo),
+            'segundos': min(tiempos), 'figuras': len(figuras),
+            'bytes': sum(len(pio.to_json(fig, validate=False).encode()) for fig in figuras),
+            'serializar_s': serializar_s, 'deserializar_s': deserializar_s,
+        })
+        r = resultados[-1]
+        print(f'{r["constructor"]:>24} {r["filas"]:>10,} filas: {r["segundos"]:8.3f} s '
+              f'{r["bytes"] / 2**20:8.2f} MB')
+    return resultados
+
+
+@contextlib.contextmanager
+def contar_peticiones(peticiones):
+    """
+    Cuenta en `peticiones` las llamadas de las páginas a cada constructor de
+    figuras. Las páginas importan los constructores de `func_streamlit` en cada
+    ejecución, así que basta con sustituirlos en el módulo.
+    """
+    originales = {envoltorio.__name__: getattr(func_streamlit, envoltorio.__name__)
+                  for envoltorio, _, _ in cache_figuras.constructores}
+
+    def contador(nombre, funcion):
+        def envoltorio(*args, **kwargs):
+            peticiones[nombre] += 1
+            return funcion(*args, **kwargs)
+        return envoltorio
+
+    for nombre, funcion in originales.items():
+        setattr(func_streamlit, nombre, contador(nombre, funcion))
+    try:
+        yield
+    finally:
+        for nombre, funcion in originales.items():
+            setattr(func_streamlit, nombre, funcion)
+
+
+@contextlib.contextmanager
+def sin_red():
+    # Las páginas solo usan la red para descargar animaciones lottie
+    respuesta = type('Respuesta', (), {'status_code': 200, 'json': lambda self: ANIMACION_VACIA})()
+    original = requests.get
+    requests.get = lambda *args, **kwargs: respuesta
+    try:
+        yield
+    finally:
+        requests.get = original
+
+
+def ejecutar_pagina(pagina, timeout=TIMEOUT):
+    """
+    Ejecuta `pagina` una vez con `AppTest` en el directorio actual.
+
+    Returns:
+        dict: Segundos, excepciones, número y bytes de las gráficas enviadas y,
+        por cada gráfica pedida, peticiones y aciertos y fallos de las cachés.
+    """
+    peticiones = collections.Counter()
+    antes = {nombre: collections.Counter(cuenta) for nombre, cuenta in cache_figuras.estadisticas.items()}
+    with contar_peticiones(peticiones):
+        inicio = time.perf_counter()
+        at = AppTest.from_file(os.path.abspath(pagina), default_timeout=timeout).run()
+        segundos = time.perf_counter() - inicio
+
+    graficas = {}
+    for nombre, n in peticiones.items():
+        cuenta = cache_figuras.estadisticas[nombre].copy()
+        cuenta.subtract(antes.get(nombre, {}))
+        # La caché de Streamlit envuelve a la de disco: lo que no resuelve llega
+        # al disco, salvo lo que no es de ninguna variante, que se calcula sin él
+        graficas[nombre] = {'peticiones': n,
+                            'aciertos_streamlit': n - cuenta['aciertos'] - cuenta['fallos'] - cuenta['sin_disco'],
+                            'aciertos_disco': cuenta['aciertos'], 'fallos_disco': cuenta['fallos'],
+                            'sin_disco': cuenta['sin_disco']}
+    enviadas = at.get('plotly_chart')
+    return {'segundos': segundos, 'excepciones': [e.message for e in at.exception],
+            'graficas_enviadas': len(enviadas), 'bytes': sum(e.proto.ByteSize() for e in enviadas),
+            'graficas': graficas}
+
+
+def medir_paginas(paginas, filas, timeout=TIMEOUT):
+    """Ejecuta cada página en los escenarios `ESCENARIOS`, vaciando las cachés que corresponda."""
+    resultados = []
+    for pagina in paginas:
+        for escenario in ESCENARIOS:
+            if escenario in ('fria', 'disco'):
+                st.cache_data.clear()
+                st.cache_resource.clear()
+            if escenario == 'fria':
+                shutil.rmtree(DIRECTORIO_CACHE, ignore_errors=True)
+            r = {'pagina': pagina, 'filas': filas, 'escenario': escenario,
+                 **ejecutar_pagina(pagina, timeout)}
+            resultados.append(r)
+            aciertos = sum(g['aciertos_streamlit'] + g['aciertos_disco'] for g in r['graficas'].values())
+            fallos = sum(g['fallos_disco'] + g['sin_disco'] for g in r['graficas'].values())
+            print(f'{pagina:>40} {filas:>10,} filas {escenario:>8}: {r["segundos"]:8.3f} s '
+                  f'{r["bytes"] / 2**20:8.2f} MB, {aciertos} aciertos, {fallos} fallos'
+                  + (f', {len(r["excepciones"])} excepciones' if r['excepciones'] else ''))
+    return resultados
+
+
+def ejecutar(tamanos=TAMANOS, paginas=None, repeticiones=3, timeout=TIMEOUT, red=False, semilla=0):
+    """
+    Mide los constructores de figuras y las páginas en cada tamaño de catálogo.
+    Con `paginas` igual a una lista vacía solo se miden los constructores.
+
+    Returns:
+        dict: Entorno de la ejecución y las listas de resultados
+        `constructores` y `paginas`.
+    """
+    paginas = paginas_app() if paginas is None else paginas
+    raiz = os.getcwd()
+    constructores, ejecuciones = [], []
+    for filas in tamanos:
+        directorio = tempfile.mkdtemp(prefix='benchmark_paginas_')
+        try:
+            preparar_directorio(directorio, filas, semilla)
+            os.chdir(directorio)
+            catalogos = {ruta: Catalogo(ruta) for ruta in (RUTA_CATALOGO, RUTA_VARIABLES)}
+            constructores += medir_constructores(catalogos, repeticiones)
+            with contextlib.nullcontext() if red else sin_red():
+                ejecuciones += medir_paginas(paginas, filas, timeout)
+        finally:
+            os.chdir(raiz)
+            shutil.rmtree(directorio, ignore_errors=True)
+            st.cache_data.clear()
+            st.cache_resource.clear()
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'entorno': {'python': platform.python_version(), 'numpy': np.__version__,
+                    'pandas': pd.__version__, 'streamlit': st.__version__,
+                    'plotly': plotly.__version__, 'plataforma': platform.platform(),
+                    'cpus': os.cpu_count()},
+        'repeticiones': repeticiones,
+        'red': red,
+        'constructores': constructores,
+        'paginas': ejecuciones,
+    }
+
+
+def comparar(actual, base, umbral=UMBRAL):
+    """
+    Compara dos ejecuciones de `ejecutar` medida a medida.
+
+    Returns:
+        list: Una fila por (resultado, medida) que empeora más que `umbral`
+        (fracción) respecto a la línea base.
+    """
+    regresiones = []
+    for seccion, campos in CLAVES.items():
+        previos = {tuple(r[c] for c in campos): r for r in base.get(seccion, [])}
+        for r in actual[seccion]:
+            clave = tuple(r[c] for c in campos)
+            previo = previos.get(clave)
+            if previo is None:
+                continue
+            for medida in MEDIDAS:
+                if previo[medida] > 0 and r[medida] > previo[medida] * (1 + umbral):
+                    regresiones.append({'resultado': ' '.join(map(str, clave)), 'medida': medida,
+                                        'base': previo[medida], 'actual': r[medida],
+                                        'cambio': r[medida] / previo[medida] - 1})
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks de las páginas de la app y de los constructores de figuras.')
+    parser.add_argument('--tamanos', type=int, nargs='+', default=list(TAMANOS))
+    parser.add_argument('--paginas', nargs='*', default=None,
+                        help='Scripts a ejecutar (por defecto todos; sin valores, ninguno)')
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=TIMEOUT,
+                        help='Segundos máximos de cada ejecución de página')
+    parser.add_argument('--red', action='store_true',
+                        help='Descarga las animaciones lottie en lugar de usar una vacía')
+    parser.add_argument('--salida', default=RUTA_RESULTADOS)
+    parser.add_argument('--base', default=None, help='JSON de una ejecución anterior con la que comparar')
+    parser.add_argument('--umbral', type=float, default=UMBRAL,
+                        help='Empeoramiento relativo que cuenta como regresión (0.2 = 20%%)')
+    parser.add_argument('--guardar-base', action='store_true',
+                        help=f'Guarda también los resultados como línea base en {RUTA_BASE}')
+    args = parser.parse_args(argv)
+
+    actual = ejecutar(args.tamanos, args.paginas, args.repeticiones, args.timeout, args.red)
+    for ruta in [args.salida] + ([RUTA_BASE] if args.guardar_base else []):
+        os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+        with open(ruta, 'w', encoding='utf-8') as f:
+            json.dump(actual, f, indent=1)
+    print(f'Resultados en {args.salida}')
+
+    if args.base:
+        with open(args.base, encoding='utf-8') as f:
+            regresiones = comparar(actual, json.load(f), args.umbral)
+        for r in regresiones:
+            print(f'REGRESIÓN {r["resultado"]} {r["medida"]}: '
+                  f'{r["base"]:.4g} -> {r["actual"]:.4g} ({r["cambio"]:+.0%})')
+        if regresiones:
+            sys.exit(1)
+        print(f'Sin regresiones por encima del {args.umbral:.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,11 +10,23 @@ import plotly.figure_factory as ff
 import streamlit as st
 from streamlit_lottie import st_lottie
 from sys import path
-import joblib
 import os
+import time
+from utils import instrumentacion
+from utils.clasificacion import CLASES, MODELOS, nombre_columna
+from utils.derivadas import COLUMNAS_MODELO, fila_derivadas
+from utils.instrumentacion import instrumentar
+from utils.registro import RegistroModelos
+from utils import servicio
+from utils.servicio import DIRECTORIO_SERVICIO, ModeloNumpy
 path.append(os.path.abspath(os.path.join('..')))
 pio.templates.default = "plotly_dark"
 
+# Valores iniciales de los sliders
+VMAG_INICIAL = 8.312439
+B_V_INICIAL = 0.69
+D_INICIAL = 0.740
+
 
 # Configuración de la página
 st.set_page_config(page_title="Hipparcos",
@@ -23,18 +35,39 @@ st.set_option("deprecation.showPyplotGlobalUse", False)
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
 
+def _a_servicio(modelo):
+    # Los pickles se pasan al formato de servicio al cargarlos, para predecir
+    # sobre la fila de NumPy sin la validación de scikit-learn; los que no se
+    # pueden exportar se quedan como están
+    try:
+        return servicio.convertir(modelo)
+    except TypeError:
+        return modelo
+
+
 @st.cache_resource()
-def load_model(model_name):
-    model = joblib.load(f'{model_name}')
-    return model
+def load_registro():
+    # Registro compartido por todas las sesiones: cada modelo se carga la
+    # primera vez que se elige, usando su versión exportada si existe
+    registro = RegistroModelos(convertir=_a_servicio)
+    for nombre, ruta in MODELOS.items():
+        registro.registrar(nombre, os.path.join(DIRECTORIO_SERVICIO, nombre_columna(nombre)), ruta)
+    # Aciertos: el modelo ya estaba cargado; fallos: se carga en esa llamada
+    registro.obtener = instrumentar(registro.obtener, nombre='RegistroModelos.obtener',
+                                    filas=None, cache=registro.cargas)
+    return registro
 
 
-# Carga los cinco modelos
-model_LR = load_model('output/Tipo_GradientBoost.pkl')
-model_KNN = load_model('output/Tipo_KNN.pkl')
-model_GB = load_model('output/Tipo_GradientBoost.pkl')
-model_SVC = load_model('output/Tipo_SVC.pkl')
-model_XGB = load_model('output/Tipo_XGBoost.pkl')
+registro = load_registro()
+
+
+@instrumentar(filas=1)
+def predecir(model, fila):
+    # Los modelos en formato de servicio predicen directamente sobre la fila de
+    # NumPy; solo los que no se pueden exportar necesitan sus nombres de columnas
+    if isinstance(model, ModeloNumpy):
+        return model.predict(fila)[0]
+    return model.predict(pd.DataFrame(fila, columns=COLUMNAS_MODELO))[0]
 
 
 def main():
@@ -78,98 +111,50 @@ def main():
         st.markdown(
             'Utiliza el slider para modificar los valores de `Vmag`, `B-V` y `d` el resto se ajustarán automáticamente con base en estos tres parámetros:')
 
-        # Inicializamos un dataframe con valores por defecto
-        X_new = pd.DataFrame([[8.312439, 9.11, 8.32, 0.69, 0.749, 5.0, 8.41, 0.740, 248, 0.0, 0.0]],
-                             columns=['Vmag', 'BTmag', 'VTmag', 'B-V', 'V-I', 'Hpmag', '(V-I)red', 'd', 'T', 'M_v', 'M_Hip'])
-
-        # Crear sliders para cada columna del DataFrame
+        # Crear sliders para Vmag, B-V y d
         Vmag = st.slider('Vmag', min_value=-1.5,
-                         max_value=14.0, value=float(X_new['Vmag'][0]))
+                         max_value=14.0, value=VMAG_INICIAL)
         B_V = st.slider('B-V', min_value=-0.4,
-                        max_value=5.46, value=float(X_new['B-V'][0]))
+                        max_value=5.46, value=B_V_INICIAL)
 
         d = st.slider('d [parsec]', min_value=1.2, max_value=990.0,
-                      value=float(X_new['d'][0]))
-
-        # Calcular valores predeterminados para T, M_v y M_Hip
-        BTmag_default = 0.88114 * Vmag + 1.78857
-        VTmag_default = 0.8588 * Vmag + 1.18088
-        V_I_default = 1.0595 * B_V + 0.01201
-        V_I_red_default = 1.0024 * V_I_default + 0.01201
-
-        T_default = 8540 / (B_V + 0.865)
-        M_v_default = (Vmag - 5 *
-                       np.log10(d)+5).astype(np.float32)
-        Hpmag_default = 1.00564 * Vmag + 0.05840
-
-        M_Hip_default = (Hpmag_default - 5 *
-                         np.log10(d)+5).astype(np.float32)
-
-        # # Establecer valores predeterminados para T, M_v y M_Hip y deshabilitar los sliders correspondientes
-        # BTmag = st.slider('BTmag', min_value=-0.5,
-        #                   max_value=15.0, value=float(BTmag_default))
-        # VTmag = st.slider('VTmag', min_value=-0.6,
-        #                   max_value=12.0, value=float(VTmag_default))
-        # V_I = st.slider('V-I', min_value=-0.49,
-        #                 max_value=9.03, value=float(V_I_default))
-        # Hpmag = st.slider('Hpmag', min_value=-1.1,
-        #                   max_value=14.6, value=float(Hpmag_default))
-        # V_I_red = st.slider('(V-I)red', min_value=-0.52,
-        #                     max_value=9.29, value=float(V_I_red_default))
-        # T = st.slider('T [K]', min_value=1300.0, max_value=18366.0,
-        #               value=float(T_default), key="T")
-        # M_v = st.slider('M_v', min_value=-9.0,
-        #                 max_value=16.0, value=float(M_v_default))
-        # M_Hip = st.slider('M_Hip', min_value=-10.0,
-        #                   max_value=10.0, value=float(M_Hip_default))
-
-        BTmag = BTmag_default
-        VTmag = VTmag_default
-        V_I = V_I_default
-        Hpmag = Hpmag_default
-        V_I_red = V_I_red_default
-        T = T_default
-        M_v = M_v_default
-        M_Hip = M_Hip_default
-
-        # Actualizar DataFrame con los nuevos valores
-        X_new = pd.DataFrame([[Vmag, BTmag, VTmag, B_V, V_I, Hpmag, V_I_red, d, T, M_v, M_Hip]],
-                             columns=['Vmag', 'BTmag', 'VTmag', 'B-V', 'V-I', 'Hpmag', '(V-I)red', 'd', 'T', 'M_v', 'M_Hip'])
-
-        # Actualizar DataFrame con los nuevos valores
-        X_new = pd.DataFrame([[Vmag, BTmag, VTmag, B_V, V_I, Hpmag, V_I_red, d, T, M_v, M_Hip]],
-                             columns=['Vmag', 'BTmag', 'VTmag', 'B-V', 'V-I', 'Hpmag', '(V-I)red', 'd', 'T', 'M_v', 'M_Hip'])
-
-        # Mostrar DataFrame actualizado
-        st.write('DataFrame actualizado:')
-        st.write(X_new)
-
-        # Widget para seleccionar el modelo
-        model_selector = st.selectbox('Selecciona un modelo', (
-            'Logistic Regression', 'SVC', 'KNN', 'Gradient Boost', 'XGBoost'))
+                      value=D_INICIAL)
+
+        # Calcular el resto de columnas (colores aproximados, T, M_v y M_Hip) a partir de Vmag, B-V y d
+        # sobre una fila reservada una vez por sesión
+        fila = fila_derivadas(Vmag, B_V, d, st.session_state.setdefault(
+            'fila_ml', np.empty((1, len(COLUMNAS_MODELO)), dtype=np.float32)))
+
+        # Mostrar la fila actualizada solo si se pide
+        if st.checkbox('Mostrar los valores calculados'):
+            st.write(pd.DataFrame(fila, columns=COLUMNAS_MODELO))
+
+        # Widget para seleccionar el modelo (solo los que hay en output/)
+        model_selector = st.selectbox('Selecciona un modelo', [
+            m for m in ('Logistic Regression', 'SVC', 'KNN', 'Gradient Boost', 'XGBoost') if m in registro])
         st.write('Modelo seleccionado:', model_selector)
 
-        # Seleccionar el modelo adecuado
-        if model_selector == 'Logistic Regression':
-            model = model_LR
-        elif model_selector == 'KNN':
-            model = model_KNN
-        elif model_selector == 'Gradient Boost':
-            model = model_GB
-        elif model_selector == 'SVC':
-            model = model_SVC
-        else:
-            model = model_XGB
+        # En modo en vivo se predice con cada cambio de los sliders, sin el botón
+        en_vivo = st.checkbox('Predicción en vivo')
 
         # Botón para hacer la predicción
-        if st.button('RUN'):
+        if en_vivo or st.button('RUN'):
+            # El modelo se carga aquí la primera vez que se usa
+            model = registro.obtener(model_selector)
             # Hacer predicciones en los nuevos datos utilizando el modelo seleccionado
-            y_pred = model.predict(X_new)
+            inicio = time.perf_counter()
+            y_pred = predecir(model, fila)
+            latencia = time.perf_counter() - inicio
             # Obtener la letra correspondiente
-            letters = ['A', 'B', 'F', 'G', 'K', 'M', 'O']
-            letter = letters[y_pred[0]]
+            letter = CLASES[int(y_pred)]
             # Mostrar la predicción
             st.write('La estrella es de tipo:', letter)
+            st.caption(f'Predicción en {latencia * 1000:.2f} ms')
+
+        with st.expander('Modelos cargados'):
+            st.dataframe(pd.DataFrame(registro.resumen()), hide_index=True)
+
+    instrumentacion.panel()
 
 
 if __name__ == '__main__':
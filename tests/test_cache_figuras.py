@@ -0,0 +1,87 @@
+import os
+import pandas as pd
+import plotly.graph_objs as go
+import pytest
+
+from utils import cache_figuras
+from utils.catalogo import Catalogo
+
+
+def figura(catalogo, range_x=(0, 1), titulo='Vmag'):
+    llamadas.append((range_x, titulo))
+    return go.Figure(go.Bar(x=list(range_x), y=[1, 2]), layout=dict(title=titulo))
+
+
+llamadas = []
+
+
+@pytest.fixture
+def catalogo(tmp_path, monkeypatch):
+    # La caché y el catálogo usan rutas relativas al directorio de trabajo
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(cache_figuras, 'constructores', [])
+    llamadas.clear()
+    os.makedirs('data')
+    pd.DataFrame({'Vmag': [7.0, 8.0]}).to_parquet('data/catalogo.parquet')
+    return Catalogo('data/catalogo.parquet')
+
+
+def _decorar():
+    # Cada decoración es como el arranque de un proceso nuevo
+    cache_figuras.estadisticas.clear()
+    cache_figuras._huellas.clear()
+    return cache_figuras.cache_en_disco(figura, ruta='data/catalogo.parquet',
+                                        variantes=[{}, dict(range_x=(0, 2)), dict(titulo='HR')])
+
+
+def test_misma_clave_por_posicion_nombre_y_defecto(catalogo):
+    construir = _decorar()
+    construir(catalogo, [0, 2])
+    construir(catalogo, range_x=(0, 2))
+    construir(catalogo, (0, 2), titulo='Vmag')
+    construir(catalogo)
+    construir(catalogo, range_x=(0, 1), titulo='Vmag')
+    assert llamadas == [([0, 2], 'Vmag'), ((0, 1), 'Vmag')]
+    assert cache_figuras.estadisticas['figura'] == {'fallos': 2, 'aciertos': 3}
+
+
+def test_acierto_tras_reiniciar(catalogo):
+    original = _decorar()(catalogo, titulo='HR')
+    figura_disco = _decorar()(catalogo, titulo='HR')
+    assert len(llamadas) == 1
+    assert cache_figuras.estadisticas['figura'] == {'aciertos': 1}
+    assert isinstance(figura_disco, go.Figure)
+    assert figura_disco.to_plotly_json() == original.to_plotly_json()
+
+    # Un catálogo distinto es otra clave
+    pd.DataFrame({'Vmag': [7.0, 8.0, 9.0]}).to_parquet('data/catalogo.parquet')
+    _decorar()(catalogo, titulo='HR')
+    assert len(llamadas) == 2
+
+
+def test_parametros_libres_no_van_a_disco(catalogo):
+    construir = _decorar()
+    construir(catalogo, (0.1, 0.7))
+    construir(catalogo, (0.1, 0.7))
+    construir(catalogo, titulo='HR')
+    # Solo la variante registrada se escribe en disco; la otra se calcula cada
+    # vez (en la app la guarda en memoria la caché de Streamlit)
+    assert len(llamadas) == 3
+    assert len(os.listdir(cache_figuras.DIRECTORIO_FIGURAS)) == 1
+    assert cache_figuras.estadisticas['figura'] == {'sin_disco': 2, 'fallos': 1}
+
+
+def test_desalojo_lru(tmp_path):
+    directorio = str(tmp_path)
+    for i, clave in enumerate(['a', 'b', 'c']):
+        cache_figuras.escribir_json(clave, 'x' * 100, directorio, max_bytes=10**6)
+        ruta = os.path.join(directorio, clave + '.json')
+        os.utime(ruta, ns=(i * 10**9, i * 10**9))
+    # Leer 'a' la convierte en la usada más recientemente
+    assert cache_figuras.leer_json('a', directorio) == 'x' * 100
+
+    cache_figuras.escribir_json('d', 'x' * 100, directorio, max_bytes=300)
+    assert sorted(os.listdir(directorio)) == ['a.json', 'c.json', 'd.json']
+    cache_figuras.desalojar(directorio, max_bytes=100)
+    assert sorted(os.listdir(directorio)) == ['d.json']
+    assert cache_figuras.leer_json('b', directorio) is None
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from utils.catalogo import Catalogo
+
+
+def test_reescribir_el_parquet_actualiza_tabla_e_indices(tmp_path):
+    ruta = tmp_path / 'catalogo.parquet'
+    pd.DataFrame({'Vmag': [7.0, 8.0, 9.0]}).to_parquet(ruta)
+    catalogo = Catalogo(str(ruta), str(tmp_path / 'cache'))
+    assert len(catalogo) == 3
+    assert len(catalogo.indices.rango('Vmag')) == 3
+    version = catalogo.version
+
+    pd.DataFrame({'Vmag': [7.0, 8.0, 9.0, 10.0, 11.0]}).to_parquet(ruta)
+    assert catalogo.version != version
+    assert len(catalogo) == 5
+    np.testing.assert_array_equal(catalogo.indices.rango('Vmag', minimo=9.5), [3, 4])
+    np.testing.assert_array_equal(catalogo.columnas('Vmag')['Vmag'], [7, 8, 9, 10, 11])
+
+
+def test_parquets_con_el_mismo_nombre_no_comparten_cache(tmp_path):
+    cache = str(tmp_path / 'cache')
+    catalogos = []
+    for directorio, valores in (('a', [1.0, 2.0]), ('b', [3.0, 4.0, 5.0])):
+        (tmp_path / directorio).mkdir()
+        ruta = tmp_path / directorio / 'hipparcos_final.parquet'
+        pd.DataFrame({'Vmag': valores}).to_parquet(ruta)
+        catalogos.append(Catalogo(str(ruta), cache))
+
+    assert catalogos[0].ruta_arrow != catalogos[1].ruta_arrow
+    np.testing.assert_array_equal(catalogos[0].columnas('Vmag')['Vmag'], [1, 2])
+    np.testing.assert_array_equal(catalogos[1].columnas('Vmag')['Vmag'], [3, 4, 5])
+
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from utils.cielo import IndiceCielo, vectores_unitarios
+
+
+@pytest.fixture(scope='module')
+def estrellas():
+    # Uniformes en la esfera, con algunas sin posición
+    rng = np.random.default_rng(0)
+    n = 20000
+    ra = rng.uniform(0, 360, n)
+    dec = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+    ra[rng.random(n) < 0.01] = np.nan
+    return ra, dec, IndiceCielo(ra, dec)
+
+
+def _caja_fuerza_bruta(ra, dec, range_ra, range_dec):
+    (ra0, ra1), (dec0, dec1) = sorted(range_ra), sorted(range_dec)
+    dentro_ra = np.zeros(len(ra), dtype=bool)
+    # La ascensión recta está en [0, 360) y la caja empieza en [-360, 360)
+    for vuelta in (-360, 0, 360):
+        dentro_ra |= (ra + vuelta >= ra0) & (ra + vuelta <= ra1)
+    return np.flatnonzero(dentro_ra & (dec >= dec0) & (dec <= dec1))
+
+
+def test_caja_igual_que_fuerza_bruta(estrellas):
+    ra, dec, indice = estrellas
+    rng = np.random.default_rng(1)
+    cajas = [((-10, 10), (-30, 30)),  # cruza el 0 de ascensión recta
+             ((10, -10), (80, 90)),   # extremos en orden inverso, junto al polo
+             ((220, 140), (40, 70)),  # vista de la Osa Mayor
+             ((-180, 180), (-90, 90))]
+    for _ in range(300):
+        ra0 = rng.uniform(-360, 360)
+        dec0 = rng.uniform(-90, 90)
+        cajas.append(((ra0, ra0 + rng.uniform(0, 360) * rng.random() ** 2),
+                      (dec0, np.clip(dec0 + rng.uniform(-90, 90), -90, 90))))
+
+    for range_ra, range_dec in cajas:
+        np.testing.assert_array_equal(indice.caja(range_ra, range_dec),
+                                      _caja_fuerza_bruta(ra, dec, range_ra, range_dec),
+                                      err_msg=f'caja {range_ra} x {range_dec}')
+
+
+def test_cono_y_vecinos_iguales_que_fuerza_bruta(estrellas):
+    ra, dec, indice = estrellas
+    rng = np.random.default_rng(2)
+    con_posicion = np.flatnonzero(np.isfinite(ra))
+    vectores = vectores_unitarios(ra[con_posicion], dec[con_posicion])
+    for _ in range(50):
+        ra_c, dec_c, radio = rng.uniform(-90, 360), rng.uniform(-90, 90), rng.uniform(0, 30)
+        separacion = np.degrees(np.arccos(np.clip(vectores @ vectores_unitarios([ra_c], [dec_c])[0], -1, 1)))
+        # Las estrellas justo en el borde pueden caer a un lado u otro por redondeo
+        lejos_del_borde = np.abs(separacion - radio) > 1e-9
+        encontrados = np.isin(con_posicion, indice.cono(ra_c, dec_c, radio))
+        np.testing.assert_array_equal(encontrados[lejos_del_borde], (separacion <= radio)[lejos_del_borde])
+
+        filas, separaciones = indice.vecinos(ra_c, dec_c, k=10)
+        orden = np.argsort(separacion)[:10]
+        np.testing.assert_array_equal(filas, con_posicion[orden])
+        np.testing.assert_allclose(separaciones, separacion[orden], atol=1e-6)
+
+
+def test_vecinos_con_k_cero_o_indice_vacio(estrellas):
+    _, _, indice = estrellas
+    vacio = IndiceCielo([np.nan, np.nan], [10.0, 20.0])
+    assert len(vacio) == 0
+    for buscar in (lambda: indice.vecinos(10, 20, k=0), lambda: vacio.vecinos(10, 20, k=3)):
+        filas, separaciones = buscar()
+        assert filas.shape == separaciones.shape == (0,)
+        assert filas.dtype == indice.filas.dtype
+    with pytest.raises(ValueError):
+        indice.vecinos(10, 20, k=-1)
+
@@ -0,0 +1,130 @@
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+
+from utils.clasificacion import (CLASES, clasificar_bloque, clasificar_catalogo, clasificar_conjunto,
+                                 tabla_votos)
+from utils.derivadas import COLUMNAS_MODELO, matriz_derivadas
+
+
+@pytest.fixture(scope='module')
+def modelos():
+    # Dos modelos ajustados con un DataFrame, como los de output/, sobre las 7 clases
+    rng = np.random.default_rng(0)
+    n = 700
+    X = pd.DataFrame(matriz_derivadas(rng.uniform(2, 12, n), rng.uniform(-0.3, 2, n),
+                                      Plx=rng.uniform(1, 100, n)), columns=COLUMNAS_MODELO)
+    y = np.digitize(X['B-V'], np.quantile(X['B-V'], np.linspace(0, 1, 8)[1:-1]))
+    return {'Logistic Regression': make_pipeline(StandardScaler(), LogisticRegression()).fit(X, y),
+            'Arbol': DecisionTreeClassifier(max_depth=4, random_state=0).fit(X, y)}
+
+
+@pytest.fixture()
+def catalogo(tmp_path):
+    # 20 estrellas; a dos les falta la paralaje o es no positiva
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({'HIP': np.arange(1, 21), 'Vmag': rng.uniform(2, 12, 20),
+                       'B-V': rng.uniform(-0.3, 2, 20), 'Plx': rng.uniform(1, 100, 20),
+                       'RAhms': ['00 00 00'] * 20})
+    df.loc[[4, 13], 'Plx'] = [0.0, np.nan]
+    ruta = tmp_path / 'catalogo.parquet'
+    df.to_parquet(ruta, index=False)
+    return df, str(ruta)
+
+
+def test_clasificar_catalogo_por_bloques(modelos, catalogo, tmp_path):
+    df, entrada = catalogo
+    salida = str(tmp_path / 'salida' / 'clasificacion.parquet')
+
+    rendimiento = clasificar_catalogo(entrada, salida, modelos, tamano_bloque=7)
+
+    # Un grupo de filas por bloque de lectura: 7 + 7 + 6
+    fichero = pq.ParquetFile(salida)
+    assert [fichero.metadata.row_group(i).num_rows for i in range(fichero.num_row_groups)] == [7, 7, 6]
+
+    # Cortar en bloques no cambia nada respecto a clasificar el catálogo entero
+    resultado = pd.read_parquet(salida)
+    esperado = clasificar_bloque(modelos, df)
+    pd.testing.assert_frame_equal(resultado, esperado)
+    assert resultado['HIP'].tolist() == list(range(1, 21))
+    assert 'RAhms' not in resultado
+    assert set(resultado['logistic_regression'].dropna()) <= set(CLASES)
+
+    # Las estrellas sin distancia quedan sin etiqueta ni probabilidades
+    assert resultado.loc[[4, 13], ['logistic_regression', 'arbol']].isna().all().all()
+    assert resultado.loc[[4, 13], [f'arbol_p_{c}' for c in CLASES]].isna().all().all()
+    np.testing.assert_allclose(
+        resultado.drop(index=[4, 13])[[f'arbol_p_{c}' for c in CLASES]].sum(axis=1), 1, rtol=1e-6)
+
+    for nombre in modelos:
+        assert rendimiento[nombre]['filas'] == 20
+        assert rendimiento[nombre]['segundos'] > 0
+        assert rendimiento[nombre]['filas_por_segundo'] == pytest.approx(
+            20 / rendimiento[nombre]['segundos'])
+
+
+def test_clasificar_catalogo_desde_csv(modelos, catalogo, tmp_path):
+    df, entrada = catalogo
+    csv = str(tmp_path / 'catalogo.csv')
+    df.to_csv(csv, index=False)
+
+    clasificar_catalogo(csv, str(tmp_path / 'csv.parquet'), modelos, tamano_bloque=7)
+    clasificar_catalogo(entrada, str(tmp_path / 'parquet.parquet'), modelos, tamano_bloque=7)
+
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / 'csv.parquet'),
+                                  pd.read_parquet(tmp_path / 'parquet.parquet'))
+
+
+def _predicciones(etiquetas, probabilidades):
+    # Salida de clasificar_bloque con las etiquetas y las probabilidades dadas por modelo
+    columnas = {}
+    for modelo, valores in etiquetas.items():
+        columnas[modelo] = valores
+        for clase in CLASES:
+            columnas[f'{modelo}_p_{clase}'] = [p.get(clase, np.nan) for p in probabilidades[modelo]]
+    return pd.DataFrame(columnas)
+
+
+def test_tabla_votos():
+    # Estrella 0: unánime. Estrella 1: dos votos a G contra uno a K. Estrella 2:
+    # empate G/K sin el tercer modelo, K gana por probabilidad. Estrella 3: nadie predice
+    predicciones = _predicciones(
+        {'a': ['G', 'G', 'G', None], 'b': ['G', 'G', 'K', None], 'c': ['G', 'K', None, None]},
+        {'a': [{'G': 0.9}, {'G': 0.6}, {'G': 0.5}, {}],
+         'b': [{'G': 0.8}, {'G': 0.7}, {'K': 0.9}, {}],
+         'c': [{'G': 0.7}, {'K': 0.99}, {}, {}]})
+
+    votos = tabla_votos(predicciones, ['a', 'b', 'c'])
+
+    assert votos['voto'].tolist() == ['G', 'G', 'K', None]
+    assert votos['votos'].tolist() == [3, 2, 1, 0]
+    np.testing.assert_allclose(votos['acuerdo'], [1, 2 / 3, 0.5, np.nan], rtol=1e-6)
+    assert votos['unanime'].tolist() == [True, False, False, False]
+
+
+def test_clasificar_conjunto_en_varios_procesos(modelos, catalogo, tmp_path):
+    df, entrada = catalogo
+    rutas = {}
+    for nombre, modelo in modelos.items():
+        rutas[nombre] = str(tmp_path / f'{nombre}.pkl')
+        joblib.dump(modelo, rutas[nombre])
+    salida = str(tmp_path / 'conjunto.parquet')
+
+    rendimiento = clasificar_conjunto(entrada, salida, rutas, n_procesos=2, tamano_bloque=3)
+
+    # Siete bloques repartidos entre dos procesos, escritos en el orden de entrada
+    resultado = pd.read_parquet(salida)
+    predicciones = clasificar_bloque(modelos, df)
+    esperado = pd.concat([predicciones, tabla_votos(predicciones, list(modelos))], axis=1)
+    pd.testing.assert_frame_equal(resultado, esperado)
+    assert resultado['HIP'].tolist() == list(range(1, 21))
+
+    assert rendimiento['filas'] == 20
+    assert rendimiento['filas_por_segundo'] == pytest.approx(20 / rendimiento['segundos'])
+    assert set(rendimiento['segundos_por_modelo']) == set(modelos)
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.cubos import CuboHistograma, intervalos
+
+
+@pytest.fixture(scope='module')
+def columnas():
+    rng = np.random.default_rng(0)
+    n = 10000
+    # Magnitudes redondeadas: muchas caen justo en un borde de intervalo
+    vmag = rng.normal(8, 1.5, n).round(2).astype(np.float32)
+    vmag[rng.random(n) < 0.05] = np.nan
+    periodo = rng.lognormal(1, 1, n)
+    periodo[rng.random(n) < 0.7] = np.nan
+    tipo = pd.Categorical(rng.choice(['O', 'B', 'A', 'F', 'G', 'K', 'M', 'C', None], n),
+                          categories=['A', 'B', 'C', 'F', 'G', 'K', 'M', 'O'])
+    return {'Vmag': vmag, 'Period': periodo, 'Tipo_espectral': tipo}
+
+
+def _cubo(columnas):
+    return CuboHistograma(columnas, {
+        'Vmag': intervalos(columnas['Vmag'], anchura=0.5),
+        'Period': intervalos(columnas['Period'], n=20),
+        'Tipo_espectral': ['O', 'B', 'A', 'F', 'G', 'K', 'M'],
+    })
+
+
+def test_intervalos_cubren_los_valores(columnas):
+    vmag = columnas['Vmag'][np.isfinite(columnas['Vmag'])]
+    bordes = intervalos(vmag, anchura=0.5)
+    assert bordes[0] <= vmag.min() and bordes[-1] >= vmag.max()
+    np.testing.assert_allclose(np.diff(bordes), 0.5)
+    assert np.all(np.round(bordes / 0.5) == bordes / 0.5)
+
+    periodo = columnas['Period'][np.isfinite(columnas['Period'])]
+    bordes = intervalos(periodo, n=20)
+    assert len(bordes) == 21 and bordes[0] == periodo.min() and bordes[-1] == periodo.max()
+    # Un solo valor: un intervalo de anchura 1
+    np.testing.assert_array_equal(intervalos([3.0, 3.0, np.nan], n=1), [3.0, 4.0])
+
+
+def test_marginal_igual_que_histogram_y_value_counts(columnas):
+    cubo = _cubo(columnas)
+    assert cubo.recuentos.sum() == len(columnas['Vmag'])
+
+    for nombre in ('Vmag', 'Period'):
+        valores = columnas[nombre].astype(float)
+        bordes = cubo.ejes[nombre]
+        esperado, _ = np.histogram(valores[np.isfinite(valores)], bins=bordes)
+        np.testing.assert_array_equal(cubo.marginal(nombre), esperado)
+        # La celda de nulos tiene los NaN
+        assert cubo.marginal(nombre, nulos=True)[-1] == np.isnan(valores).sum()
+    # Con n intervalos el máximo es el último borde y cuenta en el último intervalo
+    assert np.nanmax(columnas['Period']) == cubo.ejes['Period'][-1]
+    assert cubo.marginal('Period')[-1] > 0
+
+    # Las categorías fuera del eje ('C') y los nulos van a la última celda
+    tipo = pd.Series(columnas['Tipo_espectral']).astype(object)
+    recuento = tipo.value_counts()
+    np.testing.assert_array_equal(cubo.marginal('Tipo_espectral'),
+                                  recuento.reindex(cubo.ejes['Tipo_espectral'], fill_value=0))
+    assert cubo.marginal('Tipo_espectral', nulos=True)[-1] == tipo.isna().sum() + recuento['C']
+
+
+def test_marginal_de_dos_ejes_igual_que_crosstab(columnas):
+    cubo = _cubo(columnas)
+    bordes = cubo.ejes['Vmag']
+    vmag = pd.cut(columnas['Vmag'], bordes, right=False, labels=False)
+    # pd.cut con right=False deja fuera el borde derecho del último intervalo
+    vmag[columnas['Vmag'] == bordes[-1]] = len(bordes) - 2
+    tabla = pd.crosstab(pd.Series(columnas['Tipo_espectral']).astype(object), vmag).reindex(
+        index=cubo.ejes['Tipo_espectral'], columns=range(len(bordes) - 1), fill_value=0)
+    np.testing.assert_array_equal(cubo.marginal('Tipo_espectral', 'Vmag'), tabla.to_numpy())
+    np.testing.assert_array_equal(cubo.marginal('Vmag', 'Tipo_espectral'), tabla.to_numpy().T)
+
+
+def test_bordes_explicitos_dejan_fuera_los_valores_del_rango():
+    valores = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 6.5, np.nan])
+    cubo = CuboHistograma({'x': valores}, {'x': np.array([2.0, 4.0, 6.0])})
+    # [2, 4) y [4, 6]; 1 y 6.5 quedan fuera, junto al NaN
+    np.testing.assert_array_equal(cubo.marginal('x'), np.histogram(valores, bins=[2, 4, 6])[0])
+    np.testing.assert_array_equal(cubo.marginal('x', nulos=True), [2, 3, 3])
@@ -0,0 +1,59 @@
+import numpy as np
+
+from utils.derivadas import (COLUMNAS_MODELO, clasificacion_espectral, columnas_derivadas,
+                             fila_derivadas, matriz_derivadas)
+
+
+# Tres estrellas calculadas a mano:
+# - Plx=100 mas -> d=10 pc, módulo 0: M_v = Vmag; B-V=0.135 -> T = 8540 / 1.0
+# - Plx=10 mas -> d=100 pc, módulo 5: M_v = 10 - 5; B-V=0.635 -> T = 8540 / 1.5
+# - Plx=0 -> sin distancia ni magnitudes absolutas; B-V=-0.365 -> T = 8540 / 0.5
+VMAG = [5.0, 10.0, 1.0]
+B_V = [0.135, 0.635, -0.365]
+PLX = [100.0, 10.0, 0.0]
+
+
+def test_columnas_derivadas_a_mano():
+    columnas = columnas_derivadas(VMAG, B_V, Plx=PLX)
+
+    assert set(columnas) == set(COLUMNAS_MODELO)
+    assert all(valores.dtype == np.float32 for valores in columnas.values())
+    np.testing.assert_allclose(columnas['d'], [10, 100, np.nan], rtol=1e-6)
+    np.testing.assert_allclose(columnas['T'], [8540, 8540 / 1.5, 17080], rtol=1e-6)
+    np.testing.assert_allclose(columnas['M_v'], [5, 5, np.nan], rtol=1e-6)
+    # Hpmag aproximada: 1.00564 * Vmag + 0.05840, con el mismo módulo de distancia
+    np.testing.assert_allclose(columnas['Hpmag'], [5.0866, 10.1148, 1.06404], rtol=1e-6)
+    np.testing.assert_allclose(columnas['M_Hip'], [5.0866, 5.1148, np.nan], rtol=1e-6)
+
+
+def test_columnas_derivadas_con_bandas_medidas_y_distancia():
+    # Las bandas que se pasan no se aproximan y `d` sustituye a la paralaje
+    columnas = columnas_derivadas(VMAG, B_V, d=[10.0, 100.0, 1000.0], Hpmag=[6.0, 11.0, 2.0],
+                                  V_I=[0.2, 0.7, -0.3])
+
+    np.testing.assert_allclose(columnas['Hpmag'], [6, 11, 2], rtol=1e-6)
+    np.testing.assert_allclose(columnas['V-I'], [0.2, 0.7, -0.3], rtol=1e-6)
+    np.testing.assert_allclose(columnas['M_Hip'], [6, 6, -8], rtol=1e-6)
+    np.testing.assert_allclose(columnas['M_v'], [5, 5, -9], rtol=1e-6)
+
+
+def test_matriz_y_fila_derivadas_en_el_orden_del_modelo():
+    matriz = matriz_derivadas(VMAG, B_V, Plx=PLX)
+    columnas = columnas_derivadas(VMAG, B_V, Plx=PLX)
+
+    assert matriz.shape == (3, len(COLUMNAS_MODELO))
+    assert matriz.dtype == np.float32
+    for i, columna in enumerate(COLUMNAS_MODELO):
+        np.testing.assert_array_equal(matriz[:, i], columnas[columna])
+
+    # La versión escalar reutiliza la fila reservada y da los mismos valores
+    fila = np.empty((1, len(COLUMNAS_MODELO)), dtype=np.float32)
+    assert fila_derivadas(10.0, 0.635, 100.0, fila) is fila
+    np.testing.assert_allclose(fila[0], matriz[1], rtol=1e-6)
+
+
+def test_clasificacion_espectral():
+    tipo, clase = clasificacion_espectral(['K3V', 'G', 'B9.5III', 'Xe', None, np.nan, 'M'])
+
+    assert tipo.tolist() == ['K', 'G', 'B', None, None, None, 'M']
+    assert clase.tolist() == ['K3', None, 'B9', None, None, None, None]
@@ -0,0 +1,59 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from utils import entrenamiento
+from utils.clasificacion import CLASES
+from utils.derivadas import COLUMNAS_MODELO
+
+
+def _catalogo(filas, semilla=0):
+    rng = np.random.default_rng(semilla)
+    df = pd.DataFrame(rng.normal(size=(filas, len(COLUMNAS_MODELO))), columns=COLUMNAS_MODELO)
+    # El tipo depende de una columna para que los modelos tengan algo que aprender
+    df[entrenamiento.COLUMNA_OBJETIVO] = CLASES[np.digitize(df['B-V'], [-1, 0, 1])]
+    return df
+
+
+def test_actualizar_con_una_sola_fila_nueva(tmp_path):
+    datos, salida = str(tmp_path / 'catalogo.parquet'), str(tmp_path / 'entrenamiento')
+    df = _catalogo(600)
+    df.to_parquet(datos)
+    # KNN no tiene partial_fit: solo se reentrenaría si se midiera deriva
+    base = entrenamiento.entrenar(['Naive Bayes', 'SGD', 'KNN'], datos, salida,
+                                  candidatos=2, cv=2, n_jobs=1)
+
+    pd.concat([df, _catalogo(1, semilla=1)]).to_parquet(datos)
+    # El parquet reescrito puede tener la misma fecha de modificación
+    os.utime(datos, ns=(os.stat(datos).st_atime_ns, os.stat(datos).st_mtime_ns + 10**9))
+    version = entrenamiento.actualizar(base, datos, salida)
+
+    with open(os.path.join(version, 'metricas.json'), encoding='utf-8') as f:
+        metricas = json.load(f)
+    assert metricas['filas_nuevas'] == 1
+    with open(os.path.join(base, 'metricas.json'), encoding='utf-8') as f:
+        anterior = json.load(f)
+    assert metricas['filas_entrenamiento'] == anterior['filas_entrenamiento'] + 1
+    assert metricas['filas_prueba'] == anterior['filas_prueba']
+    # Con una fila no se mide el PSI y los modelos sin partial_fit se conservan
+    assert metricas['psi'] is None
+    assert metricas['familias']['KNN']['actualizacion'] == 'sin cambios'
+    assert metricas['familias']['Naive Bayes']['actualizacion'] == 'partial_fit'
+
+
+def test_actualizar_con_pocas_filas_no_reentrena(tmp_path):
+    datos, salida = str(tmp_path / 'catalogo.parquet'), str(tmp_path / 'entrenamiento')
+    df = _catalogo(600)
+    df.to_parquet(datos)
+    base = entrenamiento.entrenar(['KNN'], datos, salida, candidatos=2, cv=2, n_jobs=1)
+
+    # Se parten en entrenamiento y prueba, pero no llegan a MIN_FILAS_PSI
+    pd.concat([df, _catalogo(entrenamiento.MIN_FILAS_PARTICION, semilla=1)]).to_parquet(datos)
+    os.utime(datos, ns=(os.stat(datos).st_atime_ns, os.stat(datos).st_mtime_ns + 10**9))
+    version = entrenamiento.actualizar(base, datos, salida)
+
+    with open(os.path.join(version, 'metricas.json'), encoding='utf-8') as f:
+        metricas = json.load(f)
+    assert metricas['psi'] is None
+    assert metricas['familias']['KNN']['actualizacion'] == 'sin cambios'
@@ -0,0 +1,245 @@
+import tracemalloc
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.impute import KNNImputer
+from sklearn.preprocessing import LabelEncoder
+
+from utils.funciones import (Freidora, HipparcosPreprocessor, bravas, des_fritas, fritas,
+                             limites_outliers, main, mojo_picon, replace_outliers)
+
+
+def _fritas_base(df):
+    # fritas() original: LabelEncoder sobre astype(str) de cada columna object
+    df_encoded = df.copy()
+    encoder_info = []
+    for column in df_encoded.select_dtypes(include=['object']).columns:
+        le = LabelEncoder()
+        df_encoded[column] = le.fit_transform(df_encoded[column].astype(str))
+        encoder_info.append({'column': column, 'labels': list(le.classes_),
+                             'codes': list(le.transform(le.classes_))})
+    return df_encoded, encoder_info
+
+
+def _des_fritas_base(df_encoded, encoder_info):
+    # des_fritas() original, para códigos válidos
+    df_decoded = df_encoded.copy()
+    for encoder in encoder_info:
+        le = LabelEncoder()
+        le.classes_ = np.array(encoder['labels'])
+        df_decoded[encoder['column']] = le.inverse_transform(df_decoded[encoder['column']].astype(int))
+    return df_decoded
+
+
+def test_mojo_picon_por_bloques_igual_que_knnimputer():
+    # Varias columnas con nulos: los donantes no tienen por qué ser filas
+    # completas. Con 0.5 MB las filas incompletas se procesan en varios bloques
+    rng = np.random.default_rng(0)
+    valores = rng.normal(size=(2000, 5))
+    valores[rng.random(valores.shape) < 0.1] = np.nan
+    # Una fila sin ningún valor se imputa con las medias de las columnas
+    valores[7] = np.nan
+    df = pd.DataFrame(valores, columns=list('abcde'))
+
+    esperado = KNNImputer(n_neighbors=5).fit_transform(valores)
+    resultado = mojo_picon(df, 5, max_memory_mb=0.5)
+
+    np.testing.assert_allclose(resultado.to_numpy(), esperado, atol=1e-9)
+    assert not resultado.isna().any().any()
+
+
+def test_mojo_picon_por_bloques_con_pocas_filas_completas():
+    # Menos filas completas que vecinos, o ninguna: el resto de donantes son
+    # filas incompletas, también por bloques, y sin usar KNNImputer
+    rng = np.random.default_rng(1)
+    for completas in (0, 2):
+        valores = rng.normal(size=(400, 4))
+        valores[rng.random(valores.shape) < 0.3] = np.nan
+        valores[:completas] = rng.normal(size=(completas, 4))
+        valores[completas:][~np.isnan(valores[completas:]).any(axis=1), 0] = np.nan
+        df = pd.DataFrame(valores, columns=list('abcd'))
+
+        esperado = KNNImputer(n_neighbors=5).fit_transform(valores)
+        resultado = mojo_picon(df, 5, max_memory_mb=0.05)
+        np.testing.assert_allclose(resultado.to_numpy(), esperado, atol=1e-9)
+
+
+def test_mojo_picon_por_bloques_con_patrones_grandes_y_raros():
+    # Un patrón de nulos con muchas filas (en varios bloques) y otros raros
+    # comparten el mismo índice de filas completas. Columnas con escalas muy
+    # distintas, como HIP o T en el catálogo, no cambian los vecinos
+    rng = np.random.default_rng(2)
+    valores = rng.normal(size=(3000, 4)) * [1, 1e4, 1, 5] + [0, 1e5, 0, 0]
+    valores[:500, 0] = np.nan
+    valores[500:510, 1] = np.nan
+    valores[510:512, 2:] = np.nan
+    df = pd.DataFrame(valores, columns=list('abcd'))
+
+    esperado = KNNImputer(n_neighbors=4).fit_transform(valores)
+    np.testing.assert_allclose(mojo_picon(df, 4, max_memory_mb=1).to_numpy(), esperado,
+                               rtol=1e-12, atol=1e-9)
+
+
+def test_bravas_grafo_igual_que_grid():
+    # Datos continuos sin empates de distancias: el motor de grafo debe dar la
+    # misma tabla de puntuaciones y el mismo best_k que GridSearchCV por fold
+    rng = np.random.default_rng(0)
+    valores = rng.normal(size=(120, 3))
+    df = pd.DataFrame(valores, columns=list('abc'))
+    df['y'] = valores @ [1.0, -2.0, 0.5] + rng.normal(scale=0.3, size=120)
+
+    best_grafo, grafo = bravas(df, 'y', min_k=2, max_k=5, engine='graph', return_details=True)
+    best_grid, grid = bravas(df, 'y', min_k=2, max_k=5, engine='grid', return_details=True)
+
+    assert best_grafo == best_grid
+    claves = ['k', 'n_neighbors', 'weights']
+    pd.testing.assert_frame_equal(grafo['scores'].sort_values(claves).reset_index(drop=True),
+                                  grid['scores'].sort_values(claves).reset_index(drop=True),
+                                  check_dtype=False, atol=1e-9)
+
+
+def test_freidora_n_jobs_negativo_usa_todas_las_cpus():
+    df = pd.DataFrame({'a': ['x', 'y', None], 'b': ['p', 'q', 'p'], 'c': [1, 2, 3]})
+    codificado = Freidora(n_jobs=-1).fit_encode(df)
+    pd.testing.assert_frame_equal(codificado, Freidora(n_jobs=1).fit_encode(df))
+
+
+def test_fritas_igual_que_la_version_original():
+    # Columnas object con None, NaN y valores que no son cadenas
+    df = pd.DataFrame({
+        'mixta': [1, 'a', None, 2.5, 1.0, np.nan, 'a'],
+        'nulos': ['x', 'y', None, 'x', np.nan, None, 'y'],
+        'texto': ['G2V', 'K0III', 'G2V', 'A0V', 'M1', 'A0V', 'K0III'],
+        'Vmag': np.arange(7, dtype=float),
+    })
+    esperado, info_esperada = _fritas_base(df)
+    codificado, info = fritas(df)
+
+    pd.testing.assert_frame_equal(codificado, esperado, check_dtype=False)
+    assert info == info_esperada
+    # '1', '1.0', '2.5', 'None', 'a', 'nan': 1 y 1.0 tienen etiquetas distintas
+    assert codificado['mixta'].tolist() == [0, 4, 3, 2, 1, 5, 4]
+    pd.testing.assert_frame_equal(des_fritas(codificado, info),
+                                  _des_fritas_base(esperado, info_esperada), check_dtype=False)
+
+
+def test_freidora_decodifica_none_como_la_version_original():
+    df = pd.DataFrame({'c': ['x', 'y', None]})
+    codec = Freidora().fit(df)
+    assert codec.decode(codec.encode(df))['c'].tolist() == ['x', 'y', 'None']
+
+
+def _catalogo_crudo(filas=300, semilla=0):
+    # Columnas numéricas con nulos, una categórica con nulos y el objetivo de bravas
+    rng = np.random.default_rng(semilla)
+    df = pd.DataFrame({
+        'Vmag': rng.normal(8, 1.5, filas).round(2),
+        'Plx': rng.lognormal(1.5, 0.8, filas).round(2),
+        'B-V': rng.normal(0.7, 0.4, filas).round(3),
+        'HvarType': rng.choice(['C', 'P', 'U', None], filas),
+        'SpType': rng.choice(['G2V', 'K0III', 'A0V', 'M1', 'F5'], filas),
+    })
+    for columna in ('Vmag', 'Plx', 'B-V'):
+        df.loc[rng.random(filas) < 0.1, columna] = np.nan
+    return df
+
+
+def test_preprocessor_igual_que_la_cadena_original():
+    df = _catalogo_crudo()
+    codificado, info = fritas(df)
+    best_k = bravas(codificado, 'SpType', min_k=2, max_k=4)
+    esperado = des_fritas(mojo_picon(codificado, best_k), info)
+
+    preprocesador = HipparcosPreprocessor(min_k=2, max_k=4)
+    resultado = preprocesador.fit_transform(df)
+
+    assert preprocesador.best_k_ == best_k
+    pd.testing.assert_frame_equal(resultado, esperado, check_dtype=False)
+    assert list(preprocesador.report_.index) == ['encode', 'tune', 'impute', 'decode']
+    assert list(preprocesador.report_.columns) == ['seconds']
+
+
+def test_preprocessor_mide_la_memoria_solo_si_se_pide():
+    df = _catalogo_crudo()
+    preprocesador = HipparcosPreprocessor(min_k=2, max_k=4, profile_memory=True)
+    preprocesador.fit_transform(df)
+    assert list(preprocesador.report_.columns) == ['seconds', 'peak_mb']
+    assert (preprocesador.report_['peak_mb'] > 0).all()
+    assert not tracemalloc.is_tracing()
+
+    # Si una etapa falla, tracemalloc no se queda activo
+    with pytest.raises(KeyError):
+        HipparcosPreprocessor(target_column='no_existe', profile_memory=True).fit(df)
+    assert not tracemalloc.is_tracing()
+
+
+def test_preprocessor_con_una_columna_vacia():
+    # Una columna sin ningún valor no cambia los vecinos y se queda vacía
+    df = _catalogo_crudo()
+    for max_memory_mb in (None, 1):
+        esperado = HipparcosPreprocessor(min_k=2, max_k=4, max_memory_mb=max_memory_mb).fit_transform(df)
+        preprocesador = HipparcosPreprocessor(min_k=2, max_k=4, max_memory_mb=max_memory_mb)
+        resultado = preprocesador.fit_transform(df.assign(vacia=np.nan))
+        assert resultado['vacia'].isna().all()
+        pd.testing.assert_frame_equal(resultado.drop(columns='vacia'), esperado, atol=1e-9)
+
+
+def test_main_conserva_los_valores_del_csv(tmp_path):
+    df = _catalogo_crudo()
+    df.insert(0, 'HIP', np.arange(1, len(df) + 1))
+    entrada, salida = tmp_path / 'hipparcos.csv', tmp_path / 'final.parquet'
+    df.to_csv(entrada, index=False)
+    main(['--input', str(entrada), '--output', str(salida), '--variables', str(tmp_path / 'v.parquet'),
+          '--raw', str(tmp_path / 'bruto.parquet'), '--min-k', '2', '--max-k', '3'])
+
+    final = pd.read_parquet(salida)
+    leido = pd.read_csv(entrada)
+    # Los valores medidos llegan sin pasar por float32 y los nulos se imputan
+    observado = leido['Vmag'].notna()
+    assert final['Vmag'].dtype == np.float64
+    np.testing.assert_array_equal(final.loc[observado, 'Vmag'], leido.loc[observado, 'Vmag'])
+    assert not final[['Vmag', 'Plx', 'B-V']].isna().any().any()
+    assert {'d', 'T', 'M_v', 'Tipo_espectral', 'Clase_espectral'} <= set(final.columns)
+    assert 'HvarType' not in final and 'HvarType' in pd.read_parquet(tmp_path / 'v.parquet')
+
+
+def test_limites_outliers_ajustados_y_reutilizados():
+    # Cuartiles de 1..5: Q1=2, Q3=4, IQR=2 -> límites [-1, 7] con f=1.5
+    entrenamiento = pd.DataFrame({'a': [1, 2, 3, 4, 5], 'b': [1.0, 2.0, 3.0, 4.0, 5.0],
+                                  'tipo': list('ABCDE')})
+    inferior, superior = limites_outliers(entrenamiento)
+    pd.testing.assert_series_equal(inferior, pd.Series([-1.0, -1.0], index=['a', 'b']))
+    pd.testing.assert_series_equal(superior, pd.Series([7.0, 7.0], index=['a', 'b']))
+
+    # El otro lote se recorta con los límites del primero, no con los suyos
+    lote = pd.DataFrame({'a': [-10, 3, 50], 'b': [-5.5, 2.5, 100.0], 'tipo': list('XYZ')})
+    resultado = replace_outliers(lote, limites=(inferior, superior), inplace=False)
+    assert resultado['a'].tolist() == [-1, 3, 7]
+    assert resultado['b'].tolist() == [-1.0, 2.5, 7.0]
+    assert resultado['tipo'].tolist() == list('XYZ')
+    # inplace=False no toca el DataFrame de entrada
+    assert lote['a'].tolist() == [-10, 3, 50]
+
+
+def test_replace_outliers_convierte_cada_columna_a_int_o_float():
+    # Q1=1, Q3=3 en las dos columnas -> límites [-2, 6]. Tras recortar, 'enteros'
+    # solo tiene enteros y pasa a int; 'decimales' conserva sus decimales como
+    # float (la versión original convertía todo a int y los truncaba)
+    df = pd.DataFrame({'enteros': [0.0, 1.0, 2.0, 3.0, 100.0],
+                       'decimales': [0.5, 1.0, 2.0, 3.0, 100.0]})
+    resultado = replace_outliers(df)
+
+    assert resultado is df
+    assert resultado['enteros'].dtype.kind == 'i'
+    assert resultado['enteros'].tolist() == [0, 1, 2, 3, 6]
+    assert resultado['decimales'].dtype.kind == 'f'
+    assert resultado['decimales'].tolist() == [0.5, 1.0, 2.0, 3.0, 6.0]
+
+
+def test_replace_outliers_con_infinitos_se_queda_en_float():
+    # Un infinito hace infinito el IQR, así que no se recorta; la columna solo
+    # tiene valores enteros e inf, que no se puede pasar a int
+    df = pd.DataFrame({'a': [1.0, 2.0, 3.0, np.inf]})
+    resultado = replace_outliers(df)
+    assert resultado['a'].dtype.kind == 'f'
+    assert resultado['a'].tolist() == [1.0, 2.0, 3.0, np.inf]
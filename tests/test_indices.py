@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.catalogo import Catalogo
+
+
+@pytest.fixture(scope='module')
+def catalogo(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    n = 5000
+    ruta = tmp_path_factory.mktemp('indices') / 'catalogo.parquet'
+    df = pd.DataFrame({
+        'Vmag': rng.normal(8, 1.5, n).round(2),
+        'd': rng.lognormal(5, 1, n),
+        'Plx': rng.normal(5, 3, n),
+        'Tipo_espectral': rng.choice(['O', 'B', 'A', 'F', 'G', 'K', 'M', None], n),
+        'Clase_espectral': rng.choice(['G2', 'K0', 'A0', 'M5', 'B9', None], n),
+        'HvarType': rng.choice(['C', 'D', 'M', 'P', 'U', None], n, p=[0.5, 0.1, 0.1, 0.1, 0.1, 0.1]),
+    })
+    for columna in ('Vmag', 'd', 'Plx'):
+        df.loc[rng.random(n) < 0.05, columna] = np.nan
+    df.to_parquet(ruta)
+    return Catalogo(str(ruta), str(ruta.parent / 'cache'))
+
+
+def _mascara(df, rangos, categorias):
+    # La misma consulta con pandas: AND entre columnas, OR dentro de una
+    # categórica; un rango, aunque sea abierto por los dos lados, excluye los nulos
+    mascara = pd.Series(True, index=df.index)
+    for columna, (minimo, maximo) in rangos.items():
+        mascara &= df[columna].notna()
+        if minimo is not None:
+            mascara &= df[columna] >= minimo
+        if maximo is not None:
+            mascara &= df[columna] < maximo
+    for columna, valores in categorias.items():
+        mascara &= df[columna].isin(valores)
+    return np.flatnonzero(mascara.to_numpy())
+
+
+def test_consulta_igual_que_mascara_de_pandas(catalogo):
+    df = catalogo.frame()
+    rng = np.random.default_rng(1)
+    consultas = [
+        ({}, {}),
+        ({'Vmag': (None, 6.5)}, {}),
+        ({'Vmag': (None, None), 'd': (50, 60)}, {}),
+        ({}, {'Tipo_espectral': ['G', 'K']}),
+        ({}, {'Tipo_espectral': ['G'], 'HvarType': ['C', 'M'], 'Clase_espectral': ['G2']}),
+        # Límites en valores del catálogo: el mínimo se incluye y el máximo no
+        ({'Vmag': (7.5, 8.25), 'd': (100, None)}, {'Tipo_espectral': ['A', 'F', 'G']}),
+        ({'Vmag': (6.35, 9.1), 'Plx': (-1, 3.3), 'd': (None, 400)}, {'HvarType': ['P']}),
+        # Categorías que no existen
+        ({'Vmag': (8, 9)}, {'Tipo_espectral': ['X']}),
+        ({}, {'Clase_espectral': []}),
+    ]
+    for _ in range(100):
+        rangos, categorias = {}, {}
+        for columna in rng.choice(['Vmag', 'd', 'Plx'], rng.integers(0, 4), replace=False):
+            limites = np.sort(rng.choice(df[columna].dropna().to_numpy(), 2))
+            rangos[columna] = tuple(None if rng.random() < 0.2 else float(v) for v in limites)
+        for columna in rng.choice(['Tipo_espectral', 'Clase_espectral', 'HvarType'],
+                                  rng.integers(0, 3), replace=False):
+            existentes = df[columna].dropna().unique()
+            categorias[columna] = list(rng.choice(existentes, rng.integers(1, 4)))
+        consultas.append((rangos, categorias))
+
+    for rangos, categorias in consultas:
+        np.testing.assert_array_equal(catalogo.indices.consulta(rangos, categorias),
+                                      _mascara(df, rangos, categorias),
+                                      err_msg=f'{rangos} {categorias}')
+
+
+def test_rango_con_maximo_incluido(catalogo):
+    df = catalogo.frame(['Vmag'])
+    filas = catalogo.indices.rango('Vmag', 7, 8.25, incluir_maximo=True)
+    np.testing.assert_array_equal(np.sort(filas), np.flatnonzero((df['Vmag'] >= 7) & (df['Vmag'] <= 8.25)))
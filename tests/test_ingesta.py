@@ -0,0 +1,68 @@
+import os
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from utils.ingesta import COLUMNAS_CATALOGO, COLUMNAS_VARIABLES, ingerir
+
+
+CSV = '''HIP,Vmag,RAdeg,DEdeg,Plx,B-V,HD,SpType,Notes,Period,HvarType
+1,9.1,0.00091185,1.08901332,3.54,0.482,224700,F5,x,,
+2,9.27,0.00379737,-19.49883745,21.9,0.999,224690,K3V,,1.2345,P
+3,6.61,0.00500795,38.85928608,2.81,-0.019,224699,B9,,,C
+4,8.06,0.00838170,-51.89354612,7.75,0.37,,F0V,y,,
+5,8.55,0.00996534,-40.59122440,2.87,0.902,224707,G8III,,0.5,U
+'''
+
+
+@pytest.fixture
+def rutas(tmp_path):
+    entrada = tmp_path / 'hipparcos.csv'
+    entrada.write_text(CSV)
+    return str(entrada), str(tmp_path / 'bruto.parquet'), str(tmp_path / 'variables.parquet')
+
+
+def test_ingerir_tipos_columnas_y_grupos(rutas):
+    entrada, salida, variables = rutas
+    r = ingerir(entrada, salida, variables, filas_grupo=2)
+
+    assert r['filas'] == 5 and r['grupos'] == 3
+    assert r['sin_leer'] == ['Notes']
+    assert pq.ParquetFile(salida).metadata.num_row_groups == 3
+
+    catalogo, variabilidad = pd.read_parquet(salida), pd.read_parquet(variables)
+    assert list(catalogo.columns) == [c for c in COLUMNAS_CATALOGO if c in CSV.split('\n')[0].split(',')]
+    assert list(variabilidad.columns) == [c for c in COLUMNAS_VARIABLES if c in ('Period', 'HvarType')]
+    tipos = {campo.name: str(campo.type) for campo in pq.read_schema(salida)}
+    assert tipos['HIP'] == 'int32' and tipos['HD'] == 'int32' and tipos['SpType'] == 'string'
+    assert tipos['Vmag'] == 'float' and tipos['RAdeg'] == 'double'
+    assert not pq.read_schema(salida).field('HIP').nullable
+    assert catalogo['HD'].isna().tolist() == [False, False, False, True, False]
+    assert variabilidad['HvarType'].tolist() == [None, 'P', 'C', None, 'U']
+    pd.testing.assert_frame_equal(catalogo.astype({'Vmag': 'float64'})[['HIP', 'Vmag']],
+                                  pd.read_csv(entrada, usecols=['HIP', 'Vmag']).astype({'HIP': 'int32'}),
+                                  atol=1e-6)
+
+
+def test_ingerir_en_float64_conserva_los_valores_del_csv(rutas):
+    entrada, salida, variables = rutas
+    ingerir(entrada, salida, variables, reales='float64')
+    catalogo, esperado = pd.read_parquet(salida), pd.read_csv(entrada)
+    for columna in ('Vmag', 'Plx', 'B-V'):
+        assert catalogo[columna].dtype == 'float64'
+        assert catalogo[columna].tolist() == esperado[columna].tolist()
+    assert pd.read_parquet(variables)['Period'].dtype == 'float64'
+
+
+def test_ingerir_sin_columnas_de_variabilidad(rutas, tmp_path):
+    _, salida, variables = rutas
+    entrada = tmp_path / 'sin_variables.csv'
+    # El mismo CSV sin Period ni HvarType
+    entrada.write_text('\n'.join(linea.rsplit(',', 2)[0] for linea in CSV.splitlines()) + '\n')
+
+    r = ingerir(str(entrada), salida, variables, filas_grupo=2)
+
+    assert r['filas'] == 5 and list(r['bytes']) == [salida]
+    assert not os.path.exists(variables)
+    assert pd.read_parquet(salida)['HIP'].tolist() == [1, 2, 3, 4, 5]
+
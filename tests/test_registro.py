@@ -0,0 +1,84 @@
+import os
+import shutil
+import joblib
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+
+from utils import registro as registro_modelos
+from utils.registro import RegistroModelos
+from utils.servicio import ModeloNumpy, convertir, exportar
+
+
+@pytest.fixture
+def directorio(tmp_path):
+    rng = np.random.default_rng(0)
+    X, y = rng.normal(size=(200, 4)), rng.integers(0, 3, 200)
+    for i, C in enumerate([0.1, 1.0, 10.0]):
+        joblib.dump(LogisticRegression(C=C).fit(X, y), tmp_path / f'modelo_{i}.pkl')
+    # Copia idéntica de modelo_0 con otro nombre
+    shutil.copy(tmp_path / 'modelo_0.pkl', tmp_path / 'copia.pkl')
+    exportar(LogisticRegression().fit(X, y), str(tmp_path / 'servicio' / 'lineal'))
+    return tmp_path
+
+
+def test_carga_perezosa_y_deduplicada(directorio):
+    registro = RegistroModelos(str(directorio))
+    assert set(registro.nombres) == {'modelo_0', 'modelo_1', 'modelo_2', 'copia', 'servicio/lineal'}
+    assert not registro.cargados
+
+    assert registro.obtener('copia') is registro.obtener('modelo_0')
+    assert len(registro.cargados) == 1
+    assert registro.cargas == {'fallos': 1, 'aciertos': 1}
+
+
+def test_descubrir_no_lee_los_artefactos(directorio, monkeypatch):
+    leidos = []
+    monkeypatch.setattr(registro_modelos, 'huella_fichero',
+                        lambda ruta: leidos.append(ruta) or os.path.basename(ruta))
+    registro = RegistroModelos(str(directorio))
+    assert leidos == []
+    assert all(fila['hash'] is None for fila in registro.resumen())
+
+    registro.obtener('modelo_1')
+    assert leidos == [str(directorio / 'modelo_1.pkl')]
+
+
+def test_memoria_estimada_del_artefacto(directorio):
+    registro = RegistroModelos(str(directorio))
+    servido = registro.obtener('servicio/lineal')
+    registro.obtener('modelo_1')
+    filas = {fila['modelo']: fila for fila in registro.resumen()}
+    assert filas['modelo_1']['memoria_mb'] * 2**20 == os.path.getsize(directorio / 'modelo_1.pkl')
+    assert filas['servicio/lineal']['memoria_mb'] * 2**20 == sum(a.nbytes for a in servido.arrays.values())
+    assert filas['modelo_2']['memoria_mb'] is None
+
+
+def test_desalojo_respeta_el_limite(directorio):
+    tamano = os.path.getsize(directorio / 'modelo_0.pkl')
+    # Caben dos pickles (los tres tienen el mismo tamaño salvo unos bytes)
+    registro = RegistroModelos(str(directorio), max_bytes=int(2.5 * tamano))
+    registro.obtener('modelo_0')
+    registro.obtener('modelo_1')
+    registro.obtener('modelo_0')
+    registro.obtener('modelo_2')
+    # modelo_1 es el usado hace más tiempo; 'copia' no se ha pedido, así que
+    # aún no se sabe que comparte el artefacto de modelo_0
+    cargados = {fila['modelo'] for fila in registro.resumen() if fila['cargado']}
+    assert cargados == {'modelo_0', 'modelo_2'}
+    total = sum(registro.estadisticas[h]['bytes'] for h in registro.cargados)
+    assert total <= registro.max_bytes
+
+
+def test_convierte_los_pickles_al_cargarlos(directorio):
+    registro = RegistroModelos(str(directorio), convertir=convertir)
+    modelo = registro.obtener('modelo_1')
+    original = joblib.load(directorio / 'modelo_1.pkl')
+
+    assert isinstance(modelo, ModeloNumpy)
+    X = np.random.default_rng(1).normal(size=(50, 4))
+    np.testing.assert_array_equal(modelo.predict(X), original.predict(X))
+    # La memoria es la de los arrays convertidos, no la del pickle
+    fila, = [f for f in registro.resumen() if f['modelo'] == 'modelo_1']
+    assert fila['memoria_mb'] * 2**20 == sum(a.nbytes for a in modelo.arrays.values())
+
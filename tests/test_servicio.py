@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import GradientBoostingClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from utils.servicio import cargar, convertir, exportar
+
+
+@pytest.fixture(scope='module')
+def datos():
+    # Cuatro clases que dependen de forma no lineal de 6 variables con escalas distintas
+    rng = np.random.default_rng(0)
+    X = rng.normal([8, 0.7, 300, 0, 5, -2], [1.5, 0.4, 200, 1, 3, 0.1], size=(3000, 6))
+    y = np.digitize(X[:, 0] + 3 * X[:, 1] + np.sin(X[:, 3] * 2) + rng.normal(0, 0.3, len(X)),
+                    [9, 10, 11])
+    # En float64: con float32 el StandardScaler de scikit-learn escala en float32
+    # y redondea más que los coeficientes exportados, que integran el escalado
+    X = pd.DataFrame(X, columns=[f'x{i}' for i in range(6)])
+    return X, np.array(['A', 'F', 'G', 'K'])[y]
+
+
+def _comprobar(modelo, X, directorio):
+    exportar(modelo, directorio)
+    servido = cargar(directorio)
+    np.testing.assert_array_equal(servido.predict(X), modelo.predict(X))
+    np.testing.assert_allclose(servido.predict_proba(X), modelo.predict_proba(X), rtol=0, atol=1e-12)
+    # La conversión en memoria predice igual que el modelo exportado a disco
+    np.testing.assert_array_equal(convertir(modelo).predict_proba(X), servido.predict_proba(X))
+
+
+def test_regresion_logistica_con_escalado(datos, tmp_path):
+    X, y = datos
+    modelo = Pipeline([('scaler', StandardScaler()),
+                       ('modelo', LogisticRegression(max_iter=1000))]).fit(X, y)
+    _comprobar(modelo, X, tmp_path / 'lr')
+
+
+def test_gradient_boosting_con_arboles_desequilibrados(datos, tmp_path):
+    X, y = datos
+    modelo = GradientBoostingClassifier(n_estimators=30, max_depth=5, min_samples_leaf=40,
+                                        random_state=0).fit(X, y)
+    # Hojas a varias profundidades: el exportador tiene que completar los árboles
+    profundidades = set()
+    for arbol in modelo.estimators_.ravel():
+        t, pila = arbol.tree_, [(0, 0)]
+        while pila:
+            nodo, nivel = pila.pop()
+            if t.children_left[nodo] == -1:
+                profundidades.add(nivel)
+            else:
+                pila += [(t.children_left[nodo], nivel + 1), (t.children_right[nodo], nivel + 1)]
+    assert len(profundidades) > 1
+
+    _comprobar(modelo, X, tmp_path / 'gb')
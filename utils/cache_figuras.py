@@ -0,0 +1,217 @@
+'''
+Caché en disco de las figuras de Plotly de la app.
+
+Cada figura se guarda como JSON serializado bajo una clave formada por el hash
+del contenido del catálogo, los parámetros del constructor y la versión de su
+código: la versión del esquema del catálogo (`VERSION_ESQUEMA`), el hash del
+código fuente del módulo donde se define el constructor y de los módulos de
+`utils` de los que importa, y una versión opcional por constructor. Así
+sobrevive a reinicios y a despliegues que no cambian ni el catálogo ni ese
+código; para cambios más indirectos se sube la `version` del constructor. Solo
+se guardan en disco las figuras de las `variantes` registradas de cada
+constructor (las que se precalientan); las de otros parámetros, como cada
+posición de los sliders de zoom, se quedan en la caché en memoria de Streamlit,
+de modo que no llenan el disco ni desalojan las precalentadas. La caché tiene un
+tamaño máximo y elimina primero las figuras usadas hace más tiempo.
+
+Un acierto solo decodifica el JSON y construye la figura sin validarla, que es
+lo mínimo que acepta `st.plotly_chart`: este vuelve a serializar siempre lo que
+recibe y, si recibe un dict en lugar de una figura, lo valida entero, lo que
+cuesta más que construir la figura.
+
+Precalentar la caché antes de arrancar la app (desde la raíz del proyecto):
+
+    python -m utils.cache_figuras
+'''
+
+import collections
+import functools
+import hashlib
+import inspect
+import json
+import os
+import plotly.graph_objs as go
+import plotly.io as pio
+
+from utils.catalogo import DIRECTORIO_CACHE, RUTA_CATALOGO, VERSION_ESQUEMA
+
+
+DIRECTORIO_FIGURAS = os.path.join(DIRECTORIO_CACHE, 'figuras')
+# Tamaño máximo de la caché de figuras en disco
+MAX_BYTES = 200 * 2**20
+
+# Constructores decorados, parámetros con los que se precalientan y catálogo que reciben
+constructores = []
+# Por constructor: aciertos y fallos en disco de las llamadas que llegan a la
+# caché en disco (las que no resolvió la caché de Streamlit), y llamadas con
+# parámetros que no son de ninguna variante y no se guardan en disco
+estadisticas = collections.defaultdict(collections.Counter)
+
+_huellas = {}
+
+
+def huella_fichero(ruta):
+    """
+    Hash SHA-256 del contenido de `ruta`. Se recalcula solo cuando cambian la
+    fecha de modificación o el tamaño del fichero.
+    """
+    estado = os.stat(ruta)
+    firma = (ruta, estado.st_mtime_ns, estado.st_size)
+    if firma not in _huellas:
+        sha = hashlib.sha256()
+        with open(ruta, 'rb') as f:
+            for bloque in iter(lambda: f.read(2**20), b''):
+                sha.update(bloque)
+        _huellas[firma] = sha.hexdigest()
+    return _huellas[firma]
+
+
+def huella_codigo(funcion, version=0):
+    """
+    Versión del código de `funcion`: esquema del catálogo, hash del código
+    fuente de su módulo y de los módulos de `utils` de los que este importa
+    nombres (las funciones auxiliares), y `version`.
+    """
+    modulo = inspect.getmodule(funcion)
+    modulos = {modulo.__name__: modulo}
+    for objeto in list(vars(modulo).values()):
+        dependencia = inspect.getmodule(objeto)
+        if dependencia is not None and dependencia.__name__.startswith('utils.'):
+            modulos[dependencia.__name__] = dependencia
+    sha = hashlib.sha256()
+    for nombre in sorted(modulos):
+        sha.update(inspect.getsource(modulos[nombre]).encode())
+    return f'{VERSION_ESQUEMA}:{sha.hexdigest()}:{version}'
+
+
+def clave_figura(nombre, ruta, argumentos, codigo=''):
+    """
+    Clave de una figura. `argumentos` son los argumentos ya enlazados por
+    nombre (`inspect.BoundArguments.arguments` con los valores por defecto), de
+    modo que pasar un argumento por posición o por nombre da la misma clave.
+    """
+    return hashlib.sha256(
+        f'{nombre}|{codigo}|{huella_fichero(ruta)}|{_canonicos(argumentos)}'.encode()).hexdigest()
+
+
+def leer_json(clave, directorio=DIRECTORIO_FIGURAS):
+    """Devuelve el JSON guardado con `clave` o None si no está en la caché."""
+    ruta = os.path.join(directorio, clave + '.json')
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            texto = f.read()
+    except FileNotFoundError:
+        return None
+    # Marca la entrada como usada recientemente para el desalojo LRU
+    os.utime(ruta)
+    return texto
+
+
+def escribir_json(clave, texto, directorio=DIRECTORIO_FIGURAS, max_bytes=MAX_BYTES):
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, clave + '.json')
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        f.write(texto)
+    os.replace(temporal, ruta)
+    desalojar(directorio, max_bytes)
+
+
+def desalojar(directorio=DIRECTORIO_FIGURAS, max_bytes=MAX_BYTES):
+    """Borra las figuras usadas hace más tiempo hasta que la caché ocupa como mucho `max_bytes`."""
+    entradas = []
+    for nombre in os.listdir(directorio):
+        if nombre.endswith('.json'):
+            estado = os.stat(os.path.join(directorio, nombre))
+            entradas.append((estado.st_mtime, estado.st_size, nombre))
+    total = sum(tamano for _, tamano, _ in entradas)
+    for _, tamano, nombre in sorted(entradas):
+        if total <= max_bytes:
+            break
+        os.remove(os.path.join(directorio, nombre))
+        total -= tamano
+
+
+def serializar(resultado):
+    # Los constructores devuelven una figura o una tupla de figuras
+    if isinstance(resultado, tuple):
+        return json.dumps([pio.to_json(fig, validate=False) for fig in resultado])
+    return pio.to_json(resultado, validate=False)
+
+
+def deserializar(texto):
+    # El JSON lo generó una figura ya validada, así que no se vuelve a validar
+    if texto.startswith('['):
+        return tuple(go.Figure(json.loads(fig), _validate=False) for fig in json.loads(texto))
+    return go.Figure(json.loads(texto), _validate=False)
+
+
+def cache_en_disco(funcion=None, variantes=({},), ruta=RUTA_CATALOGO, version=0):
+    """
+    Decorador para constructores de figuras cuyo primer argumento es un handle
+    `Catalogo`. La clave usa el hash del fichero del catálogo, la versión del
+    código (`huella_codigo`) y el resto de argumentos. `variantes` son los
+    kwargs con los que `precalentar` genera la figura por adelantado, `ruta` el
+    catálogo con el que la genera y `version` se sube a mano cuando cambia
+    código de otro módulo del que depende la figura. Las llamadas con otros
+    parámetros que los de `variantes` no pasan por el disco.
+    """
+    if funcion is None:
+        return functools.partial(cache_en_disco, variantes=variantes, ruta=ruta, version=version)
+    codigo = huella_codigo(funcion, version)
+    firma = inspect.signature(funcion)
+
+    def enlazar(catalogo, *args, **kwargs):
+        argumentos = firma.bind(catalogo, *args, **kwargs)
+        argumentos.apply_defaults()
+        # El catálogo entra en la clave por el hash de su fichero
+        return dict(list(argumentos.arguments.items())[1:])
+
+    registradas = {_canonicos(enlazar(None, **kwargs)) for kwargs in variantes}
+
+    @functools.wraps(funcion)
+    def envoltorio(catalogo, *args, **kwargs):
+        cuenta = estadisticas[funcion.__qualname__]
+        parametros = enlazar(catalogo, *args, **kwargs)
+        if _canonicos(parametros) not in registradas:
+            cuenta['sin_disco'] += 1
+            return funcion(catalogo, *args, **kwargs)
+        clave = clave_figura(funcion.__qualname__, catalogo.ruta, parametros, codigo)
+        texto = leer_json(clave)
+        if texto is not None:
+            cuenta['aciertos'] += 1
+            return deserializar(texto)
+        cuenta['fallos'] += 1
+        resultado = funcion(catalogo, *args, **kwargs)
+        escribir_json(clave, serializar(resultado))
+        return resultado
+
+    constructores.append((envoltorio, variantes, ruta))
+    return envoltorio
+
+
+def precalentar(*catalogos):
+    """Genera y guarda en disco las figuras registradas para cada uno de `catalogos`."""
+    por_ruta = {catalogo.ruta: catalogo for catalogo in catalogos}
+    for constructor, variantes, ruta in constructores:
+        for kwargs in variantes:
+            if ruta in por_ruta:
+                constructor(por_ruta[ruta], **kwargs)
+
+
+def _canonicos(argumentos):
+    # Misma cadena para los mismos valores: listas y tuplas se escriben igual
+    return json.dumps(argumentos, sort_keys=True, default=repr)
+
+
+if __name__ == '__main__':
+    import time
+    # Se importa por su nombre para usar el registro en el que se han inscrito
+    # los constructores de func_streamlit, no el de este __main__
+    from utils import cache_figuras
+    from utils.func_streamlit import load_catalogos
+
+    inicio = time.perf_counter()
+    cache_figuras.precalentar(*load_catalogos())
+    print(f'{len(cache_figuras.constructores)} constructores precalentados en '
+          f'{time.perf_counter() - inicio:.1f} s en {DIRECTORIO_FIGURAS}')
@@ -0,0 +1,199 @@
+'''
+Capa de acceso al catálogo Hipparcos por columnas.
+
+Cada parquet se convierte una sola vez a un fichero Arrow IPC sin comprimir con
+un esquema fijo (reales en float32 con NaN en lugar de nulos, tipos y clases
+espectrales como categorías ordenadas, el resto de cadenas como categorías y las
+filas ordenadas por tipo y clase espectral), y ese fichero se abre mapeado en
+memoria. Las columnas se leen sin copiarlas desde la caché de páginas
+del sistema operativo, de modo que varios procesos de Streamlit en la misma
+máquina comparten una única copia de los datos.
+'''
+
+import hashlib
+import os
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from utils.indices import IndicesCatalogo
+
+
+RUTA_CATALOGO = 'data/hipparcos_final.parquet'
+RUTA_VARIABLES = 'data/variables.parquet'
+# Directorio de los ficheros Arrow mapeados en memoria (ignorado por git)
+DIRECTORIO_CACHE = 'data/.cache'
+# Se incrementa al cambiar el esquema para que se regeneren los ficheros Arrow
+VERSION_ESQUEMA = 2
+
+TIPOS_ESPECTRALES = ('O', 'B', 'A', 'F', 'G', 'K', 'M')
+CLASES_ESPECTRALES = tuple(f'{tipo}{i}' for tipo in TIPOS_ESPECTRALES for i in range(10))
+# Columnas categóricas ordenadas y su orden; los valores que no aparecen se
+# añaden detrás, por orden alfabético
+CATEGORIAS = {
+    'Tipo_espectral': TIPOS_ESPECTRALES,
+    'Clase_espectral': CLASES_ESPECTRALES,
+}
+# Orden de las filas del fichero Arrow (los nulos al final)
+ORDEN_FILAS = ('Tipo_espectral', 'Clase_espectral')
+
+
+class Catalogo:
+    """
+    Acceso a las columnas de un parquet a través de su copia Arrow mapeada en memoria.
+
+    Args:
+        ruta (str): Ruta del fichero parquet.
+        directorio_cache (str): Directorio donde se guarda la copia Arrow.
+    """
+
+    def __init__(self, ruta=RUTA_CATALOGO, directorio_cache=DIRECTORIO_CACHE):
+        self.ruta = ruta
+        # El hash de la ruta absoluta distingue parquets con el mismo nombre en
+        # directorios distintos, que si no compartirían la copia Arrow
+        nombre = os.path.splitext(os.path.basename(ruta))[0]
+        huella = hashlib.sha256(os.path.abspath(ruta).encode()).hexdigest()[:8]
+        self.ruta_arrow = os.path.join(
+            directorio_cache, f'{nombre}.{huella}.v{VERSION_ESQUEMA}.arrow')
+        self._tabla = None
+        self._indices = None
+        self._version_tabla = None
+
+    @property
+    def tabla(self):
+        """
+        pyarrow.Table respaldada por el fichero mapeado en memoria. Si el parquet
+        ha cambiado desde la última lectura se vuelve a mapear y se descartan
+        los índices, para que los datos coincidan siempre con `version`.
+        """
+        version = self.version
+        if self._tabla is None or version != self._version_tabla:
+            if not _actualizado(self.ruta_arrow, self.ruta):
+                _convertir(self.ruta, self.ruta_arrow)
+            # El mapa no se cierra: los buffers de la tabla apuntan a él
+            fuente = pa.memory_map(self.ruta_arrow, 'r')
+            self._tabla = ipc.open_file(fuente).read_all()
+            self._indices = None
+            self._version_tabla = version
+        return self._tabla
+
+    @property
+    def indices(self):
+        """Índices secundarios (`utils.indices.IndicesCatalogo`) de la versión actual del catálogo."""
+        self.tabla
+        if self._indices is None:
+            self._indices = IndicesCatalogo(self)
+        return self._indices
+
+    @property
+    def version(self):
+        """
+        Token estable de la versión del catálogo (ruta, fecha de modificación y
+        tamaño del parquet). Cuesta lo mismo sea cual sea el tamaño del catálogo.
+        """
+        estado = os.stat(self.ruta)
+        return f'{os.path.abspath(self.ruta)}:{estado.st_mtime_ns}:{estado.st_size}'
+
+    @property
+    def nombres(self):
+        return self.tabla.column_names
+
+    def __len__(self):
+        return self.tabla.num_rows
+
+    def columnas(self, *nombres):
+        """
+        Devuelve las columnas pedidas como arrays de NumPy de solo lectura (sin
+        copia) o `pandas.Categorical` para las categóricas.
+
+        Returns:
+            dict: Un array por cada nombre, en el orden pedido.
+        """
+        return {nombre: _a_numpy(self.tabla.column(nombre)) for nombre in nombres}
+
+    def frame(self, columnas=None):
+        """
+        Devuelve un DataFrame con solo las columnas pedidas (todas si es None).
+        Las columnas numéricas apuntan al fichero mapeado y son de solo lectura.
+        """
+        tabla = self.tabla if columnas is None else self.tabla.select(list(columnas))
+        return tabla.to_pandas(split_blocks=True)
+
+
+# Tiempo acumulado calculando claves de caché a partir de handles de catálogo
+estadisticas_hash = {'llamadas': 0, 'segundos': 0.0}
+
+
+def clave_catalogo(catalogo):
+    """
+    Función de hash para `st.cache_data(hash_funcs={Catalogo: clave_catalogo})`:
+    la clave de caché es el token de versión en lugar del contenido.
+    """
+    inicio = time.perf_counter()
+    version = catalogo.version
+    estadisticas_hash['llamadas'] += 1
+    estadisticas_hash['segundos'] += time.perf_counter() - inicio
+    return version
+
+
+def tiempo_hash_dataframe(df, repeticiones=3):
+    """
+    Segundos que tarda Streamlit en calcular la clave de caché de `df` cuando se
+    pasa como argumento a una función cacheada: igual que Streamlit, por encima
+    de 50.000 filas hashea una muestra de 50.000 filas con `hash_pandas_object`.
+    """
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        muestra = df.sample(n=50000, random_state=0) if len(df) >= 50000 else df
+        pd.util.hash_pandas_object(muestra).to_numpy().tobytes()
+    return (time.perf_counter() - inicio) / repeticiones
+
+
+def _actualizado(destino, origen):
+    return os.path.exists(destino) and os.path.getmtime(destino) >= os.path.getmtime(origen)
+
+
+def _convertir(ruta_parquet, ruta_arrow):
+    # Reduce los tipos y escribe el fichero Arrow sin comprimir para poder mapearlo
+    tabla = pq.read_table(ruta_parquet).combine_chunks()
+    columnas, codigos = [], {}
+    for nombre, columna in zip(tabla.column_names, tabla.columns):
+        if pa.types.is_floating(columna.type):
+            # Sin nulos, las columnas se leen como vistas del mapa sin copiarlas
+            columna = columna.cast(pa.float32()).fill_null(np.float32(np.nan))
+        elif nombre in CATEGORIAS:
+            valores = _categorica_ordenada(columna, CATEGORIAS[nombre])
+            codigos[nombre] = np.where(valores.codes < 0, len(valores.categories), valores.codes)
+            columna = pa.array(valores)
+        elif pa.types.is_string(columna.type) or pa.types.is_large_string(columna.type):
+            columna = columna.dictionary_encode()
+        columnas.append(columna)
+    tabla = pa.table(columnas, names=tabla.column_names)
+    claves = [codigos[nombre] for nombre in ORDEN_FILAS if nombre in codigos]
+    if claves:
+        # np.lexsort ordena por la última clave primero
+        tabla = tabla.take(pa.array(np.lexsort(claves[::-1])))
+
+    # Se escribe en un temporal y se renombra para que otros procesos nunca
+    # mapeen un fichero a medio escribir
+    os.makedirs(os.path.dirname(ruta_arrow) or '.', exist_ok=True)
+    temporal = f'{ruta_arrow}.{os.getpid()}.tmp'
+    with pa.OSFile(temporal, 'wb') as destino:
+        with ipc.new_file(destino, tabla.schema) as escritor:
+            escritor.write_table(tabla)
+    os.replace(temporal, ruta_arrow)
+
+
+def _categorica_ordenada(columna, categorias):
+    valores = columna.to_pandas()
+    extra = sorted(set(valores.dropna()) - set(categorias))
+    return pd.Categorical(valores, categories=list(categorias) + extra, ordered=True)
+
+
+def _a_numpy(columna):
+    if pa.types.is_dictionary(columna.type):
+        return columna.to_pandas().array
+    return columna.to_numpy()
@@ -0,0 +1,125 @@
+'''
+Índice espacial de las posiciones del catálogo en el cielo.
+
+Las estrellas se guardan como vectores unitarios en un KD-tree, de modo que las
+búsquedas en un cono, en una caja de ascensión recta y declinación y de los
+vecinos más cercanos solo recorren las estrellas de la región. Las vistas de
+campos y constelaciones de la app se definen en `VISTAS`; añadir una nueva es
+registrar su caja con `registrar_vista`.
+'''
+
+from typing import NamedTuple
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class Vista(NamedTuple):
+    """
+    Campo del cielo que se muestra en la app.
+
+    Args:
+        titulo (str): Título de la figura.
+        range_ra (tuple): Ascensión recta [°] en el orden en que se dibuja el
+            eje (de mayor a menor, como en las cartas celestes).
+        range_dec (tuple): Declinación [°].
+        magnitud_limite (float): Solo se muestran las estrellas más brillantes.
+    """
+    titulo: str
+    range_ra: tuple
+    range_dec: tuple
+    magnitud_limite: float = 6.5
+
+
+# Vistas de la app, en el orden en que se muestran
+VISTAS = {
+    'Osa Mayor': Vista('Constelación de la Osa Mayor', (220, 140), (40, 70)),
+    'Orión': Vista('Constelación de Orión', (120, 40), (-20, 22)),
+}
+
+
+def registrar_vista(nombre, titulo, range_ra, range_dec, magnitud_limite=6.5):
+    """Añade una vista a `VISTAS` (o reemplaza la que tenga el mismo nombre)."""
+    VISTAS[nombre] = Vista(titulo, tuple(range_ra), tuple(range_dec), magnitud_limite)
+    return VISTAS[nombre]
+
+
+def vectores_unitarios(ra, dec):
+    """Vectores unitarios (n, 3) de las posiciones `ra`, `dec` en grados."""
+    ra, dec = np.radians(np.asarray(ra, dtype=float)), np.radians(np.asarray(dec, dtype=float))
+    cos_dec = np.cos(dec)
+    return np.column_stack([cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)])
+
+
+def _cuerda(radio):
+    # Distancia euclídea entre dos vectores unitarios separados `radio` grados
+    return 2 * np.sin(np.radians(min(radio, 180)) / 2)
+
+
+class IndiceCielo:
+    """
+    KD-tree sobre los vectores unitarios de las estrellas con posición. Las
+    búsquedas devuelven posiciones de fila del catálogo, ordenadas.
+
+    Args:
+        ra (array): Ascensión recta [°] de cada estrella.
+        dec (array): Declinación [°] de cada estrella.
+    """
+
+    def __init__(self, ra, dec):
+        self.ra = np.asarray(ra, dtype=float)
+        self.dec = np.asarray(dec, dtype=float)
+        # Las estrellas sin posición no entran en el árbol
+        self.filas = np.flatnonzero(np.isfinite(self.ra) & np.isfinite(self.dec))
+        self.arbol = cKDTree(vectores_unitarios(self.ra[self.filas], self.dec[self.filas]))
+
+    @classmethod
+    def desde_catalogo(cls, catalogo):
+        """Índice de un handle `Catalogo` con columnas RAdeg y DEdeg."""
+        columnas = catalogo.columnas('RAdeg', 'DEdeg')
+        return cls(columnas['RAdeg'], columnas['DEdeg'])
+
+    def __len__(self):
+        return len(self.filas)
+
+    def cono(self, ra, dec, radio):
+        """Filas de las estrellas a menos de `radio` grados de (`ra`, `dec`)."""
+        centro = vectores_unitarios([ra], [dec])[0]
+        encontrados = self.arbol.query_ball_point(centro, _cuerda(radio))
+        return np.sort(self.filas[encontrados])
+
+    def caja(self, range_ra, range_dec):
+        """
+        Filas de las estrellas dentro de la caja `range_ra` x `range_dec` [°]
+        (los extremos pueden venir en cualquier orden). Un intervalo de
+        ascensión recta que empieza en negativo, como (-10, 10), cruza el 0.
+        """
+        (ra0, ra1), (dec0, dec1) = sorted(range_ra), sorted(range_dec)
+        semi_ra, semi_dec = min((ra1 - ra0) / 2, 180), (dec1 - dec0) / 2
+        ra_c, dec_c = ra0 + semi_ra, dec0 + semi_dec
+        # Cono que contiene la caja: por la fórmula del haversine, ningún punto
+        # de la caja está más lejos del centro que este radio
+        seno = np.sqrt(np.sin(np.radians(semi_dec) / 2) ** 2
+                       + np.cos(np.radians(dec_c)) * np.sin(np.radians(semi_ra) / 2) ** 2)
+        radio = 180 if seno >= 1 else np.degrees(2 * np.arcsin(seno))
+
+        candidatos = self.cono(ra_c, dec_c, radio)
+        ra, dec = self.ra[candidatos], self.dec[candidatos]
+        dentro = (dec >= dec0) & (dec <= dec1) & ((ra - ra0) % 360 <= ra1 - ra0)
+        return candidatos[dentro]
+
+    def vecinos(self, ra, dec, k=1):
+        """
+        Las `k` estrellas más cercanas a (`ra`, `dec`), o todas si hay menos.
+
+        Returns:
+            tuple: Filas y separaciones en grados, de la más cercana a la más
+            lejana; vacías si `k` es 0 o el índice no tiene estrellas.
+        """
+        if k < 0:
+            raise ValueError(f'k debe ser mayor o igual que 0, no {k!r}')
+        k = min(k, len(self.filas))
+        if k == 0:
+            return self.filas[:0], np.empty(0)
+        distancias, encontrados = self.arbol.query(vectores_unitarios([ra], [dec])[0], k=[*range(1, k + 1)])
+        separaciones = np.degrees(2 * np.arcsin(np.minimum(distancias / 2, 1)))
+        return self.filas[encontrados], separaciones
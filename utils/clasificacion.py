@@ -0,0 +1,290 @@
+'''
+Clasificación por lotes del tipo espectral con los modelos entrenados de output/.
+
+Cada modelo se carga una sola vez. El catálogo de entrada (parquet o CSV) se lee
+por bloques, las columnas de los modelos se calculan con `utils.derivadas` y
+cada bloque se predice con una única llamada vectorizada por modelo. Las
+etiquetas y probabilidades se escriben en un parquet de salida, también por
+bloques, así que la memoria no depende del tamaño del catálogo.
+
+Con `--procesos N` los bloques se reparten entre N procesos, cada uno con todos
+los modelos cargados una vez, y a la salida se añade la tabla de votos que
+compara las predicciones de los modelos para cada estrella.
+
+Uso (desde la raíz del proyecto):
+
+    python -m utils.clasificacion data/hipparcos_final.parquet output/clasificacion.parquet
+    python -m utils.clasificacion data/hipparcos_final.parquet output/conjunto.parquet --procesos 4
+'''
+
+import argparse
+import collections
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils import servicio
+from utils.derivadas import ARGUMENTOS, COLUMNAS_MODELO, argumentos_desde_columnas, matriz_derivadas
+
+
+MODELOS = {
+    'Logistic Regression': 'output/Tipo_logistic_regression_model.pkl',
+    'Gradient Boost': 'output/Tipo_GradientBoost.pkl',
+}
+# Tipos espectrales en el orden de las clases 0..6 con las que se entrenaron
+# los modelos (orden alfabético del LabelEncoder)
+CLASES = np.array(['A', 'B', 'F', 'G', 'K', 'M', 'O'], dtype=object)
+# Columnas de la entrada que se copian tal cual a la salida para identificar cada estrella
+COLUMNAS_ID = ['HIP']
+TAMANO_BLOQUE = 100_000
+
+
+def cargar_modelos(rutas=MODELOS):
+    """
+    Carga cada modelo una vez. Las rutas pueden ser pickles o directorios
+    exportados con `utils.servicio`. Devuelve un dict nombre -> modelo.
+    """
+    return {nombre: servicio.cargar(ruta) if os.path.isdir(ruta) else joblib.load(ruta)
+            for nombre, ruta in rutas.items()}
+
+
+def leer_por_bloques(ruta, columnas=None, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Itera sobre `ruta` (parquet o CSV) en DataFrames de como mucho
+    `tamano_bloque` filas, leyendo solo las columnas pedidas que existan.
+    """
+    if ruta.endswith('.csv'):
+        usecols = None if columnas is None else (lambda c: c in columnas)
+        yield from pd.read_csv(ruta, usecols=usecols, chunksize=tamano_bloque)
+        return
+    fichero = pq.ParquetFile(ruta)
+    if columnas is not None:
+        columnas = [c for c in fichero.schema_arrow.names if c in columnas]
+    for lote in fichero.iter_batches(batch_size=tamano_bloque, columns=columnas):
+        yield lote.to_pandas()
+
+
+def nombre_columna(modelo):
+    # 'Gradient Boost' -> 'gradient_boost'
+    return modelo.lower().replace(' ', '_')
+
+
+def clasificar_bloque(modelos, bloque, tiempos=None):
+    """
+    Predice el tipo espectral de las estrellas de `bloque` con cada modelo.
+
+    Las filas a las que les falta alguna columna de los modelos quedan con la
+    etiqueta y las probabilidades a nulo.
+
+    Args:
+        modelos (dict): Nombre -> modelo ya cargado.
+        bloque (pd.DataFrame): Debe tener al menos Vmag, B-V y Plx o d.
+        tiempos (dict, optional): Segundos acumulados de predicción por modelo.
+
+    Returns:
+        pd.DataFrame: Columnas de identificación más `<modelo>` (tipo predicho)
+        y `<modelo>_p_<tipo>` (probabilidad de cada tipo) por cada modelo.
+    """
+    X = matriz_derivadas(**argumentos_desde_columnas(bloque))
+    validas = np.isfinite(X).all(axis=1)
+    # Los modelos se ajustaron con un DataFrame; envolver la matriz no la copia
+    X = pd.DataFrame(X[validas], columns=COLUMNAS_MODELO)
+
+    salida = bloque[[c for c in COLUMNAS_ID if c in bloque]].reset_index(drop=True)
+    for nombre, modelo in modelos.items():
+        inicio = time.perf_counter()
+        etiquetas = np.full(len(bloque), None, dtype=object)
+        probabilidades = np.full((len(bloque), len(CLASES)), np.nan, dtype=np.float32)
+        if len(X):
+            etiquetas[validas] = CLASES[modelo.predict(X).astype(int)]
+            if hasattr(modelo, 'predict_proba'):
+                probabilidades[validas] = modelo.predict_proba(X)
+        if tiempos is not None:
+            tiempos[nombre] = tiempos.get(nombre, 0.0) + time.perf_counter() - inicio
+
+        columna = nombre_columna(nombre)
+        salida[columna] = etiquetas
+        for i, clase in enumerate(CLASES):
+            salida[f'{columna}_p_{clase}'] = probabilidades[:, i]
+    return salida
+
+
+def clasificar_catalogo(entrada, salida, modelos=None, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Clasifica todo el catálogo `entrada` y escribe el resultado en el parquet `salida`.
+
+    Args:
+        entrada (str): Parquet o CSV con las magnitudes de las estrellas.
+        salida (str): Ruta del parquet de salida.
+        modelos (dict, optional): Nombre -> modelo cargado. Por defecto los de `MODELOS`.
+        tamano_bloque (int): Filas por bloque de lectura y grupo de filas de salida.
+
+    Returns:
+        dict: Por cada modelo, filas clasificadas, segundos de predicción y filas por segundo.
+    """
+    if modelos is None:
+        modelos = cargar_modelos()
+    columnas = set(ARGUMENTOS.values()) | set(COLUMNAS_ID)
+
+    filas = 0
+    tiempos = {}
+    escritor = None
+    os.makedirs(os.path.dirname(salida) or '.', exist_ok=True)
+    try:
+        for bloque in leer_por_bloques(entrada, columnas, tamano_bloque):
+            tabla = pa.Table.from_pandas(
+                clasificar_bloque(modelos, bloque, tiempos), preserve_index=False)
+            if escritor is None:
+                escritor = pq.ParquetWriter(salida, tabla.schema)
+            escritor.write_table(tabla)
+            filas += len(bloque)
+    finally:
+        if escritor is not None:
+            escritor.close()
+
+    return {nombre: {'filas': filas,
+                     'segundos': tiempos.get(nombre, 0.0),
+                     'filas_por_segundo': filas / tiempos[nombre] if tiempos.get(nombre) else float('nan')}
+            for nombre in modelos}
+
+
+def tabla_votos(predicciones, modelos):
+    """
+    Combina las predicciones de varios modelos para cada estrella.
+
+    Args:
+        predicciones (pd.DataFrame): Salida de `clasificar_bloque`.
+        modelos (list): Nombres de los modelos que se comparan.
+
+    Returns:
+        pd.DataFrame: `voto` (tipo más votado; los empates se deciden por la
+        suma de probabilidades), `votos` (modelos que lo predicen), `acuerdo`
+        (fracción de modelos con predicción que coinciden con el voto) y
+        `unanime`.
+    """
+    columnas = [nombre_columna(m) for m in modelos]
+    codigos = np.column_stack([
+        pd.Categorical(predicciones[c], categories=CLASES).codes for c in columnas])
+    # Votos por estrella y tipo: (n_estrellas, n_tipos)
+    conteo = np.stack([(codigos == i).sum(axis=1) for i in range(len(CLASES))], axis=1)
+    probabilidad = sum(
+        np.nan_to_num(predicciones[[f'{c}_p_{clase}' for clase in CLASES]].to_numpy())
+        for c in columnas)
+    # El conteo domina y la probabilidad (siempre < n_modelos) solo desempata
+    voto = np.argmax(conteo * (len(columnas) + 1) + probabilidad, axis=1)
+    votos = conteo[np.arange(len(conteo)), voto]
+    con_prediccion = (codigos >= 0).sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        acuerdo = (votos / con_prediccion).astype(np.float32)
+    return pd.DataFrame({
+        'voto': np.where(con_prediccion > 0, CLASES[voto], None),
+        'votos': votos.astype(np.int8),
+        'acuerdo': acuerdo,
+        'unanime': (votos == len(columnas)),
+    })
+
+
+# Modelos de cada proceso del pool, cargados una vez en `_iniciar_proceso`
+_modelos_proceso = None
+
+
+def _iniciar_proceso(rutas):
+    global _modelos_proceso
+    _modelos_proceso = cargar_modelos(rutas)
+
+
+def _clasificar_en_proceso(bloque):
+    tiempos = {}
+    predicciones = clasificar_bloque(_modelos_proceso, bloque, tiempos)
+    return pd.concat([predicciones, tabla_votos(predicciones, list(_modelos_proceso))], axis=1), tiempos
+
+
+def clasificar_conjunto(entrada, salida, rutas=MODELOS, n_procesos=None, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Clasifica `entrada` con todos los modelos de `rutas` a la vez repartiendo los
+    bloques entre `n_procesos` procesos, y escribe en `salida` las predicciones
+    de cada modelo junto con la tabla de votos (`tabla_votos`).
+
+    Solo hay unos pocos bloques en vuelo a la vez, así que la memoria no crece
+    con el tamaño del catálogo. El orden de las filas de salida es el de entrada.
+
+    Returns:
+        dict: Filas, segundos totales y filas por segundo del conjunto, y los
+        segundos de predicción acumulados por modelo sumando todos los procesos.
+    """
+    n_procesos = n_procesos or os.cpu_count()
+    columnas = set(ARGUMENTOS.values()) | set(COLUMNAS_ID)
+    os.makedirs(os.path.dirname(salida) or '.', exist_ok=True)
+
+    inicio = time.perf_counter()
+    filas = 0
+    tiempos = collections.Counter()
+    escritor = None
+
+    def escribir(futuro):
+        nonlocal escritor, filas
+        resultado, tiempos_bloque = futuro.result()
+        tabla = pa.Table.from_pandas(resultado, preserve_index=False)
+        if escritor is None:
+            escritor = pq.ParquetWriter(salida, tabla.schema)
+        escritor.write_table(tabla)
+        filas += len(resultado)
+        tiempos.update(tiempos_bloque)
+
+    try:
+        with ProcessPoolExecutor(n_procesos, initializer=_iniciar_proceso,
+                                 initargs=(rutas,)) as pool:
+            pendientes = collections.deque()
+            for bloque in leer_por_bloques(entrada, columnas, tamano_bloque):
+                pendientes.append(pool.submit(_clasificar_en_proceso, bloque))
+                # Dos bloques por proceso mantienen ocupado el pool sin acumular memoria
+                if len(pendientes) >= 2 * n_procesos:
+                    escribir(pendientes.popleft())
+            while pendientes:
+                escribir(pendientes.popleft())
+    finally:
+        if escritor is not None:
+            escritor.close()
+
+    segundos = time.perf_counter() - inicio
+    return {'filas': filas, 'segundos': segundos, 'filas_por_segundo': filas / segundos,
+            'segundos_por_modelo': dict(tiempos)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Clasifica por lotes el tipo espectral de las estrellas de un catálogo.')
+    parser.add_argument('entrada', help='Parquet o CSV con Vmag, B-V y Plx (o d)')
+    parser.add_argument('salida', help='Parquet donde se escriben las predicciones')
+    parser.add_argument('--modelo', action='append', metavar='NOMBRE=RUTA',
+                        help='Modelo a usar (repetible). Por defecto los de output/')
+    parser.add_argument('--tamano-bloque', type=int, default=TAMANO_BLOQUE)
+    parser.add_argument('--procesos', type=int, default=None,
+                        help='Clasifica con todos los modelos en N procesos y añade la tabla de votos')
+    args = parser.parse_args(argv)
+
+    rutas = dict(m.split('=', 1) for m in args.modelo) if args.modelo else MODELOS
+    if args.procesos:
+        r = clasificar_conjunto(args.entrada, args.salida, rutas, args.procesos, args.tamano_bloque)
+        print(f'{len(rutas)} modelos en {args.procesos} procesos: {r["filas"]} filas en '
+              f'{r["segundos"]:.2f} s ({r["filas_por_segundo"]:,.0f} filas/s)')
+        return
+
+    inicio = time.perf_counter()
+    modelos = cargar_modelos(rutas)
+    print(f'{len(modelos)} modelos cargados en {time.perf_counter() - inicio:.2f} s')
+
+    rendimiento = clasificar_catalogo(args.entrada, args.salida, modelos, args.tamano_bloque)
+    for nombre, r in rendimiento.items():
+        print(f'{nombre}: {r["filas"]} filas en {r["segundos"]:.2f} s '
+              f'({r["filas_por_segundo"]:,.0f} filas/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+'''
+Cubos de recuentos precalculados para los histogramas de la app.
+
+Un cubo cuenta las estrellas de cada celda de la rejilla formada por varios ejes,
+categóricos (tipo espectral, clase espectral, tipo de variabilidad) o numéricos
+agrupados en intervalos (magnitud, período). Se construye con un único
+`np.bincount` sobre el índice plano de la celda de cada estrella, y cualquier
+histograma, apilado o acumulado, de esos ejes es una suma del cubo: las figuras
+solo llevan unos cientos de recuentos en lugar de los valores de cada estrella.
+'''
+
+import numpy as np
+import pandas as pd
+
+
+class CuboHistograma:
+    """
+    Recuentos por celda de varios ejes. Cada eje tiene además una última celda
+    para los nulos y los valores fuera de sus categorías o intervalos, de modo
+    que los marginales de un eje no pierden las estrellas que faltan en otro.
+
+    Args:
+        columnas (dict): Nombre del eje -> valores de cada estrella.
+        ejes (dict): Nombre del eje -> lista de categorías (None para usar las
+            de la columna categórica) o array con los bordes de los intervalos.
+    """
+
+    def __init__(self, columnas, ejes):
+        self.ejes = {}
+        codigos = []
+        for nombre, eje in ejes.items():
+            valores = columnas[nombre]
+            if eje is None or not np.issubdtype(np.asarray(eje).dtype, np.number):
+                categorias = list(eje) if eje is not None else list(valores.categories)
+                self.ejes[nombre] = categorias
+                codigo = np.asarray(pd.Categorical(valores, categories=categorias).codes, dtype=np.intp)
+                codigo[codigo < 0] = len(categorias)
+            else:
+                bordes = np.asarray(eje, dtype=float)
+                self.ejes[nombre] = bordes
+                valores = np.asarray(valores, dtype=float)
+                codigo = np.searchsorted(bordes, valores, 'right') - 1
+                # El borde derecho del último intervalo es cerrado, como en np.histogram
+                codigo[valores == bordes[-1]] = len(bordes) - 2
+                codigo[(codigo < 0) | (codigo > len(bordes) - 2) | np.isnan(valores)] = len(bordes) - 1
+            codigos.append(codigo)
+
+        forma = tuple(self._tamano(nombre) + 1 for nombre in self.ejes)
+        plano = np.ravel_multi_index(codigos, forma)
+        self.recuentos = np.bincount(plano, minlength=int(np.prod(forma))).reshape(forma)
+
+    @classmethod
+    def desde_catalogo(cls, catalogo, ejes):
+        """Cubo de las columnas `ejes` de un handle `Catalogo`."""
+        return cls(catalogo.columnas(*ejes), ejes)
+
+    def _tamano(self, nombre):
+        eje = self.ejes[nombre]
+        return len(eje) - 1 if isinstance(eje, np.ndarray) else len(eje)
+
+    def marginal(self, *nombres, nulos=False):
+        """
+        Recuentos por los ejes `nombres` (en ese orden), sumando el resto. Sin
+        `nulos` se quita la celda de nulos de los ejes pedidos.
+        """
+        orden = list(self.ejes)
+        resto = tuple(i for i, nombre in enumerate(orden) if nombre not in nombres)
+        recuentos = self.recuentos.sum(axis=resto)
+        quedan = [nombre for nombre in orden if nombre in nombres]
+        recuentos = np.transpose(recuentos, [quedan.index(nombre) for nombre in nombres])
+        if not nulos:
+            recuentos = recuentos[tuple(slice(0, self._tamano(nombre)) for nombre in nombres)]
+        return recuentos
+
+    def etiquetas(self, nombre):
+        """Categorías del eje o, si es numérico, el centro de cada intervalo."""
+        eje = self.ejes[nombre]
+        if isinstance(eje, np.ndarray):
+            return (eje[:-1] + eje[1:]) / 2
+        return eje
+
+    def anchura(self, nombre):
+        """Anchura de los intervalos de un eje numérico."""
+        return np.diff(self.ejes[nombre])
+
+
+def intervalos(valores, anchura=None, n=None):
+    """
+    Bordes de intervalos que cubren los valores: de anchura fija alineados con
+    múltiplos de `anchura`, o `n` intervalos iguales entre el mínimo y el máximo.
+    """
+    valores = np.asarray(valores, dtype=float)
+    minimo, maximo = float(np.nanmin(valores)), float(np.nanmax(valores))
+    if anchura is not None:
+        inicio, fin = np.floor(minimo / anchura), np.ceil(maximo / anchura)
+        return np.arange(inicio, max(fin, inicio + 1) + 1) * anchura
+    return np.linspace(minimo, maximo if maximo > minimo else minimo + 1, n + 1)
@@ -0,0 +1,140 @@
+'''
+Cálculo vectorizado de las columnas astrofísicas derivadas del catálogo Hipparcos
+(distancia, magnitudes absolutas, temperatura y aproximaciones de índices de color).
+Lo usan tanto el preprocesamiento (utils/funciones.py) como la página de Machine Learning.
+'''
+
+import math
+import numpy as np
+
+
+# Orden de las columnas con las que se entrenaron los modelos de output/
+COLUMNAS_MODELO = ['Vmag', 'BTmag', 'VTmag', 'B-V', 'V-I',
+                   'Hpmag', '(V-I)red', 'd', 'T', 'M_v', 'M_Hip']
+
+TIPOS_ESPECTRALES = 'OBAFGKM'
+
+
+def columnas_derivadas(Vmag, B_V, Plx=None, d=None, V_I=None, Hpmag=None,
+                       BTmag=None, VTmag=None, V_I_red=None):
+    """
+    Calcula en una sola llamada, con arrays de NumPy en float32, todas las
+    columnas derivadas a partir de las magnitudes y la paralaje:
+
+    - d = 1000 / Plx (Plx en mas, d en pc; paralajes no positivas dan NaN)
+    - T = 8540 / ((B-V) + 0.865)
+    - M_v = Vmag - 5 log10(d) + 5 y M_Hip = Hpmag - 5 log10(d) + 5
+
+    Las bandas que no se pasen (BTmag, VTmag, V-I, (V-I)red, Hpmag) se aproximan
+    con los ajustes lineales sobre Vmag y B-V usados en la página de Machine Learning.
+
+    Args:
+        Vmag, B_V: Magnitud visual aparente e índice de color B-V.
+        Plx: Paralaje en milisegundos de arco. Se puede pasar `d` en su lugar.
+        d: Distancia en parsecs, si ya se conoce.
+        V_I, Hpmag, BTmag, VTmag, V_I_red: Bandas medidas, opcionales.
+
+    Returns:
+        dict: Un array float32 por cada columna de `COLUMNAS_MODELO`.
+    """
+    Vmag = np.asarray(Vmag, dtype=np.float32)
+    B_V = np.asarray(B_V, dtype=np.float32)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if d is None:
+            Plx = np.asarray(Plx, dtype=np.float32)
+            d = np.where(Plx > 0, np.float32(1000) / Plx, np.float32(np.nan))
+        else:
+            d = np.asarray(d, dtype=np.float32)
+        # Módulo de distancia, compartido por las dos magnitudes absolutas
+        modulo = np.float32(5) * np.log10(d) - np.float32(5)
+
+        V_I = _banda(V_I, lambda: np.float32(1.0595) * B_V + np.float32(0.01201))
+        Hpmag = _banda(Hpmag, lambda: np.float32(1.00564) * Vmag + np.float32(0.05840))
+
+        return {
+            'Vmag': Vmag,
+            'BTmag': _banda(BTmag, lambda: np.float32(0.88114) * Vmag + np.float32(1.78857)),
+            'VTmag': _banda(VTmag, lambda: np.float32(0.8588) * Vmag + np.float32(1.18088)),
+            'B-V': B_V,
+            'V-I': V_I,
+            'Hpmag': Hpmag,
+            '(V-I)red': _banda(V_I_red, lambda: np.float32(1.0024) * V_I + np.float32(0.01201)),
+            'd': d,
+            'T': np.float32(8540) / (B_V + np.float32(0.865)),
+            'M_v': Vmag - modulo,
+            'M_Hip': Hpmag - modulo,
+        }
+
+
+def matriz_derivadas(*args, **kwargs):
+    """
+    Igual que `columnas_derivadas` pero devuelve directamente la matriz
+    (n_estrellas, 11) en float32 con las columnas en el orden de `COLUMNAS_MODELO`,
+    lista para pasarla a los modelos.
+    """
+    columnas = columnas_derivadas(*args, **kwargs)
+    return np.column_stack(np.broadcast_arrays(*(columnas[c] for c in COLUMNAS_MODELO)))
+
+
+def fila_derivadas(Vmag, B_V, d, fila=None):
+    """
+    Versión escalar de `matriz_derivadas(Vmag, B_V, d=d)` para una sola estrella,
+    pensada para la predicción interactiva: rellena la fila (1, 11) float32
+    `fila` ya reservada sin crear arrays intermedios.
+
+    Returns:
+        np.ndarray: `fila`, o una nueva si no se pasa.
+    """
+    if fila is None:
+        fila = np.empty((1, len(COLUMNAS_MODELO)), dtype=np.float32)
+    V_I = 1.0595 * B_V + 0.01201
+    Hpmag = 1.00564 * Vmag + 0.05840
+    modulo = 5 * math.log10(d) - 5 if d > 0 else math.nan
+    fila[0] = (Vmag, 0.88114 * Vmag + 1.78857, 0.8588 * Vmag + 1.18088, B_V, V_I, Hpmag,
+               1.0024 * V_I + 0.01201, d, 8540 / (B_V + 0.865), Vmag - modulo, Hpmag - modulo)
+    return fila
+
+
+# Argumento de `columnas_derivadas` correspondiente a cada columna del catálogo
+ARGUMENTOS = {'Vmag': 'Vmag', 'B_V': 'B-V', 'Plx': 'Plx', 'd': 'd', 'V_I': 'V-I', 'Hpmag': 'Hpmag',
+              'BTmag': 'BTmag', 'VTmag': 'VTmag', 'V_I_red': '(V-I)red'}
+
+
+def argumentos_desde_columnas(columnas):
+    """
+    Argumentos de `columnas_derivadas` tomados de las columnas presentes en
+    `columnas` (un DataFrame o un dict de arrays). Si está `d` no se usa `Plx`.
+    """
+    argumentos = {arg: columnas[col] for arg, col in ARGUMENTOS.items() if col in columnas}
+    if 'd' in argumentos:
+        argumentos.pop('Plx', None)
+    return argumentos
+
+
+def clasificacion_espectral(SpType):
+    """
+    Extrae el tipo espectral (letra O, B, A, F, G, K o M) y la clase espectral
+    (letra y subtipo, p. ej. 'K3') de la columna SpType del catálogo.
+
+    Args:
+        SpType: Array o Serie de cadenas con el tipo espectral completo.
+
+    Returns:
+        tuple: Dos arrays de objetos (tipo, clase) con None donde no se reconoce.
+    """
+    # Los dos primeros caracteres bastan; NaN y None se convierten en 'na' y 'No',
+    # que no empiezan por un tipo espectral válido
+    prefijo = np.asarray(SpType, dtype=object).astype('<U2')
+    letra, subtipo = prefijo.view('<U1').reshape(-1, 2).T
+    tiene_tipo = np.isin(letra, list(TIPOS_ESPECTRALES))
+    tiene_clase = tiene_tipo & np.char.isdigit(subtipo)
+    return (np.where(tiene_tipo, letra, None).astype(object),
+            np.where(tiene_clase, prefijo, None).astype(object))
+
+
+def _banda(valor, aproximacion):
+    # Usa la banda medida si se ha pasado y, si no, su aproximación lineal
+    if valor is None:
+        return aproximacion()
+    return np.asarray(valor, dtype=np.float32)
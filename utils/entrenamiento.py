@@ -0,0 +1,459 @@
+'''
+Entrenamiento reproducible de los clasificadores del tipo espectral.
+
+Sustituye a las celdas de ML_hipparcos.ipynb y ML_2.ipynb: un único
+LabelEncoder equivalente (tipos en orden alfabético, los de `CLASES`), una
+partición con `cortar_en_tiritas`, un Pipeline con el escalado de `pure`
+delante del clasificador para las familias que lo necesitan y evaluación con
+accuracy y F1 macro en el conjunto de prueba. Las familias se entrenan a la vez
+en procesos separados y los hiperparámetros de cada una se buscan con successive
+halving (HalvingRandomSearchCV), repartiendo los núcleos entre las búsquedas.
+Como el escalado forma parte del Pipeline, se ajusta dentro de cada partición de
+la validación cruzada; el Pipeline guarda en una caché temporal el escalado de
+cada partición, de modo que los candidatos que comparten partición no vuelven a
+escalar los datos. Cada ejecución se guarda como una versión nueva en output/entrenamiento/<versión>/
+con un pickle por familia y un metricas.json.
+
+La partición se calcula una vez por fichero de datos y semilla y se guarda en
+data/.cache/entrenamiento, de modo que todas las familias, y las siguientes
+ejecuciones, la reutilizan.
+
+Con `--incremental <versión>` no se vuelve a buscar nada: se detectan las filas
+añadidas al final del catálogo desde esa versión y se actualizan sus modelos.
+Los que admiten `partial_fit` aprenden solo de las filas nuevas, el Gradient
+Boosting añade árboles con `warm_start` y el resto se reentrena con sus mejores
+hiperparámetros solo si la deriva (PSI) de alguna columna supera el umbral.
+
+Uso (desde la raíz del proyecto):
+
+    python -m utils.entrenamiento --familias "Logistic Regression" "Gradient Boost"
+    python -m utils.entrenamiento --incremental output/entrenamiento/<versión>
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from scipy import stats
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.base import clone
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.model_selection import HalvingRandomSearchCV, StratifiedKFold
+from sklearn.naive_bayes import GaussianNB
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.svm import SVC
+
+from utils.cache_figuras import huella_fichero
+from utils.catalogo import DIRECTORIO_CACHE
+from utils.clasificacion import CLASES, nombre_columna
+from utils.derivadas import COLUMNAS_MODELO
+from utils.funciones import cortar_en_tiritas, escalador
+
+
+RUTA_DATOS = 'data/selected_data.parquet'
+DIRECTORIO_ENTRENAMIENTO = 'output/entrenamiento'
+COLUMNA_OBJETIVO = 'Tipo_espectral'
+# Partición de los cuadernos originales
+TEST_SIZE = 0.3
+RANDOM_STATE = 314
+# Population Stability Index a partir del cual se considera que una columna ha derivado
+UMBRAL_PSI = 0.2
+# Intervalos del PSI y filas nuevas necesarias para calcularlo: con menos, casi
+# todos los intervalos quedan vacíos y el PSI supera el umbral sin haber deriva
+INTERVALOS_PSI = 10
+MIN_FILAS_PSI = 10 * INTERVALOS_PSI
+# Por debajo de estas filas nuevas no se parten: todas van al entrenamiento
+MIN_FILAS_PARTICION = 10
+# Árboles que se añaden al Gradient Boosting, en fracción de los que ya tiene
+FRACCION_ARBOLES = 0.1
+
+memoria = joblib.Memory(os.path.join(DIRECTORIO_CACHE, 'entrenamiento'), verbose=0)
+
+
+def _xgboost(**kwargs):
+    # xgboost es opcional: si no está instalado la familia se omite
+    from xgboost import XGBClassifier
+    return XGBClassifier(tree_method='hist', n_jobs=1, **kwargs)
+
+
+# Estimador, escalado de `pure` que necesita (None, 'minmax' o 'standard') y espacio de búsqueda
+FAMILIAS = {
+    'Logistic Regression': (
+        lambda rs: LogisticRegression(max_iter=3000), 'standard',
+        {'C': stats.loguniform(1e-3, 1e3)}),
+    'SGD': (
+        lambda rs: SGDClassifier(loss='log_loss', random_state=rs), 'standard',
+        {'alpha': stats.loguniform(1e-6, 1e-2), 'penalty': ['l2', 'l1', 'elasticnet']}),
+    'Naive Bayes': (
+        lambda rs: GaussianNB(), None,
+        {'var_smoothing': stats.loguniform(1e-11, 1e-6)}),
+    'KNN': (
+        lambda rs: KNeighborsClassifier(), 'standard',
+        {'n_neighbors': stats.randint(2, 40), 'weights': ['uniform', 'distance']}),
+    'SVC': (
+        lambda rs: SVC(kernel='rbf', probability=True, random_state=rs), 'standard',
+        {'C': stats.loguniform(1e-2, 1e2), 'gamma': stats.loguniform(1e-3, 1e0)}),
+    'Random Forest': (
+        lambda rs: RandomForestClassifier(random_state=rs), None,
+        {'n_estimators': stats.randint(50, 400), 'max_depth': stats.randint(4, 16),
+         'criterion': ['gini', 'entropy']}),
+    'Gradient Boost': (
+        lambda rs: GradientBoostingClassifier(random_state=rs), None,
+        {'n_estimators': stats.randint(50, 300), 'max_depth': stats.randint(2, 5),
+         'learning_rate': stats.loguniform(1e-2, 3e-1), 'min_samples_leaf': stats.randint(1, 20)}),
+    'XGBoost': (
+        lambda rs: _xgboost(random_state=rs), None,
+        {'n_estimators': stats.randint(100, 1000), 'max_depth': stats.randint(2, 8),
+         'learning_rate': stats.loguniform(5e-3, 3e-1), 'subsample': stats.uniform(0.5, 0.5),
+         'colsample_bytree': stats.uniform(0.5, 0.5)}),
+}
+
+
+def leer_datos(ruta):
+    """Columnas de los modelos y tipo espectral del catálogo, en el orden del fichero."""
+    return pd.read_parquet(ruta, columns=COLUMNAS_MODELO + [COLUMNA_OBJETIVO])
+
+
+def huella_filas(df):
+    """Hash del contenido de las filas de `df`, para reconocer un catálogo ampliado."""
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()
+
+
+def codificar(df):
+    """Filas completas de `df` con el tipo espectral codificado y las columnas en float32."""
+    df = df.dropna()
+    # Un único codificador para el objetivo: código = posición en CLASES
+    df[COLUMNA_OBJETIVO] = pd.Categorical(df[COLUMNA_OBJETIVO], categories=CLASES).codes
+    df[COLUMNAS_MODELO] = df[COLUMNAS_MODELO].astype(np.float32)
+    return df
+
+
+def partir(df, test_size=TEST_SIZE, random_state=RANDOM_STATE):
+    """Codifica el tipo espectral y parte las filas completas con `cortar_en_tiritas`."""
+    return cortar_en_tiritas(codificar(df), COLUMNA_OBJETIVO, test_size=test_size,
+                             random_state=random_state)
+
+
+@memoria.cache
+def preparar_datos(ruta, huella, filas=None, test_size=TEST_SIZE, random_state=RANDOM_STATE):
+    """
+    Lee el catálogo (solo sus primeras `filas` si se indica), codifica el tipo
+    espectral y lo parte en entrenamiento y prueba con la semilla
+    `random_state`. `huella` (hash del fichero) forma parte de la clave de la
+    caché en disco.
+
+    Returns:
+        dict: X_train, X_test, y_train e y_test.
+    """
+    df = leer_datos(ruta)
+    X_train, X_test, y_train, y_test = partir(
+        df.iloc[:filas], test_size=test_size, random_state=random_state)
+    return {'X_train': X_train, 'X_test': X_test, 'y_train': y_train, 'y_test': y_test}
+
+
+def entrenar_familia(familia, datos, candidatos=32, cv=5, n_jobs=-1, max_filas=None,
+                     random_state=RANDOM_STATE):
+    """
+    Busca los hiperparámetros de `familia` con successive halving sobre el
+    número de filas y evalúa el mejor modelo en el conjunto de prueba.
+
+    Args:
+        familia (str): Clave de `FAMILIAS`.
+        datos (dict): Salida de `preparar_datos`.
+        candidatos (int): Combinaciones de hiperparámetros de la primera ronda.
+        cv (int): Particiones de la validación cruzada.
+        n_jobs (int): Procesos de la búsqueda (-1 = todos los núcleos).
+        max_filas (int, optional): Filas de la última ronda; por defecto todas.
+
+    Returns:
+        tuple: (modelo que predice sobre las columnas sin escalar, métricas)
+    """
+    crear, escalado, espacio = FAMILIAS[familia]
+    X_train, X_test = datos['X_train'], datos['X_test']
+    y_train, y_test = datos['y_train'], datos['y_test']
+    with tempfile.TemporaryDirectory() as cache_escalado:
+        estimador = crear(random_state)
+        if escalado:
+            # El scaler se ajusta dentro de cada partición y entrega un DataFrame,
+            # de modo que el clasificador ve los nombres de las columnas. Dentro de
+            # una ronda todos los candidatos usan las mismas filas y particiones,
+            # así que el escalado de cada partición se calcula una vez por ronda
+            estimador = Pipeline([('scaler', escalador(escalado).set_output(transform='pandas')),
+                                  ('modelo', estimador)],
+                                 memory=joblib.Memory(cache_escalado, verbose=0))
+            espacio = {f'modelo__{parametro}': valores for parametro, valores in espacio.items()}
+
+        # Las mismas particiones para todos los candidatos y familias
+        busqueda = HalvingRandomSearchCV(
+            estimador, espacio, n_candidates=candidatos, factor=3,
+            resource='n_samples', max_resources=max_filas or 'auto', min_resources='exhaust',
+            cv=StratifiedKFold(cv, shuffle=True, random_state=random_state),
+            scoring='f1_macro', n_jobs=n_jobs, random_state=random_state)
+        inicio = time.perf_counter()
+        busqueda.fit(X_train, y_train)
+        segundos = time.perf_counter() - inicio
+
+    mejor = busqueda.best_estimator_
+    if escalado:
+        # La caché desaparece con el directorio temporal
+        mejor.set_params(memory=None)
+    # El tipo espectral es una clase, no una magnitud: solo métricas de clasificación
+    y_pred = mejor.predict(X_test)
+    metricas = {
+        'accuracy': accuracy_score(y_test, y_pred),
+        'f1_macro': f1_score(y_test, y_pred, average='macro'),
+        'cv_f1_macro': busqueda.best_score_,
+        'parametros': busqueda.best_params_,
+        'candidatos_evaluados': len(busqueda.cv_results_['params']),
+        'segundos_entrenamiento': segundos,
+    }
+    return mejor, metricas
+
+
+def entrenar(familias=None, ruta=RUTA_DATOS, directorio=DIRECTORIO_ENTRENAMIENTO,
+             random_state=RANDOM_STATE, **kwargs):
+    """
+    Entrena las familias pedidas (todas por defecto) y guarda una versión nueva
+    de los artefactos en `directorio`/<versión>/. `random_state` fija tanto la
+    partición como la búsqueda. Las familias se entrenan en paralelo y los
+    `n_jobs` núcleos se reparten entre ellas.
+
+    Returns:
+        str: Directorio de la versión creada.
+    """
+    huella = huella_fichero(ruta)
+    datos = preparar_datos(ruta, huella, random_state=random_state)
+    version = f'{datetime.now():%Y%m%d-%H%M%S}-{huella[:8]}'
+    destino = os.path.join(directorio, version)
+    os.makedirs(destino, exist_ok=True)
+
+    df = leer_datos(ruta)
+    resumen = {'version': version, 'datos': ruta, 'hash_datos': huella,
+               # Para detectar después las filas añadidas al catálogo
+               'filas_datos': len(df), 'hash_filas': huella_filas(df),
+               'filas_entrenamiento': len(datos['y_train']), 'filas_prueba': len(datos['y_test']),
+               'sklearn': sklearn.__version__, 'columnas': COLUMNAS_MODELO,
+               'clases': CLASES.tolist(), 'random_state': random_state,
+               'parametros_busqueda': kwargs, 'familias': {}}
+
+    familias = list(familias or FAMILIAS)
+    n_jobs = joblib.effective_n_jobs(kwargs.get('n_jobs', -1))
+    procesos = min(len(familias), n_jobs)
+    kwargs_familia = {**kwargs, 'n_jobs': max(1, n_jobs // procesos)}
+    tareas = (joblib.delayed(_entrenar_o_omitir)(familia, datos, random_state=random_state,
+                                                 **kwargs_familia)
+              for familia in familias)
+    # Los resultados llegan en el orden de `familias` a medida que terminan
+    resultados = joblib.Parallel(n_jobs=procesos, return_as='generator')(tareas)
+    for familia, resultado in zip(familias, resultados):
+        if isinstance(resultado, ImportError):
+            print(f'{familia}: omitida ({resultado})')
+            continue
+        modelo, metricas = resultado
+        ruta_modelo = os.path.join(destino, f'Tipo_{nombre_columna(familia)}.pkl')
+        joblib.dump(modelo, ruta_modelo)
+        resumen['familias'][familia] = {'artefacto': ruta_modelo, **metricas}
+        print(f'{familia}: f1_macro {metricas["f1_macro"]:.3f}, accuracy {metricas["accuracy"]:.3f} '
+              f'en {metricas["segundos_entrenamiento"]:.1f} s')
+        # Se reescribe tras cada familia para no perder lo entrenado si se interrumpe
+        with open(os.path.join(destino, 'metricas.json'), 'w', encoding='utf-8') as f:
+            json.dump(resumen, f, indent=1, default=_a_json)
+    return destino
+
+
+def _entrenar_o_omitir(familia, datos, **kwargs):
+    # En un proceso aparte: la falta de una dependencia opcional se devuelve en
+    # lugar de lanzarse para no interrumpir las otras familias
+    try:
+        return entrenar_familia(familia, datos, **kwargs)
+    except ImportError as error:
+        return error
+
+
+def psi(referencia, nueva, bins=INTERVALOS_PSI):
+    """
+    Population Stability Index de `nueva` frente a `referencia`, con los
+    deciles de la referencia como intervalos. Por debajo de 0.1 no hay cambio
+    apreciable; por encima de 0.2 la distribución ha cambiado de forma notable.
+    """
+    referencia, nueva = np.asarray(referencia, dtype=np.float64), np.asarray(nueva, dtype=np.float64)
+    cortes = np.unique(np.quantile(referencia, np.linspace(0, 1, bins + 1)[1:-1]))
+    p = np.bincount(np.searchsorted(cortes, referencia), minlength=len(cortes) + 1) / len(referencia)
+    q = np.bincount(np.searchsorted(cortes, nueva), minlength=len(cortes) + 1) / len(nueva)
+    # Evita log(0) en intervalos vacíos
+    p, q = np.clip(p, 1e-6, None), np.clip(q, 1e-6, None)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def actualizar(base, ruta=RUTA_DATOS, directorio=DIRECTORIO_ENTRENAMIENTO,
+               umbral_psi=UMBRAL_PSI, fraccion_arboles=FRACCION_ARBOLES):
+    """
+    Actualiza los modelos de la versión `base` con las filas añadidas al final
+    del catálogo desde que se entrenó, y guarda el resultado como una versión nueva.
+
+    Las filas nuevas se parten igual que en el entrenamiento (si son menos de
+    `MIN_FILAS_PARTICION`, todas van al entrenamiento) y:
+
+    - los modelos con `partial_fit` (SGD, Naive Bayes) aprenden solo de ellas;
+    - el Gradient Boosting añade `fraccion_arboles` árboles con `warm_start`
+      ajustados sobre todo el entrenamiento ampliado;
+    - el resto se reentrena con sus hiperparámetros de la versión base solo si
+      el PSI de alguna columna entre las filas antiguas y las nuevas supera
+      `umbral_psi`; si no, se conserva tal cual. Con menos de `MIN_FILAS_PSI`
+      filas nuevas de entrenamiento no se mide la deriva y también se conserva.
+
+    Returns:
+        str: Directorio de la versión creada, o None si no hay filas nuevas.
+    """
+    with open(os.path.join(base, 'metricas.json'), encoding='utf-8') as f:
+        anterior = json.load(f)
+    if 'filas_datos' not in anterior:
+        raise ValueError(f'{base} no registra las filas con las que se entrenó; hace falta un entrenamiento completo')
+
+    df = leer_datos(ruta)
+    filas_base = anterior['filas_datos']
+    if len(df) < filas_base or huella_filas(df.iloc[:filas_base]) != anterior['hash_filas']:
+        raise ValueError('El catálogo no es una ampliación del de la versión base; hace falta un entrenamiento completo')
+    if len(df) == filas_base:
+        print('No hay filas nuevas desde', anterior['version'])
+        return None
+
+    # Las filas antiguas se parten igual que en la versión base y las nuevas por separado
+    huella = huella_fichero(ruta)
+    random_state = anterior.get('random_state', RANDOM_STATE)
+    datos = preparar_datos(ruta, huella, filas=filas_base, random_state=random_state)
+    nuevas = df.iloc[filas_base:]
+    if len(nuevas.dropna()) >= MIN_FILAS_PARTICION:
+        X_nuevo, X_nuevo_test, y_nuevo, y_nuevo_test = partir(nuevas, random_state=random_state)
+    else:
+        # Demasiado pocas para partirlas: train_test_split falla con una sola fila
+        nuevas = codificar(nuevas)
+        X_nuevo, y_nuevo = nuevas[COLUMNAS_MODELO], nuevas[COLUMNA_OBJETIVO]
+        X_nuevo_test, y_nuevo_test = X_nuevo.iloc[:0], y_nuevo.iloc[:0]
+    X_train = pd.concat([datos['X_train'], X_nuevo])
+    y_train = pd.concat([datos['y_train'], y_nuevo])
+    X_test = pd.concat([datos['X_test'], X_nuevo_test])
+    y_test = pd.concat([datos['y_test'], y_nuevo_test])
+    if len(X_nuevo) >= MIN_FILAS_PSI:
+        derivas = {c: psi(datos['X_train'][c], X_nuevo[c]) for c in COLUMNAS_MODELO}
+        deriva = max(derivas.values()) > umbral_psi
+    else:
+        # Muestra demasiado pequeña para estimar la distribución de las filas nuevas
+        derivas, deriva = None, False
+
+    version = f'{datetime.now():%Y%m%d-%H%M%S}-{huella[:8]}'
+    destino = os.path.join(directorio, version)
+    os.makedirs(destino, exist_ok=True)
+    resumen = {**anterior, 'version': version, 'base': anterior['version'], 'hash_datos': huella,
+               'filas_datos': len(df), 'hash_filas': huella_filas(df),
+               'filas_nuevas': len(df) - filas_base,
+               'filas_entrenamiento': len(y_train), 'filas_prueba': len(y_test),
+               'psi': derivas, 'umbral_psi': umbral_psi, 'familias': {}}
+
+    try:
+        for familia, registro in anterior['familias'].items():
+            inicio = time.perf_counter()
+            modelo, accion = _actualizar_modelo(
+                joblib.load(registro['artefacto']), X_nuevo, y_nuevo, X_train, y_train,
+                deriva, fraccion_arboles)
+            segundos = time.perf_counter() - inicio
+
+            ruta_modelo = os.path.join(destino, os.path.basename(registro['artefacto']))
+            if accion == 'sin cambios':
+                shutil.copy2(registro['artefacto'], ruta_modelo)
+            else:
+                joblib.dump(modelo, ruta_modelo)
+            y_pred = modelo.predict(X_test)
+            resumen['familias'][familia] = {
+                **registro, 'artefacto': ruta_modelo,
+                'accuracy': accuracy_score(y_test, y_pred),
+                'f1_macro': f1_score(y_test, y_pred, average='macro'),
+                'actualizacion': accion, 'segundos_actualizacion': segundos,
+            }
+            print(f'{familia}: {accion} en {segundos:.2f} s, '
+                  f'f1_macro {resumen["familias"][familia]["f1_macro"]:.3f}')
+    except BaseException:
+        # No deja versiones a medias
+        shutil.rmtree(destino)
+        raise
+
+    with open(os.path.join(destino, 'metricas.json'), 'w', encoding='utf-8') as f:
+        json.dump(resumen, f, indent=1, default=_a_json)
+    return destino
+
+
+def _actualizar_modelo(modelo, X_nuevo, y_nuevo, X_train, y_train, deriva, fraccion_arboles):
+    # Devuelve el modelo actualizado y la acción aplicada. El escalado de los
+    # Pipelines se mantiene fijo; solo se actualiza el clasificador final
+    final = modelo.steps[-1][1] if hasattr(modelo, 'steps') else modelo
+    escalar = modelo.steps[0][1].transform if hasattr(modelo, 'steps') else (lambda X: X)
+    # Ni partial_fit ni warm_start admiten tipos que el modelo no ha visto
+    clases_nuevas = not np.isin(y_nuevo, final.classes_).all()
+
+    if hasattr(final, 'partial_fit') and not clases_nuevas:
+        final.partial_fit(escalar(X_nuevo), y_nuevo, classes=final.classes_)
+        return modelo, 'partial_fit'
+    if isinstance(final, GradientBoostingClassifier) and not clases_nuevas:
+        nuevos = max(1, round(final.n_estimators * fraccion_arboles))
+        final.set_params(warm_start=True, n_estimators=final.n_estimators + nuevos)
+        final.fit(escalar(X_train), y_train)
+        return modelo, f'warm_start (+{nuevos} árboles)'
+    if not (clases_nuevas or deriva):
+        return modelo, 'sin cambios'
+
+    # Mismos hiperparámetros, entrenado desde cero con todas las filas
+    final = clone(final).fit(escalar(X_train), y_train)
+    if hasattr(modelo, 'steps'):
+        modelo.steps[-1] = (modelo.steps[-1][0], final)
+    else:
+        modelo = final
+    return modelo, 'reentrenado (tipos nuevos)' if clases_nuevas else 'reentrenado (deriva)'
+
+
+def _a_json(valor):
+    # Tipos de NumPy en los parámetros y métricas
+    return valor.item() if isinstance(valor, np.generic) else str(valor)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Entrena los clasificadores del tipo espectral y guarda una versión nueva en output/.')
+    parser.add_argument('--datos', default=RUTA_DATOS)
+    parser.add_argument('--salida', default=DIRECTORIO_ENTRENAMIENTO)
+    parser.add_argument('--familias', nargs='+', choices=list(FAMILIAS), default=None)
+    parser.add_argument('--candidatos', type=int, default=32)
+    parser.add_argument('--cv', type=int, default=5)
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--max-filas', type=int, default=None,
+                        help='Filas de la última ronda de la búsqueda (por defecto todas)')
+    parser.add_argument('--random-state', type=int, default=RANDOM_STATE)
+    parser.add_argument('--incremental', metavar='VERSION',
+                        help='Directorio de una versión a actualizar con las filas nuevas del catálogo')
+    parser.add_argument('--umbral-psi', type=float, default=UMBRAL_PSI)
+    args = parser.parse_args(argv)
+
+    if args.incremental:
+        destino = actualizar(args.incremental, args.datos, args.salida, args.umbral_psi)
+        if destino:
+            print(f'Artefactos y métricas en {destino}')
+        return
+
+    destino = entrenar(args.familias, args.datos, args.salida, candidatos=args.candidatos,
+                       cv=args.cv, n_jobs=args.n_jobs, max_filas=args.max_filas,
+                       random_state=args.random_state)
+    print(f'Artefactos y métricas en {destino}')
+
+
+if __name__ == '__main__':
+    main()
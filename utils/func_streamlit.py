@@ -6,15 +6,24 @@ import numpy as np
 import pandas as pd
 import plotly.graph_objs as go
 import plotly_express as px
-import plotly.figure_factory as ff
 import streamlit as st
 from streamlit_lottie import st_lottie
 from sys import path
 import os
+import base64
+import plotly.colors as pc
+from PIL import Image, ImageColor
+from scipy import stats
+from utils.catalogo import (Catalogo, CLASES_ESPECTRALES, RUTA_CATALOGO, RUTA_VARIABLES, TIPOS_ESPECTRALES,
+                            clave_catalogo, estadisticas_hash, tiempo_hash_dataframe)
+from utils.cache_figuras import cache_en_disco, estadisticas as estadisticas_figuras
+from utils.cielo import VISTAS, IndiceCielo
+from utils.cubos import CuboHistograma, intervalos
+from utils.instrumentacion import instrumentar
 
 
 pio.templates.default = "plotly_dark"
-tipo_espectral_order = ['O', 'B', 'A', 'F', 'G', 'K', 'M']
+tipo_espectral_order = list(TIPOS_ESPECTRALES)
 
 colores = {
     'O': 'violet',
@@ -25,20 +34,51 @@ colores = {
     'K': 'orange',
     'M': 'red'
 }
-clase_espectral_order = ['O0', 'O1', 'O2', 'O3', 'O4', 'O5', 'O6', 'O7', 'O8', 'O9',
-                         'B0', 'B1', 'B2', 'B3', 'B4', 'B5', 'B6', 'B7', 'B8', 'B9',
-                         'A0', 'A1', 'A2', 'A3', 'A4', 'A5', 'A6', 'A7', 'A8', 'A9',
-                         'F0', 'F1', 'F2', 'F3', 'F4', 'F5', 'F6', 'F7', 'F8', 'F9',
-                         'G0', 'G1', 'G2', 'G3', 'G4', 'G5', 'G6', 'G7', 'G8', 'G9',
-                         'K0', 'K1', 'K2', 'K3', 'K4', 'K5', 'K6', 'K7', 'K8', 'K9',
-                         'M0', 'M1', 'M2', 'M3', 'M4', 'M5', 'M6', 'M7', 'M8', 'M9']
+clase_espectral_order = list(CLASES_ESPECTRALES)
 
 
-@st.cache_data()
-def load_data():
-    df_parallax = pd.read_parquet('data/hipparcos_final.parquet')
-    variables = pd.read_parquet('data/variables.parquet')
-    return df_parallax, variables
+# Columnas que usaban las gráficas de la app, con las que se mide el hash del DataFrame
+columnas_app = ['RAdeg', 'DEdeg', 'Vmag', 'BTmag', 'VTmag', 'Hpmag', 'pmRA', 'pmDE', 'd',
+                'B-V', 'V-I', 'T', 'M_v', 'M_Hip', 'Tipo_espectral', 'Clase_espectral']
+
+
+# Las figuras reciben el handle del catálogo y Streamlit usa su token de versión
+# como clave de caché en lugar de hashear el DataFrame en cada ejecución
+hash_catalogo = {Catalogo: clave_catalogo}
+
+
+def instrumentar_figura(funcion):
+    # Los aciertos y fallos en disco los cuenta cache_figuras por constructor
+    return instrumentar(funcion, cache=estadisticas_figuras[funcion.__qualname__])
+
+
+@instrumentar(filas=None)
+@st.cache_resource()
+def load_catalogos():
+    # Un único handle por proceso; los datos se mapean desde disco al leerlos y
+    # los índices secundarios se construyen aquí una vez para todas las sesiones
+    catalogos = Catalogo(RUTA_CATALOGO), Catalogo(RUTA_VARIABLES)
+    for catalogo in catalogos:
+        catalogo.indices
+    return catalogos
+
+
+@st.cache_resource(hash_funcs=hash_catalogo)
+def medir_hash_dataframe(catalogo, columnas=tuple(columnas_app)):
+    # Coste por llamada de la clave de caché cuando las figuras recibían el
+    # DataFrame; el DataFrame se crea solo para medirlo y se cachea el tiempo
+    return tiempo_hash_dataframe(catalogo.frame(columnas))
+
+
+def mostrar_metricas_hash(catalogo):
+    # Tiempo de cálculo de claves de caché por ejecución: antes (hash del DataFrame) y ahora (token de versión)
+    llamadas = max(estadisticas_hash['llamadas'], 1)
+    expander = st.sidebar.expander("Claves de caché")
+    expander.metric("Hash del DataFrame por figura",
+                    f"{1000 * medir_hash_dataframe(catalogo):.2f} ms")
+    expander.metric("Token de versión por figura",
+                    f"{1000 * estadisticas_hash['segundos'] / llamadas:.3f} ms")
+    expander.caption(f"{estadisticas_hash['llamadas']} claves calculadas en este proceso")
 
 
 @st.cache_data()
@@ -49,103 +89,314 @@ def load_lottieurl(url: str):
     return r.json()
 
 
-@st.cache_data()
-def create_mov_propio_fig(df):
-    mov_propio = px.scatter(df, x="pmRA", y="pmDE", color="d", range_color=[df["d"].min(), df["d"].max()],
-                            color_continuous_scale='viridis', opacity=0.7)
+# Por encima de este número de estrellas en la región visible los diagramas de
+# dispersión se dibujan como una imagen de densidad en lugar de un marcador por estrella
+max_puntos = 20000
+# El diagrama 3D no se puede dibujar como imagen: por encima de este número de
+# estrellas se dibuja una muestra aleatoria fija de ese tamaño
+max_puntos_3d = 10000
+
+
+def en_vista(x, y, range_x, range_y):
+    # Máscara de las estrellas dentro de la región [range_x] x [range_y]
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    (x0, x1), (y0, y1) = sorted(range_x), sorted(range_y)
+    return (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+
+
+def rango_datos(valores):
+    valores = np.asarray(valores, dtype=float)
+    return [float(np.nanmin(valores)), float(np.nanmax(valores))]
+
+
+def imagen_densidad(x, y, range_x, range_y, resolucion, color=None, colorscale='viridis',
+                    range_color=None, color_discrete_map=None):
+    """
+    Agrega las estrellas en una imagen RGBA de resolucion = (ancho, alto) píxeles
+    con histogramas de NumPy. La opacidad de cada píxel crece con el logaritmo del
+    número de estrellas; su color es la media de `color` (continuo) o la categoría
+    más frecuente (si `color_discrete_map` no es None).
+    """
+    ancho, alto = resolucion
+    (x0, x1), (y0, y1) = sorted(range_x), sorted(range_y)
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    dentro = en_vista(x, y, range_x, range_y)
+    ix = np.minimum(((x[dentro] - x0) / (x1 - x0) * ancho).astype(np.intp), ancho - 1)
+    iy = np.minimum(((y[dentro] - y0) / (y1 - y0) * alto).astype(np.intp), alto - 1)
+    pixel = iy * ancho + ix
+    n_pixeles = ancho * alto
+    recuento = np.bincount(pixel, minlength=n_pixeles)
+
+    if color is None:
+        rgb = np.tile(np.array([75, 255, 195], dtype=np.uint8), (n_pixeles, 1))
+    elif color_discrete_map is not None:
+        categorias = list(color_discrete_map)
+        # Con una columna categórica se recodifican los códigos, sin pasar por cadenas
+        codigos = pd.Categorical(color, categories=categorias).codes[dentro]
+        valido = codigos >= 0
+        # Categoría dominante de cada píxel
+        por_categoria = np.bincount(pixel[valido] * len(categorias) + codigos[valido],
+                                    minlength=n_pixeles * len(categorias))
+        dominante = por_categoria.reshape(n_pixeles, len(categorias)).argmax(axis=1)
+        paleta = np.array([ImageColor.getrgb(color_discrete_map[cat])[:3] for cat in categorias],
+                          dtype=np.uint8)
+        rgb = paleta[dominante]
+    else:
+        valores = np.asarray(color, dtype=float)[dentro]
+        finito = np.isfinite(valores)
+        suma = np.bincount(pixel[finito], weights=valores[finito], minlength=n_pixeles)
+        n_finito = np.bincount(pixel[finito], minlength=n_pixeles)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            media = suma / n_finito
+        c0, c1 = range_color if range_color is not None else rango_datos(valores)
+        posicion = np.clip(np.nan_to_num((media - c0) / (c1 - c0)), 0, 1)
+        escala = pc.get_colorscale(colorscale) if isinstance(colorscale, str) else colorscale
+        tabla = np.array(pc.sample_colorscale(escala, np.linspace(0, 1, 256), colortype='tuple'))
+        rgb = (tabla[(posicion * 255).astype(np.intp)] * 255).astype(np.uint8)
+
+    alfa = np.zeros(n_pixeles, dtype=np.uint8)
+    ocupado = recuento > 0
+    alfa[ocupado] = 80 + 175 * np.log1p(recuento[ocupado]) / np.log1p(recuento.max())
+    return np.dstack([rgb.reshape(alto, ancho, 3), alfa.reshape(alto, ancho)])
+
+
+def figura_densidad(x, y, range_x, range_y, resolucion, color=None, colorscale='viridis',
+                    range_color=None, color_discrete_map=None, titulo_color=None):
+    """
+    Figura de Plotly con la imagen de densidad de `imagen_densidad` codificada en
+    PNG, de modo que el navegador recibe decenas de KB en lugar de un marcador
+    por estrella. La leyenda o la barra de color se añaden con trazas vacías.
+    """
+    imagen = imagen_densidad(x, y, range_x, range_y, resolucion, color=color, colorscale=colorscale,
+                             range_color=range_color, color_discrete_map=color_discrete_map)
+    png = BytesIO()
+    Image.fromarray(imagen, 'RGBA').save(png, format='PNG', optimize=True)
+    (x0, x1), (y0, y1) = sorted(range_x), sorted(range_y)
+    dx, dy = (x1 - x0) / resolucion[0], (y1 - y0) / resolucion[1]
+
+    fig = go.Figure(go.Image(
+        source='data:image/png;base64,' + base64.b64encode(png.getvalue()).decode(),
+        x0=x0 + dx / 2, dx=dx, y0=y0 + dy / 2, dy=dy, hoverinfo='skip'))
+    if color_discrete_map is not None:
+        for categoria, c in color_discrete_map.items():
+            fig.add_trace(go.Scatter(x=[None], y=[None], mode='markers', name=categoria,
+                                     marker=dict(color=c, size=8)))
+    elif color is not None:
+        c0, c1 = range_color if range_color is not None else rango_datos(color)
+        fig.add_trace(go.Scatter(x=[None], y=[None], mode='markers', showlegend=False,
+                                 marker=dict(color=[c0, c1], colorscale=colorscale, showscale=True,
+                                             colorbar=dict(title=titulo_color))))
+    # Las imágenes fijan por defecto la misma escala en ambos ejes
+    fig.update_layout(xaxis=dict(range=list(range_x), scaleanchor=False),
+                      yaxis=dict(range=list(range_y), scaleanchor=False))
+    return fig
+
+
+@instrumentar_figura
+@st.cache_data(hash_funcs=hash_catalogo)
+@cache_en_disco
+def create_mov_propio_fig(catalogo, range_x=(-180, 180), range_y=(-180, 180)):
+    df = catalogo.frame(["pmRA", "pmDE", "d"])
+    range_color = [df["d"].min(), df["d"].max()]
+    dentro = en_vista(df["pmRA"], df["pmDE"], range_x, range_y)
+    if dentro.sum() > max_puntos:
+        mov_propio = figura_densidad(df["pmRA"], df["pmDE"], range_x, range_y, (800, 400),
+                                     color=df["d"], colorscale='viridis', range_color=range_color,
+                                     titulo_color="Distancia [pc]")
+    else:
+        mov_propio = px.scatter(df[dentro], x="pmRA", y="pmDE", color="d", range_color=range_color,
+                                color_continuous_scale='viridis', opacity=0.7)
+        mov_propio.update_traces(
+            mode='markers',
+            marker=dict(size=2)
+        )
 
     mov_propio.update_layout(
         xaxis_title="Movimiento propio en ascensión recta",
         yaxis_title="Movimiento propio en declinación",
         title="",
-        xaxis_range=[-180, 180],
-        yaxis_range=[-180, 180],
+        xaxis_range=list(range_x),
+        yaxis_range=list(range_y),
         coloraxis_colorbar=dict(
             title="Distancia [pc]"
         ),    template="plotly_dark",
         height=400,
         width=800
     )
-    mov_propio.update_traces(
-        mode='markers',
-        marker=dict(size=2)
-    )
     return mov_propio
 
 
-@st.cache_data()
-def create_tipo_espec_fig(df):
-    fig = px.histogram(df, x="Tipo_espectral",
-                       labels={"Tipo_espectral": "Tipo espectral",
-                               "count": "Recuento"},
-                       category_orders={"Tipo_espectral": [
-                           'O', 'B', 'A', 'F', 'G', 'K', 'M']},
-                       title="Número de estrellas por tipo espectral del catálogo Hipparcos", color='Tipo_espectral', color_discrete_map=colores)
-    fig.update_yaxes(title="Recuento")
-    fig.update_layout(height=400, width=800)
+# Anchura de los intervalos de magnitud de los histogramas y número de
+# intervalos del histograma de períodos
+anchura_Vmag = 0.1
+intervalos_periodo = 200
+intervalos_distancia = 100
+# Bandas del histograma de magnitudes, anchura de sus intervalos y puntos de la curva de densidad
+bandas_magnitud = {'BTmag': 'Magnitud BT aparente', 'VTmag': 'Magnitud VT aparente',
+                   'Hpmag': 'Magnitud HP aparente'}
+anchura_bandas = 0.2
+puntos_kde = 500
+
+
+@st.cache_resource(hash_funcs=hash_catalogo)
+def load_cubo_espectral(catalogo):
+    # Recuentos por tipo espectral x clase espectral x magnitud visual: una
+    # sola pasada por el catálogo para todos los histogramas espectrales
+    vmag = catalogo.columnas('Vmag')['Vmag']
+    return CuboHistograma.desde_catalogo(catalogo, {
+        'Tipo_espectral': tipo_espectral_order,
+        'Clase_espectral': clase_espectral_order,
+        'Vmag': intervalos(vmag, anchura=anchura_Vmag),
+    })
+
+
+@st.cache_resource(hash_funcs=hash_catalogo)
+def load_cubo_distancia(catalogo):
+    # Recuentos por distancia; aparte del cubo espectral para no multiplicar sus celdas
+    d = catalogo.columnas('d')['d']
+    return CuboHistograma.desde_catalogo(catalogo, {'d': intervalos(d, n=intervalos_distancia)})
+
+
+@st.cache_resource(hash_funcs=hash_catalogo)
+def load_cubo_variables(catalogo_variables):
+    # Recuentos por tipo de variabilidad x período
+    periodo = catalogo_variables.columnas('Period')['Period']
+    return CuboHistograma.desde_catalogo(catalogo_variables, {
+        'HvarType': None,
+        'Period': intervalos(periodo, n=intervalos_periodo),
+    })
+
+
+@st.cache_resource(hash_funcs=hash_catalogo)
+def load_cubos_magnitudes(catalogo):
+    # Un cubo de un eje por banda: las bandas tienen nulos distintos y un cubo
+    # conjunto multiplicaría las celdas sin que ninguna figura lo necesite
+    columnas = catalogo.columnas(*bandas_magnitud)
+    return {banda: CuboHistograma(columnas, {banda: intervalos(columnas[banda], anchura=anchura_bandas)})
+            for banda in bandas_magnitud}
+
+
+def barras_intervalos(cubo, eje, recuentos, **kwargs):
+    # Barra por intervalo de un eje numérico del cubo, con el aspecto de un histograma
+    return go.Bar(x=cubo.etiquetas(eje), y=recuentos, width=cubo.anchura(eje), **kwargs)
+
+
+@instrumentar_figura
+@st.cache_data(hash_funcs=hash_catalogo)
+@cache_en_disco
+def create_distancia_fig(catalogo):
+    cubo = load_cubo_distancia(catalogo)
+    fig = go.Figure([barras_intervalos(cubo, 'd', cubo.marginal('d'))])
+    fig.update_layout(title="Distribución de la distancia", xaxis_title="Distancia [pc]",
+                      yaxis_title="Recuento", bargap=0, height=400, width=800, template="plotly_dark")
     return fig
 
 
-@st.cache_data()
-def create_clase_fig(df):
-    fig = px.histogram(df, x='Clase_espectral',
-                       nbins=70, color='Tipo_espectral',
-                       category_orders={'Clase_espectral': ['O0', 'O1', 'O2', 'O3', 'O4', 'O5', 'O6', 'O7', 'O8', 'O9',
-                                                            'B0', 'B1', 'B2', 'B3', 'B4', 'B5', 'B6', 'B7', 'B8', 'B9',
-                                                            'A0', 'A1', 'A2', 'A3', 'A4', 'A5', 'A6', 'A7', 'A8', 'A9',
-                                                            'F0', 'F1', 'F2', 'F3', 'F4', 'F5', 'F6', 'F7', 'F8', 'F9',
-                                                            'G0', 'G1', 'G2', 'G3', 'G4', 'G5', 'G6', 'G7', 'G8', 'G9',
-                                                            'K0', 'K1', 'K2', 'K3', 'K4', 'K5', 'K6', 'K7', 'K8', 'K9',
-                                                            'M0', 'M1', 'M2', 'M3', 'M4', 'M5', 'M6', 'M7', 'M8', 'M9']},  color_discrete_map=colores)
+@instrumentar_figura
+@st.cache_data(hash_funcs=hash_catalogo)
+@cache_en_disco
+def create_tipo_espec_fig(catalogo):
+    recuentos = load_cubo_espectral(catalogo).marginal('Tipo_espectral')
+    fig = go.Figure([go.Bar(x=[tipo], y=[n], name=tipo, marker_color=colores[tipo])
+                     for tipo, n in zip(tipo_espectral_order, recuentos)])
+    fig.update_layout(title="Número de estrellas por tipo espectral del catálogo Hipparcos",
+                      xaxis_title="Tipo espectral", yaxis_title="Recuento",
+                      legend_title_text="Tipo espectral", height=400, width=800)
+    return fig
+
+
+@instrumentar_figura
+@st.cache_data(hash_funcs=hash_catalogo)
+@cache_en_disco
+def create_clase_fig(catalogo):
+    recuentos = load_cubo_espectral(catalogo).marginal('Tipo_espectral', 'Clase_espectral')
+    clases = np.array(clase_espectral_order)
+    fig = go.Figure()
+    # Una barra apilada por tipo en cada clase; solo se envían las clases con estrellas
+    for tipo, fila in zip(tipo_espectral_order, recuentos):
+        con_estrellas = fila > 0
+        fig.add_bar(x=clases[con_estrellas], y=fila[con_estrellas], name=tipo, marker_color=colores[tipo])
+    fig.update_xaxes(categoryorder='array', categoryarray=clase_espectral_order)
     fig.update_layout(title="Recuento de estrellas por clase espectral", xaxis_title="Clase espectral",
-                      yaxis_title="Cantidad de estrellas", bargap=0.1, height=600, width=1100)
+                      yaxis_title="Cantidad de estrellas", legend_title_text="Tipo espectral",
+                      barmode='stack', bargap=0.1, height=600, width=1100)
     return fig
 
 
-@st.cache_data()
-def filter_visible(data, cutoff_magnitude):
-    visible = data[data['Vmag'] < cutoff_magnitude]
-    return visible
+@instrumentar
+def filter_visible(catalogo, cutoff_magnitude):
+    # Filas con Vmag < cutoff_magnitude: dos búsquedas binarias en el índice
+    # ordenado, sin recorrer la columna ni copiar el DataFrame
+    return catalogo.indices.rango('Vmag', maximo=cutoff_magnitude)
 
 
+@instrumentar
 @st.cache_data()
 def custom_scatter(data, x, y, color, range_x, range_y, color_continuous_scale, opacity, labels, title, custom_data, hovertemplate):
-    scatter = px.scatter(data, x=x, y=y, color=color, range_x=range_x, range_y=range_y,
-                         color_continuous_scale=color_continuous_scale, opacity=opacity, labels=labels,
-                         title=title, custom_data=custom_data)
+    dentro = en_vista(data[x], data[y], range_x, range_y)
+    if dentro.sum() > max_puntos:
+        scatter = figura_densidad(data[x], data[y], range_x, range_y, (800, 600), color=data[color],
+                                  colorscale=color_continuous_scale, titulo_color=labels.get(color, color))
+        scatter.update_layout(title=title, xaxis_title=labels.get(x, x), yaxis_title=labels.get(y, y))
+    else:
+        scatter = px.scatter(data[dentro], x=x, y=y, color=color, range_x=range_x, range_y=range_y,
+                             color_continuous_scale=color_continuous_scale, opacity=opacity, labels=labels,
+                             title=title, custom_data=custom_data)
+        scatter.update_traces(hovertemplate=hovertemplate)
     scatter.update_layout(height=600, width=800)
-    scatter.update_traces(hovertemplate=hovertemplate)
     return scatter
 
 
-@st.cache_data()
-def create_visualizations(df_parallax):
-
-    # Crear histograma de la magnitud visual aparente
-    mag = px.histogram(df_parallax, x="Vmag", nbins=100)
+@st.cache_resource(hash_funcs=hash_catalogo)
+def load_indice_cielo(catalogo):
+    # Un KD-tree por versión del catálogo, compartido por todas las sesiones
+    return IndiceCielo.desde_catalogo(catalogo)
+
+
+@instrumentar_figura
+@st.cache_data(hash_funcs=hash_catalogo)
+@cache_en_disco(variantes=[dict(vista=vista) for vista in VISTAS.values()])
+def create_vista_fig(catalogo, vista):
+    # Solo las estrellas del campo llegan a la figura: el índice espacial
+    # resuelve la caja y el índice de Vmag las estrellas visibles
+    filas = np.intersect1d(load_indice_cielo(catalogo).caja(vista.range_ra, vista.range_dec),
+                           filter_visible(catalogo, vista.magnitud_limite), assume_unique=True)
+    columnas = catalogo.columnas('RAdeg', 'DEdeg', 'Vmag', 'd')
+    campo = pd.DataFrame({nombre: np.asarray(valores)[filas] for nombre, valores in columnas.items()})
+    return custom_scatter(campo, 'RAdeg', 'DEdeg', 'Vmag', list(vista.range_ra), list(vista.range_dec),
+                          'Greys', 1, {'RAdeg': 'Ascensión recta [°]', 'DEdeg': 'Declinación [°]'},
+                          vista.titulo, ['d', 'Vmag'],
+                          '<br>'.join([
+                              'RA: %{x:.2f}',
+                              'Dec: %{y:.2f}',
+                              'Distancia: %{customdata[0]:.2f} pc',
+                              'Magnitud visual: %{customdata[1]:.2f}',
+                          ]))
+
+
+@instrumentar_figura
+@st.cache_data(hash_funcs=hash_catalogo)
+@cache_en_disco
+def create_visualizations(catalogo):
+    cubo = load_cubo_espectral(catalogo)
+
+    # Histograma de la magnitud visual aparente
+    mag = go.Figure([barras_intervalos(cubo, 'Vmag', cubo.marginal('Vmag'))])
     mag.update_layout(
         xaxis_title="Magnitud visual aparente",
         yaxis_title="Recuento",
         title="Distribución de estrellas según su magnitud aparente",
+        bargap=0,
         height=600,
         width=1000,
     )
 
-    # Ordenar el DataFrame por el tipo espectral
-    df_parallax_sorted = df_parallax.sort_values(
-        'Tipo_espectral', key=lambda x: pd.Categorical(
-            x, categories=tipo_espectral_order, ordered=True
-        )
-    )
-
-    # Crear histograma de la magnitud visual aparente con el tipo espectral
-    dist_type = px.histogram(
-        df_parallax_sorted, x="Vmag", color="Tipo_espectral", nbins=100,
-        title='Distribución de las magnitudes visuales con base en el tipo espectral de las estrellas'
-    )
-
-    # Actualizar el orden de la leyenda y los títulos de los ejes
+    # Histograma de la magnitud visual aparente apilado por tipo espectral
+    por_tipo = cubo.marginal('Tipo_espectral', 'Vmag')
+    dist_type = go.Figure([barras_intervalos(cubo, 'Vmag', fila, name=tipo, marker_color=colores[tipo])
+                           for tipo, fila in zip(tipo_espectral_order, por_tipo)])
     dist_type.update_layout(
+        title='Distribución de las magnitudes visuales con base en el tipo espectral de las estrellas',
         legend=dict(
             traceorder="normal",
             title="Tipo espectral",
@@ -157,6 +408,8 @@ def create_visualizations(df_parallax):
         yaxis=dict(
             title="Recuento"
         ),
+        barmode='stack',
+        bargap=0,
         height=600,
         width=1000
     )
@@ -164,42 +417,55 @@ def create_visualizations(df_parallax):
     return mag, dist_type
 
 
-@st.cache_data()
-def create_magnitudes_plot(df_parallax):
-    hist_data = [df_parallax["BTmag"],
-                 df_parallax["VTmag"], df_parallax["Hpmag"]]
-
-    group_labels = ['Magnitud BT aparente',
-                    'Magnitud VT aparente', 'Magnitud HP aparente']
-
-    # Crear el distplot con el tamaño personalizado de los bins
-    magnitudes = ff.create_distplot(
-        hist_data, group_labels, bin_size=0.2)
+@instrumentar_figura
+@st.cache_data(hash_funcs=hash_catalogo)
+@cache_en_disco
+def create_magnitudes_plot(catalogo):
+    # Lo que dibujaba ff.create_distplot sin el rug de cada estrella: el
+    # histograma de densidad sale del cubo de cada banda y la curva es una KDE
+    # gaussiana evaluada en una rejilla de `puntos_kde` puntos
+    cubos = load_cubos_magnitudes(catalogo)
+    columnas = catalogo.columnas(*bandas_magnitud)
+    magnitudes = go.Figure()
+    for (banda, nombre), color in zip(bandas_magnitud.items(), pc.DEFAULT_PLOTLY_COLORS):
+        cubo = cubos[banda]
+        recuentos = cubo.marginal(banda)
+        magnitudes.add_trace(barras_intervalos(
+            cubo, banda, recuentos / (recuentos.sum() * cubo.anchura(banda)), name=nombre,
+            legendgroup=nombre, marker_color=color, opacity=0.7))
+        valores = np.asarray(columnas[banda], dtype=float)
+        valores = valores[np.isfinite(valores)]
+        rejilla = np.linspace(valores.min(), valores.max(), puntos_kde)
+        magnitudes.add_trace(go.Scatter(x=rejilla, y=stats.gaussian_kde(valores)(rejilla), mode='lines',
+                                        name=nombre, legendgroup=nombre, showlegend=False,
+                                        line=dict(color=color)))
 
     # Actualizar el diseño
     magnitudes.update_layout(
         title='Distribución de magnitudes en el catálogo Hipparcos',
         xaxis_title='Magnitud aparente',
         yaxis_title='Densidad',
+        barmode='overlay',
+        bargap=0,
         height=600,
         width=1000)
 
     return magnitudes
 
 
-@st.cache_data()
-def create_cumulative_plot(df_parallax):
-    # Crear el histograma con distribución acumulada
-    cumulative = px.histogram(df_parallax, x="Vmag", nbins=50, cumulative=True,
-                              title="Distribución de la magnitud visual aparente (Acumulativo)",
-                              labels={'Vmag': 'Magnitud aparente visual'})
-
-    # Cambiar el título y los nombres de los ejes a español
-    cumulative.update_layout(
-        xaxis_title='Magnitud aparente V', yaxis_title='Recuento')
-    cumulative.update_traces(
-        hovertemplate="Magnitud aparente visual: %{x}")
+@instrumentar_figura
+@st.cache_data(hash_funcs=hash_catalogo)
+@cache_en_disco
+def create_cumulative_plot(catalogo):
+    cubo = load_cubo_espectral(catalogo)
+    # Distribución acumulada a partir de los mismos recuentos por intervalo
+    cumulative = go.Figure([barras_intervalos(cubo, 'Vmag', np.cumsum(cubo.marginal('Vmag')),
+                                              hovertemplate="Magnitud aparente visual: %{x:.2f}"
+                                                            "<br>Recuento: %{y}<extra></extra>")])
     cumulative.update_layout(
+        title="Distribución de la magnitud visual aparente (Acumulativo)",
+        xaxis_title='Magnitud aparente V', yaxis_title='Recuento',
+        bargap=0,
         height=600,
         width=1000,
         template="plotly_dark")
@@ -207,21 +473,72 @@ def create_cumulative_plot(df_parallax):
     return cumulative
 
 
-@st.cache_data()
-def generar_HR(df_parallax):
-    df_parallax['Tipo_espectral'] = pd.Categorical(
-        df_parallax['Tipo_espectral'], categories=tipo_espectral_order)
-
-    # Crear el gráfico HR
-    HR = px.scatter(x=df_parallax['B-V'],
-                    y=df_parallax['M_v'],
-                    color=df_parallax["Tipo_espectral"], color_discrete_map=colores)
+@instrumentar_figura
+@st.cache_data(hash_funcs=hash_catalogo)
+@cache_en_disco(ruta=RUTA_VARIABLES)
+def create_variabilidad_figs(catalogo_variables):
+    cubo = load_cubo_variables(catalogo_variables)
+
+    variab = go.Figure([barras_intervalos(cubo, 'Period', cubo.marginal('Period'))])
+    variab.update_layout(title="Histograma del período estelar en el catálogo Hipparcos",
+                         xaxis_title="Período [Días]", yaxis_title="log(N)", yaxis_type='log',
+                         bargap=0, height=600, width=1000, template="plotly_dark")
+
+    var_type = go.Figure([go.Bar(x=[tipo], y=[n], name=tipo)
+                          for tipo, n in zip(cubo.etiquetas('HvarType'), cubo.marginal('HvarType'))])
+    var_type.update_layout(title='Distribución del tipo de variabilidad estelar en el catálogo Hipparcos',
+                           xaxis_title='Tipo de variabilidad', yaxis_title='Recuento',
+                           legend_title_text='HvarType', height=600, width=1000,
+                           template="plotly_dark")
+    return variab, var_type
+
+
+# Región inicial de los sliders de zoom del diagrama HR en app.py
+zoom_HR = ([-0.5, 5.5], [-9.0, 16.0])
+
+
+@instrumentar_figura
+@st.cache_data(hash_funcs=hash_catalogo)
+@cache_en_disco(variantes=[dict(range_x=zoom_HR[0], range_y=zoom_HR[1])])
+def generar_HR(catalogo, range_x=None, range_y=None, tipos=None):
+    # Tipo_espectral ya es categórica y ordenada desde el catálogo
+    df_parallax = catalogo.frame(["B-V", "M_v", "Tipo_espectral"])
+    if tipos is not None:
+        # Las estrellas de los tipos pedidos salen de los bitmaps del índice
+        # secundario, sin comparar la columna entera
+        df_parallax = df_parallax.iloc[catalogo.indices.categorias('Tipo_espectral', *tipos)]
+
+    range_x = range_x or rango_datos(df_parallax['B-V'])
+    range_y = range_y or rango_datos(df_parallax['M_v'])
+    dentro = en_vista(df_parallax['B-V'], df_parallax['M_v'], range_x, range_y)
+    if dentro.sum() > max_puntos:
+        HR = figura_densidad(df_parallax['B-V'], df_parallax['M_v'], range_x, range_y, (450, 450),
+                             color=df_parallax["Tipo_espectral"], color_discrete_map=colores)
+    else:
+        # Crear el gráfico HR
+        df_vista = df_parallax[dentro]
+        HR = px.scatter(x=df_vista['B-V'],
+                        y=df_vista['M_v'],
+                        color=df_vista["Tipo_espectral"], color_discrete_map=colores)
+
+        # Add hover template
+        HR.update_traces(hovertemplate='<br>'.join([
+            'B-V: %{x:.2f}',
+            'Magnitud absoluta: %{y:.2f}'
+        ]))
+
+        # Configurar los marcadores
+        HR.update_traces(
+            mode='markers',
+            marker=dict(size=1.5)
+        )
 
     # Configurar los ejes y la leyenda
     HR.update_layout(
         xaxis_title="B-V [mag]",
         yaxis_title="Magnitud absoluta [mag]",
-        yaxis=dict(autorange='reversed'),
+        xaxis=dict(range=sorted(range_x)),
+        yaxis=dict(range=sorted(range_y, reverse=True)),
         height=900,
         width=900,
         legend=dict(
@@ -232,36 +549,47 @@ def generar_HR(df_parallax):
         title="Diagrama HR"
     )
 
-    # Add hover template
-    HR.update_traces(hovertemplate='<br>'.join([
-        'B-V: %{x:.2f}',
-        'Magnitud absoluta: %{y:.2f}'
-    ]))
-
-    # Configurar los marcadores
-    HR.update_traces(
-        mode='markers',
-        marker=dict(size=1.5)
-    )
-
     return HR
 
 
-@st.cache_data()
-def generar_HR2(df_parallax):
-    # Configurar el gráfico HR2
-    HR2 = px.scatter(x=df_parallax['V-I'],
-                     y=df_parallax['M_Hip'],
-                     color=df_parallax["T"],
-                     color_continuous_scale=px.colors.sequential.RdBu,
-                     labels={'color': 'Temperatura [K]'},
-                     title='HR Temperatura')
+@instrumentar_figura
+@st.cache_data(hash_funcs=hash_catalogo)
+@cache_en_disco
+def generar_HR2(catalogo, range_x=(-1.5, 6), range_y=None):
+    df_parallax = catalogo.frame(["V-I", "M_Hip", "T"])
+    range_y = range_y or rango_datos(df_parallax['M_Hip'])
+    dentro = en_vista(df_parallax['V-I'], df_parallax['M_Hip'], range_x, range_y)
+    if dentro.sum() > max_puntos:
+        HR2 = figura_densidad(df_parallax['V-I'], df_parallax['M_Hip'], range_x, range_y, (450, 450),
+                              color=df_parallax["T"], colorscale=px.colors.sequential.RdBu,
+                              titulo_color='Temperatura [K]')
+        HR2.update_layout(title='HR Temperatura')
+    else:
+        # Configurar el gráfico HR2
+        df_vista = df_parallax[dentro]
+        HR2 = px.scatter(x=df_vista['V-I'],
+                         y=df_vista['M_Hip'],
+                         color=df_vista["T"],
+                         color_continuous_scale=px.colors.sequential.RdBu,
+                         labels={'color': 'Temperatura [K]'},
+                         title='HR Temperatura')
+
+        # Configurar los marcadores
+        HR2.update_traces(
+            mode='markers',
+            marker=dict(size=2)
+        )
+
+        HR2.update_traces(hovertemplate='<br>'.join([
+            'V-I: %{x:.2f}',
+            'M: %{y:.2f}']
+        ))
 
     # Configurar los ejes y la leyenda
     HR2.update_layout(
         xaxis_title="V-I [mag]",
         yaxis_title="Magnitud Absoluta Hipparcos [mag]",
-        yaxis=dict(autorange='reversed'),
+        yaxis=dict(range=sorted(range_y, reverse=True)),
         height=900,
         width=900,
         legend=dict(
@@ -271,24 +599,21 @@ def generar_HR2(df_parallax):
         )
     )
 
-    # Configurar los marcadores
-    HR2.update_traces(
-        mode='markers',
-        marker=dict(size=2)
-    )
-
-    HR2.update_traces(hovertemplate='<br>'.join([
-        'V-I: %{x:.2f}',
-        'M: %{y:.2f}']
-    ))
-
     # Limitar el rango del eje x
-    HR2.update_xaxes(range=[-1.5, 6])
+    HR2.update_xaxes(range=list(range_x))
 
     return HR2
 
 
-def generar_HR3D(df_parallax):
+@instrumentar_figura
+@st.cache_data(hash_funcs=hash_catalogo)
+@cache_en_disco
+def generar_HR3D(catalogo):
+    df_parallax = catalogo.frame(["V-I", "M_Hip", "T", "Tipo_espectral"])
+    titulo = "Diagrama HR 3D"
+    if len(df_parallax) > max_puntos_3d:
+        df_parallax = df_parallax.sample(n=max_puntos_3d, random_state=0)
+        titulo += f" (muestra de {max_puntos_3d} estrellas)"
     # Crear el gráfico HR3D
     HR3D = px.scatter_3d(x=df_parallax['V-I'],
                          y=df_parallax['M_Hip'],
@@ -311,7 +636,7 @@ def generar_HR3D(df_parallax):
             title="Tipo espectral",
             itemsizing='constant'
         ),
-        title="Diagrama HR 3D"
+        title=titulo
     )
 
     # Add hover template
@@ -4,59 +4,290 @@ from sklearn.model_selection import GridSearchCV, KFold
 from sklearn.linear_model import LinearRegression
 from sklearn.pipeline import Pipeline
 from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.metrics.pairwise import nan_euclidean_distances
 from sklearn.impute import SimpleImputer
 import pandas as pd
 import numpy as np
-from sklearn.neighbors import KNeighborsRegressor
+import argparse
+import os
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from sklearn.neighbors import KNeighborsRegressor, NearestNeighbors
 from sklearn.preprocessing import MinMaxScaler, StandardScaler
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 import seaborn as sns
 import matplotlib.pyplot as plt
+from utils.derivadas import columnas_derivadas, clasificacion_espectral, argumentos_desde_columnas
+from utils.ingesta import RUTA_BRUTO, ingerir
 
 
-def fritas(df):
+class Freidora:
+    """
+    Reusable, picklable label codec for the categorical (object) columns of a
+    DataFrame, built on pandas Categorical codes. It encodes exactly like
+    `fritas()` (labels are the sorted `str()` of the values of each column, so
+    None is 'None' and NaN is 'nan') but keeps only one array of categories per
+    column, and both directions are a hash factorization or a single array
+    lookup per column, with per-row `str()` only for missing values and for
+    columns that hold non-string objects.
+    Parameters:
+    - n_jobs: int, number of threads used to process columns in parallel
+      (values <= 0 use one thread per CPU, like scikit-learn's n_jobs=-1)
+    Attributes:
+    - categories_: dict mapping each column name to a pandas Index of labels
+    """
+
+    def __init__(self, n_jobs=1):
+        self.n_jobs = n_jobs
+
+    def fit(self, df):
+        """
+        Learns the labels of every object column of `df`.
+        Returns:
+        - self
+        """
+        columns = df.select_dtypes(include=["object"]).columns
+        self.categories_ = dict(zip(columns, self._map(
+            lambda column: self._fit_column(df[column]), columns)))
+        return self
+
+    def encode(self, df, copy=True):
+        """
+        Replaces every fitted column of `df` by its int64 codes. Values not seen
+        during `fit` get the code -1.
+        Parameters:
+        - df: pandas DataFrame
+        - copy: bool, if False the columns of `df` are replaced in place
+        Returns:
+        - df_encoded: pandas DataFrame
+        """
+        df_encoded = df.copy() if copy else df
+        columns = list(self.categories_)
+        for column, codes in zip(columns, self._map(
+                lambda column: self._encode_column(df[column], self.categories_[column]), columns)):
+            df_encoded[column] = codes
+        return df_encoded
+
+    def fit_encode(self, df, copy=True):
+        """Equivalent to `fit(df).encode(df, copy)`."""
+        return self.fit(df).encode(df, copy=copy)
+
+    def decode(self, df_encoded, copy=True):
+        """
+        Replaces every fitted column of `df_encoded` by its original labels.
+        Codes that are missing, not integer or out of range are decoded as NaN.
+        Parameters:
+        - df_encoded: pandas DataFrame
+        - copy: bool, if False the columns of `df_encoded` are replaced in place
+        Returns:
+        - df_decoded: pandas DataFrame
+        """
+        df_decoded = df_encoded.copy() if copy else df_encoded
+        columns = list(self.categories_)
+        for column, labels in zip(columns, self._map(
+                lambda column: self._decode_column(df_encoded[column], self.categories_[column]), columns)):
+            df_decoded[column] = labels
+        return df_decoded
+
+    def to_encoder_info(self):
+        """Returns the codec in the list of dicts format of `fritas()`."""
+        return [{'column': column,
+                 'labels': list(labels),
+                 'codes': list(range(len(labels)))}
+                for column, labels in self.categories_.items()]
+
+    @classmethod
+    def from_encoder_info(cls, encoder_info, n_jobs=1):
+        """Builds a codec from the encoder information returned by `fritas()`."""
+        codec = cls(n_jobs=n_jobs)
+        codec.categories_ = {}
+        for encoder in encoder_info:
+            # Labels indexed by their code, so that label i decodes code i
+            labels = np.empty(max(encoder['codes'], default=-1) + 1, dtype=object)
+            labels[np.asarray(encoder['codes'], dtype=int)] = encoder['labels']
+            codec.categories_[encoder['column']] = pd.Index(labels)
+        return codec
+
+    def _map(self, func, columns):
+        # Columns are independent, so they can be processed in parallel threads
+        n_jobs = self.n_jobs if self.n_jobs > 0 else os.cpu_count() or 1
+        if n_jobs == 1 or len(columns) < 2:
+            return list(map(func, columns))
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            return list(executor.map(func, columns))
+
+    @staticmethod
+    def _labels(series):
+        # Codes of the values and the str() label of each code, as astype(str)
+        values = series.to_numpy(dtype=object)
+        codes, uniques = pd.factorize(values)
+        if not all(isinstance(unique, str) for unique in uniques):
+            # Values such as 1 and 1.0 factorize together but have different labels
+            codes, uniques = pd.factorize(values.astype(str))
+            return codes, np.asarray(uniques, dtype=object)
+        labels = np.asarray(uniques, dtype=object)
+        missing = codes < 0
+        if missing.any():
+            # factorize merges None and NaN, which astype(str) keeps apart
+            missing_labels, missing_codes = np.unique(values[missing].astype(str), return_inverse=True)
+            codes[missing] = len(labels) + missing_codes
+            labels = np.concatenate([labels, missing_labels.astype(object)])
+        return codes, labels
+
+    @classmethod
+    def _fit_column(cls, series):
+        _, labels = cls._labels(series)
+        return pd.Index(np.unique(labels.astype(str)).astype(object))
+
+    @classmethod
+    def _encode_column(cls, series, categories):
+        codes, labels = cls._labels(series)
+        lookup = categories.get_indexer(labels.astype(str))
+        return lookup.astype(np.int64)[codes]
+
+    @staticmethod
+    def _decode_column(series, categories):
+        codes = series.to_numpy(dtype=np.float64, na_value=-1)
+        valid = (codes >= 0) & (codes < len(categories)) & (codes == np.floor(codes))
+        # The extra last label decodes every invalid code (index -1) as NaN
+        lookup = np.append(categories.to_numpy(dtype=object), np.nan)
+        return lookup[np.where(valid, codes, -1).astype(np.intp)]
+
+
+def fritas(df, n_jobs=1):
     """
     Given a pandas DataFrame, encodes all categorical (object) columns using
     Label Encoding and returns a copy of the encoded DataFrame.
     Parameters:
     - df: pandas DataFrame
+    - n_jobs: int, number of threads used to encode the columns in parallel
     Returns:
     - df_encoded: pandas DataFrame
     - encoder_info: list of dicts
     """
-    df_encoded = df.copy()  # Make a copy of the original DataFrame
-    # Select the categorical columns of the DataFrame
-    object_columns = df_encoded.select_dtypes(include=["object"]).columns
-    encoder_info = []  # Initialize a list to store the encoder information
+    # The codec does the work; encoder_info keeps its historical format
+    codec = Freidora(n_jobs=n_jobs)
+    df_encoded = codec.fit_encode(df)
+    return df_encoded, codec.to_encoder_info()
 
-    for column in object_columns:
-        le = LabelEncoder()  # Create a new LabelEncoder for each categorical column
-        # Fit and transform the LabelEncoder on the column
-        df_encoded[column] = le.fit_transform(df_encoded[column].astype(str))
-        encoder_info.append({  # Store the encoder information in a dictionary
-            'column': column,
-            'labels': list(le.classes_),  # List the original labels
-            'codes': list(le.transform(le.classes_))  # List the encoded codes
-        })
 
-    # Return the encoded DataFrame and the encoder information
-    return df_encoded, encoder_info
+# Hyperparameters tuned by `bravas` for every number of folds
+_BRAVAS_PARAMS = {'model__n_neighbors': [3, 5, 7],
+                  'model__weights': ['uniform', 'distance']}
 
 
-def bravas(df, target_column, min_k=2, max_k=15):
+def _bravas_grafo(X, y, k_values, n_neighbors_grid, weights_grid, random_state=42):
+    """
+    Scores every (k folds, n_neighbors, weights) combination of `bravas` from a
+    single shared neighbour graph instead of refitting one KNeighborsRegressor
+    per fold and candidate.
+    Each row's neighbours are queried once over the whole dataset, sorted by
+    distance; for a given KFold split, the training-set neighbours of a test row
+    are exactly the queried neighbours that do not fall in its own fold.
+    Parameters:
+    - X: numpy array of predictors
+    - y: numpy array of target values
+    - k_values: iterable of int, number of folds to evaluate
+    - n_neighbors_grid: list of int, candidate values of n_neighbors
+    - weights_grid: list of str, candidate values of weights ('uniform', 'distance')
+    - random_state: int, seed of the shuffled KFold (same as the grid search)
+    Returns:
+    - scores: pandas DataFrame with one row per combination and the columns
+      'k', 'n_neighbors', 'weights', 'mean_test_score' and 'std_test_score'
+    """
+    n_samples = X.shape[0]
+    max_n = max(n_neighbors_grid)
+    # Query enough neighbours so that, even with 2 folds (half of them in the
+    # same fold), almost every row keeps max_n valid training neighbours
+    n_query = min(n_samples, 4 * max_n + 1)
+    tree = NearestNeighbors(n_neighbors=n_query).fit(X)
+    dist, ind = tree.kneighbors(X)
+
+    rows = []
+    for k in k_values:
+        # Fold id of every row, reproducing the splits used by GridSearchCV
+        fold = np.empty(n_samples, dtype=np.intp)
+        kf = KFold(n_splits=k, shuffle=True, random_state=random_state)
+        for f, (_, test_index) in enumerate(kf.split(X)):
+            fold[test_index] = f
+
+        nbr_dist, nbr_ind = _vecinos_fuera_del_pliegue(
+            tree, X, fold, dist, ind, max_n)
+        y_nbr = y[nbr_ind]
+
+        for n in n_neighbors_grid:
+            d_n, y_n = nbr_dist[:, :n], y_nbr[:, :n]
+            for weights in weights_grid:
+                if weights == 'uniform':
+                    pred = y_n.mean(axis=1)
+                else:
+                    # Same rule as sklearn: neighbours at distance 0 take all the weight
+                    with np.errstate(divide='ignore'):
+                        w = 1.0 / d_n
+                    inf_mask = np.isinf(w)
+                    inf_row = inf_mask.any(axis=1)
+                    w[inf_row] = inf_mask[inf_row]
+                    pred = (w * y_n).sum(axis=1) / w.sum(axis=1)
+                sq_err = (pred - y) ** 2
+                fold_scores = -np.bincount(fold, weights=sq_err, minlength=k) \
+                    / np.bincount(fold, minlength=k)
+                rows.append({'k': k, 'n_neighbors': n, 'weights': weights,
+                             'mean_test_score': fold_scores.mean(),
+                             'std_test_score': fold_scores.std()})
+
+    return pd.DataFrame(rows)
+
+
+def _vecinos_fuera_del_pliegue(tree, X, fold, dist, ind, n):
+    """
+    Returns, for every row, the distances and indices of its `n` nearest
+    neighbours that belong to a different fold. Rows whose precomputed
+    neighbour list runs short are queried again with a larger list.
+    """
+    n_samples = X.shape[0]
+    out_dist = np.empty((n_samples, n))
+    out_ind = np.empty((n_samples, n), dtype=np.intp)
+    pending = np.arange(n_samples)
+    n_query = ind.shape[1]
+    while pending.size:
+        valid = fold[ind] != fold[pending, None]
+        enough = valid.sum(axis=1) >= n
+        # Positions of the first n valid neighbours of each row (stable order)
+        order = np.argsort(~valid[enough], axis=1, kind='stable')[:, :n]
+        rows = pending[enough]
+        out_dist[rows] = np.take_along_axis(dist[enough], order, axis=1)
+        out_ind[rows] = np.take_along_axis(ind[enough], order, axis=1)
+        pending = pending[~enough]
+        if pending.size:
+            n_query = min(n_samples, 2 * n_query)
+            dist, ind = tree.kneighbors(X[pending], n_neighbors=n_query)
+    return out_dist, out_ind
+
+
+def bravas(df, target_column, min_k=2, max_k=15, engine='graph', return_details=False):
     """
     Given a pandas DataFrame, a target column name, a range of k values and a
     minimum number of samples per fold, performs K-NN regression using cross-validation
     to find the best value of k (number of neighbors) based on the mean squared error.
+    The default 'graph' engine builds the neighbour graph once and scores every
+    fold count and hyperparameter combination from it; the 'grid' engine runs the
+    original GridSearchCV per fold count. Both return the same best_k (up to ties
+    between equidistant neighbours).
     Parameters:
     - df: pandas DataFrame
     - target_column: str, name of the target column
     - min_k: int, minimum number of neighbors to consider
     - max_k: int, maximum number of neighbors to consider
+    - engine: str, 'graph' (default) or 'grid'
+    - return_details: bool, if True also return a dict with the full score table
+      ('scores', pandas DataFrame) and the wall-clock time in seconds ('elapsed')
     Returns:
     - best_k: int, best value of k found
+    - details: dict, only when return_details is True
     """
+    start = time.perf_counter()
     # Instantiate a LabelEncoder object
     le = LabelEncoder()
     # Make a copy of the input DataFrame
@@ -73,28 +304,44 @@ def bravas(df, target_column, min_k=2, max_k=15):
     # Separate the predictors (X) from the target (y)
     X = df_imputed.drop(target_column, axis=1)
     y = df_imputed[target_column]
-    # Define a pipeline for K-NN regression
-    pipeline = Pipeline(steps=[('model', KNeighborsRegressor(n_neighbors=3))])
-    # Set the hyperparameters to tune
-    params = {'model__n_neighbors': [3, 5, 7],
-              'model__weights': ['uniform', 'distance']}
-    best_k = 0
-    best_score = -np.inf
-    # Iterate over a range of k values and perform cross-validation
-    for k in range(min_k, max_k+1):
-        kf = KFold(n_splits=k, shuffle=True, random_state=42)
-        grid_search = GridSearchCV(
-            pipeline, params, cv=kf, scoring='neg_mean_squared_error', n_jobs=-1)
-        grid_search.fit(X, y)
-        # Keep track of the best k and best score found so far
-        if grid_search.best_score_ > best_score:
-            best_score = grid_search.best_score_
-            best_k = k
+    params = _BRAVAS_PARAMS
+
+    if engine == 'graph':
+        scores = _bravas_grafo(X.to_numpy(dtype=float), y.to_numpy(dtype=float),
+                               range(min_k, max_k+1), params['model__n_neighbors'],
+                               params['model__weights'])
+    elif engine == 'grid':
+        # Define a pipeline for K-NN regression
+        pipeline = Pipeline(
+            steps=[('model', KNeighborsRegressor(n_neighbors=3))])
+        tables = []
+        # Iterate over a range of k values and perform cross-validation
+        for k in range(min_k, max_k+1):
+            kf = KFold(n_splits=k, shuffle=True, random_state=42)
+            grid_search = GridSearchCV(
+                pipeline, params, cv=kf, scoring='neg_mean_squared_error', n_jobs=-1)
+            grid_search.fit(X, y)
+            results = grid_search.cv_results_
+            tables.append(pd.DataFrame({
+                'k': k,
+                'n_neighbors': results['param_model__n_neighbors'].astype(int),
+                'weights': results['param_model__weights'].astype(str),
+                'mean_test_score': results['mean_test_score'],
+                'std_test_score': results['std_test_score']}))
+        scores = pd.concat(tables, ignore_index=True)
+    else:
+        raise ValueError("engine must be either 'graph' or 'grid'")
+
+    # Keep the k with the best score (the first one in case of a tie)
+    best_per_k = scores.groupby('k', sort=True)['mean_test_score'].max()
+    best_k = int(best_per_k.idxmax())
+    if return_details:
+        return best_k, {'scores': scores, 'elapsed': time.perf_counter() - start}
     # Return the best value of k found
     return best_k
 
 
-def mojo_picon(df: pd.DataFrame, n_neighbors: int) -> pd.DataFrame:
+def mojo_picon(df: pd.DataFrame, n_neighbors: int, max_memory_mb: float = None) -> pd.DataFrame:
     """
     Imputes missing values in a dataframe using the K-Nearest Neighbors (KNN) strategy.
     Parameters
@@ -103,6 +350,12 @@ def mojo_picon(df: pd.DataFrame, n_neighbors: int) -> pd.DataFrame:
         The dataframe to be imputed.
     n_neighbors : int
         The number of nearest neighbors to consider for imputation. You should use your previous best_k result.
+    max_memory_mb : float, optional
+        If given, imputes in streaming mode: incomplete rows are processed in blocks
+        that fit in this memory budget (in MB), taking the complete donors from an
+        index of the complete rows built once and computing nan_euclidean distances
+        only to the incomplete ones. The output matches KNNImputer to floating-point rounding
+        (absolute tolerance 1e-9) except when two donors tie at the k-th distance.
     Returns
     -------
     pd.DataFrame
@@ -110,11 +363,16 @@ def mojo_picon(df: pd.DataFrame, n_neighbors: int) -> pd.DataFrame:
     """
     # Make a copy of the original dataframe
     df_imputed = df.copy()
-    # Create a KNNImputer object with the specified number of neighbors
-    imputer = KNNImputer(n_neighbors=n_neighbors)
     # Select the numeric columns of the copied dataframe
     numeric_columns = df_imputed.select_dtypes(
         include=['int64', 'float64']).columns
+    if max_memory_mb is not None:
+        df_imputed[numeric_columns] = _mojo_picon_por_bloques(
+            df_imputed[numeric_columns].to_numpy(dtype=np.float64, copy=True),
+            n_neighbors, max_memory_mb)
+        return df_imputed
+    # Create a KNNImputer object with the specified number of neighbors
+    imputer = KNNImputer(n_neighbors=n_neighbors)
     # Impute missing values in the numeric columns of the copied dataframe using KNNImputer
     df_imputed[numeric_columns] = imputer.fit_transform(
         df_imputed[numeric_columns])
@@ -122,39 +380,279 @@ def mojo_picon(df: pd.DataFrame, n_neighbors: int) -> pd.DataFrame:
     return df_imputed
 
 
-def des_fritas(df_encoded, encoder_info):
+def _mojo_picon_por_bloques(values, n_neighbors, max_memory_mb):
+    """
+    Streaming KNN imputation used by `mojo_picon(..., max_memory_mb=...)`.
+    Fills the NaNs of `values` (2D float array, modified in place and returned)
+    like KNNImputer with uniform weights, from two sets of candidate donors:
+    - the nearest complete rows, projected on the columns observed in each
+      missing-value pattern. The complete rows and their squared values are
+      indexed once and shared by every pattern: the projected distances of a
+      block are one matrix product, with no per-pattern tree or copy;
+    - the incomplete rows that observe at least one of the missing columns of
+      the pattern, with their exact nan_euclidean distances.
+    The `n_neighbors` nearest of both sets are KNNImputer's donors, so the output
+    matches it to floating-point rounding (absolute tolerance 1e-9) except when
+    two donors tie at the k-th distance. With fewer than `n_neighbors` complete
+    rows (or none) the same holds: the remaining donors are incomplete rows.
+    Complexity: the distances cost O(n_incomplete * (n_complete + n_incomplete)
+    * n_columns) time in total, as in KNNImputer, since every incomplete row is
+    compared with every complete row and with the incomplete donors. Memory:
+    incomplete rows are processed in blocks whose distance arrays (to the
+    complete rows and to the incomplete donors) fit in `max_memory_mb` MB, with
+    at least one row per block; the index and the copy of the data are not part
+    of the budget.
+    """
+    missing = np.isnan(values)
+    incomplete_mask = missing.any(axis=1)
+    incomplete = np.flatnonzero(incomplete_mask)
+    if incomplete.size == 0:
+        return values
+    n_columns = values.shape[1]
+    # Index of the complete rows, built once for every pattern
+    complete = values[~incomplete_mask]
+    complete_sq = complete ** 2
+    n_complete = complete.shape[0]
+    k_complete = min(n_neighbors, n_complete)
+    # Incomplete rows are donors too, with their values before imputation
+    incomplete_values = values[incomplete]
+    incomplete_missing = missing[incomplete]
+    # Column means, used like KNNImputer for rows with no observed value
+    column_means = np.ma.masked_invalid(values).mean(axis=0).filled(np.nan)
+
+    # Bytes held per incomplete row: its distances to the complete rows and to
+    # the incomplete rows (and the temporaries of nan_euclidean_distances), its
+    # k complete neighbours and the merged candidate distances and values of one column
+    budget = max_memory_mb * 2**20
+    bytes_per_row = 8 * (2 * n_complete + 8 * incomplete.size + 4 * k_complete + n_columns)
+    block_size = max(1, int(budget // bytes_per_row))
+
+    patterns, pattern_of_row = np.unique(
+        incomplete_missing, axis=0, return_inverse=True)
+    pattern_of_row = pattern_of_row.ravel()
+    for p, pattern in enumerate(patterns):
+        rows = incomplete[pattern_of_row == p]
+        observed = ~pattern
+        if not observed.any():
+            values[np.ix_(rows, pattern)] = column_means[pattern]
+            continue
+        # nan_euclidean scales the distance to a complete row by the
+        # fraction of columns observed in the incomplete one
+        scale = n_columns / observed.sum()
+        # Squared norms of the complete rows on the observed columns
+        complete_norms = complete_sq @ observed
+        # Only incomplete rows observing one of the missing columns can donate
+        useful = ~incomplete_missing[:, pattern].all(axis=1)
+        useful_values = incomplete_values[useful]
+        useful_missing = incomplete_missing[useful]
+        for start in range(0, rows.size, block_size):
+            block = rows[start:start + block_size]
+            if k_complete == 0:
+                dist_complete = np.empty((block.size, 0))
+                ind_complete = np.empty((block.size, 0), dtype=np.intp)
+            else:
+                # ||x - c||^2 on the observed columns; the missing ones of the
+                # block are set to 0 so they add nothing to the product
+                X = np.where(pattern, 0.0, values[block])
+                dist = complete_norms - 2 * (X @ complete.T)
+                dist += (X ** 2).sum(axis=1, keepdims=True)
+                ind_complete = np.argpartition(dist, k_complete - 1, axis=1)[:, :k_complete]
+                dist_complete = np.sqrt(np.maximum(
+                    np.take_along_axis(dist, ind_complete, axis=1), 0) * scale)
+                del dist
+            dist_incomplete = nan_euclidean_distances(values[block], useful_values)
+            for column in np.flatnonzero(pattern):
+                donors = ~useful_missing[:, column]
+                # KNNImputer uses every donor when there are fewer than n_neighbors
+                n_donors = min(n_neighbors, n_complete + int(donors.sum()))
+                if n_donors == 0:
+                    values[block, column] = column_means[column]
+                    continue
+                dist = np.hstack([dist_complete, dist_incomplete[:, donors]])
+                dist[np.isnan(dist)] = np.inf
+                donor_values = np.hstack([
+                    complete[ind_complete, column],
+                    np.broadcast_to(useful_values[donors, column], (block.size, donors.sum()))])
+                nearest = np.argpartition(dist, n_donors - 1, axis=1)[:, :n_donors]
+                # Donors sharing no observed column with the row do not count,
+                # and rows without any such donor take the column mean
+                weights = np.isfinite(np.take_along_axis(dist, nearest, axis=1))
+                total = (np.take_along_axis(donor_values, nearest, axis=1) * weights).sum(axis=1)
+                counts = weights.sum(axis=1)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    values[block, column] = np.where(counts > 0, total / counts, column_means[column])
+    return values
+
+
+def des_fritas(df_encoded, encoder_info, n_jobs=1):
     """
     Given a pandas DataFrame that has been encoded with the `fritas()` function and the encoder
     information dictionary returned by that function, decodes all categorical columns and returns
     a copy of the original DataFrame with the encoded columns replaced by their original values. 
-    This function replaces any codes that are not in the original list of labels with -1
+    Codes that are missing or not in the original list of codes are decoded as NaN.
 
     Parameters:
     - df_encoded: pandas DataFrame
-    - encoder_info: list of dicts
+    - encoder_info: list of dicts, or a fitted `Freidora` codec
+    - n_jobs: int, number of threads used to decode the columns in parallel
 
     Returns:
     - df_decoded: pandas DataFrame
     """
-    df_decoded = df_encoded.copy()  # Make a copy of the encoded DataFrame
+    if isinstance(encoder_info, Freidora):
+        codec = encoder_info
+    else:
+        codec = Freidora.from_encoder_info(encoder_info, n_jobs=n_jobs)
+    return codec.decode(df_encoded)
+
 
-    # Loop over each encoder in the encoder_info dictionary
-    for encoder in encoder_info:
-        column = encoder['column']
-        labels = encoder['labels']
-        codes = encoder['codes']
-        le = LabelEncoder()  # Create a new LabelEncoder for the column
-        le.classes_ = np.array(labels)  # Set the original labels
-        # Replace NaN values in the encoded column with -1
-        df_decoded[column].fillna(-1, inplace=True)
-        # Replace any codes that are not in the original list of labels with -1
-        df_decoded[column].where(
-            df_decoded[column].isin(codes), -1, inplace=True)
-        # Inverse transform the codes
-        df_decoded[column] = le.inverse_transform(
-            df_decoded[column].astype(int))
+class HipparcosPreprocessor:
+    """
+    Fused version of the preprocessing chain `fritas` -> `bravas` -> `mojo_picon`
+    -> `des_fritas`. The categorical columns are encoded once into a single
+    buffer that is tuned, imputed and decoded in place, instead of every step
+    copying the full DataFrame.
+    Parameters:
+    - target_column: str, target column used by `bravas` to pick the number of neighbours
+    - min_k, max_k: int, range of fold counts tried by `bravas`
+    - max_memory_mb: float or None, memory budget of the streaming mode of `mojo_picon`
+      (None uses KNNImputer)
+    - n_jobs: int, threads used by the categorical codec
+    - profile_memory: bool, also record the peak of traced memory of each stage.
+      tracemalloc slows every allocation down, so the stage times are only
+      comparable between runs with the same setting
+    Attributes:
+    - codec_: fitted `Freidora`
+    - best_k_: int, number of neighbours used for the imputation
+    - scores_: pandas DataFrame, full score table of the `bravas` search
+    - report_: pandas DataFrame with the seconds of each stage and, with
+      profile_memory, its peak memory (MB)
+    """
 
-    return df_decoded
+    def __init__(self, target_column='SpType', min_k=2, max_k=15, max_memory_mb=None, n_jobs=1,
+                 profile_memory=False):
+        self.target_column = target_column
+        self.min_k = min_k
+        self.max_k = max_k
+        self.max_memory_mb = max_memory_mb
+        self.n_jobs = n_jobs
+        self.profile_memory = profile_memory
+
+    def fit(self, df):
+        """
+        Fits the codec and tunes the number of neighbours on `df`.
+        Returns:
+        - self
+        """
+        self._start_report()
+        self._fit(self._stage('encode', lambda: self._fit_encode(df)))
+        return self
+
+    def transform(self, df):
+        """
+        Encodes, imputes and decodes `df` with the fitted codec and number of neighbours.
+        Returns:
+        - hipparcos: pandas DataFrame, a copy of `df` with its missing values imputed
+        """
+        self._start_report()
+        buffer = self._stage('encode', lambda: self.codec_.encode(df))
+        return self._impute_decode(buffer)
+
+    def fit_transform(self, df):
+        """Equivalent to `fit(df).transform(df)`, encoding `df` only once."""
+        self._start_report()
+        buffer = self._stage('encode', lambda: self._fit_encode(df))
+        self._fit(buffer)
+        return self._impute_decode(buffer)
+
+    def _fit_encode(self, df):
+        self.codec_ = Freidora(n_jobs=self.n_jobs)
+        return self.codec_.fit_encode(df)
+
+    def _fit(self, buffer):
+        def tune():
+            # Same inputs as `bravas`: every column, NaNs replaced by the column
+            # mean, and columns without any value dropped like SimpleImputer does
+            values = buffer.to_numpy(dtype=np.float64, copy=True)
+            observed = ~np.isnan(values).all(axis=0)
+            values = values[:, observed]
+            missing = np.isnan(values)
+            values[missing] = np.take(np.nanmean(values, axis=0),
+                                      np.nonzero(missing)[1])
+            target = buffer.columns[observed].get_loc(self.target_column)
+            scores = _bravas_grafo(np.delete(values, target, axis=1), values[:, target],
+                                   range(self.min_k, self.max_k+1),
+                                   _BRAVAS_PARAMS['model__n_neighbors'],
+                                   _BRAVAS_PARAMS['model__weights'])
+            return scores
+        self.scores_ = self._stage('tune', tune)
+        self.best_k_ = int(self.scores_.groupby('k')['mean_test_score'].max().idxmax())
+
+    def _impute_decode(self, buffer):
+        def impute():
+            numeric_columns = buffer.select_dtypes(
+                include=['int64', 'float64']).columns
+            values = buffer[numeric_columns].to_numpy(dtype=np.float64, copy=True)
+            # Columns without any value stay empty: KNNImputer would drop them
+            observed = ~np.isnan(values).all(axis=0)
+            if self.max_memory_mb is not None:
+                values[:, observed] = _mojo_picon_por_bloques(
+                    values[:, observed], self.best_k_, self.max_memory_mb)
+            else:
+                values[:, observed] = KNNImputer(
+                    n_neighbors=self.best_k_).fit_transform(values[:, observed])
+            buffer[numeric_columns] = values
+            return buffer
+        buffer = self._stage('impute', impute)
+        return self._stage('decode', lambda: self.codec_.decode(buffer, copy=False))
+
+    def _start_report(self):
+        self._report = []
+
+    def _stage(self, name, func):
+        # Times one stage and, with profile_memory, records its peak of traced
+        # memory allocations
+        if not self.profile_memory:
+            start = time.perf_counter()
+            result = func()
+            self._report.append({'stage': name, 'seconds': time.perf_counter() - start})
+            self.report_ = pd.DataFrame(self._report).set_index('stage')
+            return result
+
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            # Tracing started here never outlives the stage, even if it fails
+            if not tracing:
+                tracemalloc.stop()
+        self._report.append(
+            {'stage': name, 'seconds': elapsed, 'peak_mb': peak / 2**20})
+        self.report_ = pd.DataFrame(self._report).set_index('stage')
+        return result
+
+
+def escalador(method='minmax'):
+    """
+    Returns the unfitted scaler that `pure` uses for `method`.
+    Parameters:
+    method (str): the scaling method; must be either 'minmax' or 'standard' (default 'minmax')
+    Returns:
+    sklearn.preprocessing scaler: a new MinMaxScaler or StandardScaler
+    Raises:
+    ValueError: if method is not 'minmax' or 'standard'
+    """
+    if method == 'minmax':
+        return MinMaxScaler()
+    if method == 'standard':
+        return StandardScaler()
+    raise ValueError("method must be either 'minmax' or 'standard'")
 
 
 def pure(df, method='minmax'):
@@ -169,19 +667,11 @@ def pure(df, method='minmax'):
     Raises:
     ValueError: if method is not 'minmax' or 'standard'
     """
-    scaler = None
-    if method == 'minmax':
-        scaler = MinMaxScaler()
-    elif method == 'standard':
-        scaler = StandardScaler()
-
-    if scaler:
-        # Fit and transform the DataFrame using the scaler
-        df_scaled = pd.DataFrame(scaler.fit_transform(df), columns=df.columns)
-        # Return the scaled DataFrame and the scaler object
-        return df_scaled, scaler
-    else:
-        raise ValueError("method must be either 'minmax' or 'standard'")
+    scaler = escalador(method)
+    # Fit and transform the DataFrame using the scaler
+    df_scaled = pd.DataFrame(scaler.fit_transform(df), columns=df.columns)
+    # Return the scaled DataFrame and the scaler object
+    return df_scaled, scaler
 
 
 def cortar_en_tiritas(df, target_column, test_size=0.2, random_state=None):
@@ -283,44 +773,144 @@ def correlation_papa(df, annot=True, figsize=(10, 10), cmap='coolwarm'):
     plt.show()
 
 
-def replace_outliers(df, f=1.5):
+def limites_outliers(df, f=1.5):
+    """
+    Calcula los límites inferior y superior de valores atípicos de cada columna
+    numérica del DataFrame `df` a partir del rango intercuartílico (IQR)
+    multiplicado por el factor de escala `f`. Los límites se pueden reutilizar
+    con `replace_outliers(..., limites=...)` para recortar otro lote de datos.
+
+    Args:
+        df (pandas.DataFrame): El DataFrame con el que se ajustan los límites.
+        f (float, optional): El factor de escala para el rango intercuartílico.
+            Por defecto es 1.5.
+
+    Returns:
+        tuple(pandas.Series, pandas.Series): Los límites inferior y superior,
+        indexados por el nombre de cada columna numérica.
+    """
+    # Selecciona solo las columnas numéricas
+    numeric_cols = df.select_dtypes(include='number').columns
+
+    # Calcula los dos cuartiles de todas las columnas en una sola llamada
+    Q1, Q3 = df[numeric_cols].quantile([0.25, 0.75]).to_numpy()
+    IQR = Q3 - Q1  # rango intercuartílico
+    lower_bound = pd.Series(Q1 - f * IQR, index=numeric_cols)  # límite inferior
+    upper_bound = pd.Series(Q3 + f * IQR, index=numeric_cols)  # límite superior
+    return lower_bound, upper_bound
+
+
+def replace_outliers(df, f=1.5, limites=None, inplace=True):
     """
     Reemplaza los valores atípicos en las columnas numéricas del DataFrame `df`
     con los límites inferior y superior. Los valores atípicos se definen como
     aquellos que se encuentran fuera del rango definido por el rango intercuartílico
     (IQR) multiplicado por el factor de escala `f`. Luego, la función convierte
-    los valores numéricos a int o float según corresponda.
+    cada columna numérica a int si todos sus valores son enteros, o a float en
+    caso contrario.
 
     Args:
         df (pandas.DataFrame): El DataFrame que se usará para reemplazar los valores atípicos.
         f (float, optional): El factor de escala para el rango intercuartílico.
             Por defecto es 1.5.
+        limites (tuple, optional): Límites (inferior, superior) devueltos por
+            `limites_outliers`, ajustados sobre otro conjunto de datos. Si es None
+            se calculan sobre `df`.
+        inplace (bool, optional): Si es True (por defecto) modifica `df` sin
+            copiarlo; si es False trabaja sobre una copia y deja `df` intacto.
 
     Returns:
         pandas.DataFrame: El DataFrame `df` con los valores atípicos reemplazados y
         los valores numéricos convertidos.
     """
+    if not inplace:
+        df = df.copy()
 
-    # Selecciona solo las columnas numéricas
-    numeric_cols = df.select_dtypes(include='number').columns
-
-    # Calcula los cuartiles y el rango intercuartílico para cada columna numérica
-    Q1 = df[numeric_cols].quantile(0.25)  # primer cuartil
-    Q3 = df[numeric_cols].quantile(0.75)  # tercer cuartil
-    IQR = Q3 - Q1  # rango intercuartílico
-    lower_bound = Q1 - f * IQR  # límite inferior
-    upper_bound = Q3 + f * IQR  # límite superior
+    # Límites ajustados sobre este DataFrame o reutilizados de otro
+    lower_bound, upper_bound = limites if limites is not None else limites_outliers(df, f)
+    numeric_cols = lower_bound.index
 
-    # Reemplaza los valores atípicos por los límites inferior y superior para cada columna numérica
-    for col in numeric_cols:
-        df.loc[df[col] < lower_bound[col], col] = lower_bound[col]
-        df.loc[df[col] > upper_bound[col], col] = upper_bound[col]
+    # Recorta todas las columnas numéricas a la vez con sus límites respectivos
+    clipped = df[numeric_cols].clip(lower_bound, upper_bound, axis=1)
 
-    # Convierte los valores numéricos a int o float según corresponda
-    if df[numeric_cols].applymap(lambda x: x.is_integer() if isinstance(x, float) else True).all().all():
-        df[numeric_cols] = df[numeric_cols].astype(float)
-    else:
-        df[numeric_cols] = df[numeric_cols].astype(int)
+    # Comprueba por columna, de forma vectorizada, si todos los valores son
+    # enteros; ±inf también cumple x == round(x) pero no se puede pasar a int
+    values = clipped.to_numpy(dtype=float)
+    is_integer = (np.isfinite(values) & (values == np.round(values))).all(axis=0)
+    df[numeric_cols] = clipped.astype(
+        {col: int if entera else float for col, entera in zip(numeric_cols, is_integer)})
 
     # Retorna el dataframe con los valores atípicos reemplazados y los valores numéricos convertidos
     return df
+
+
+def add_derived_columns(df):
+    """
+    Adds the derived astrophysical columns (d, T, M_v, M_Hip and, if missing, the
+    colour index approximations) and the spectral type and class extracted from
+    SpType, computed with `utils.derivadas`.
+    Parameters:
+    - df: pandas DataFrame with at least the Vmag, B-V and Plx columns
+    Returns:
+    - df: the same DataFrame with the new columns
+    """
+    derived = columnas_derivadas(**argumentos_desde_columnas(df))
+    for column, values in derived.items():
+        if column not in df:
+            df[column] = values
+    if 'SpType' in df:
+        df['Tipo_espectral'], df['Clase_espectral'] = clasificacion_espectral(
+            df['SpType'].to_numpy())
+    return df
+
+
+def main(argv=None):
+    """
+    Command line entry point that regenerates the preprocessed catalog from the
+    raw Hipparcos CSV with `HipparcosPreprocessor`. The CSV is first streamed
+    into typed parquet files with `utils.ingesta`, which only reads the columns
+    that are kept:
+
+        python -m utils.funciones --input data/hipparcos.csv --output data/hipparcos_final.parquet
+    """
+    parser = argparse.ArgumentParser(
+        description='Regenerates the preprocessed Hipparcos catalog from the raw CSV.')
+    parser.add_argument('--input', default='data/hipparcos.csv',
+                        help='raw Hipparcos CSV (default: %(default)s)')
+    parser.add_argument('--output', default='data/hipparcos_final.parquet',
+                        help='preprocessed catalog (default: %(default)s)')
+    parser.add_argument('--variables', default='data/variables.parquet',
+                        help='variability columns (default: %(default)s)')
+    parser.add_argument('--raw', default=RUTA_BRUTO,
+                        help='typed raw catalog written by utils.ingesta (default: %(default)s)')
+    parser.add_argument('--target-column', default='SpType')
+    parser.add_argument('--min-k', type=int, default=2)
+    parser.add_argument('--max-k', type=int, default=15)
+    parser.add_argument('--max-memory-mb', type=float, default=None,
+                        help='memory budget of the streaming imputation (default: KNNImputer)')
+    parser.add_argument('--n-jobs', type=int, default=1)
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='also report the peak memory of each stage (slower)')
+    args = parser.parse_args(argv)
+
+    # float64 keeps the CSV values exact, so outlier bounds, imputation and the
+    # derived columns match the old read_csv path
+    ingerir(args.input, args.raw, args.variables, reales='float64')
+    df = pd.read_parquet(args.raw)
+    # The preprocessor imputes the int64 columns, as read_csv returned them
+    df = df.astype({c: np.int64 for c in df.select_dtypes('int32')})
+
+    preprocessor = HipparcosPreprocessor(
+        target_column=args.target_column, min_k=args.min_k, max_k=args.max_k,
+        max_memory_mb=args.max_memory_mb, n_jobs=args.n_jobs,
+        profile_memory=args.profile_memory)
+    hipparcos = preprocessor.fit_transform(df)
+    hipparcos = add_derived_columns(hipparcos)
+    hipparcos.to_parquet(args.output, index=False)
+
+    print(f'best_k: {preprocessor.best_k_}')
+    print(preprocessor.report_.to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+'''
+Índices secundarios de un catálogo para filtrar sin recorrer columnas enteras.
+
+Las columnas numéricas se indexan con la permutación que las ordena, de modo que
+un rango de valores se resuelve con dos búsquedas binarias, y las categóricas
+con un bitmap empaquetado por categoría, que se combinan con AND y OR a razón de
+un byte por cada ocho estrellas. Las consultas devuelven arrays de posiciones de
+fila, no copias de los datos.
+'''
+
+import numpy as np
+
+
+# Columnas que se indexan cuando el catálogo las tiene
+NUMERICAS = ('Vmag', 'd', 'Plx')
+CATEGORICAS = ('Tipo_espectral', 'Clase_espectral', 'HvarType')
+
+
+class IndiceOrdenado:
+    """
+    Permutación que ordena una columna numérica; los nulos quedan fuera.
+
+    Args:
+        valores (array): Valores de la columna.
+    """
+
+    def __init__(self, valores):
+        self.valores = np.asarray(valores)
+        orden = np.argsort(self.valores, kind='stable')
+        # argsort deja los NaN al final
+        n_validos = int(np.count_nonzero(~np.isnan(self.valores)))
+        self.orden = orden[:n_validos]
+        self.ordenados = self.valores[self.orden]
+        self.orden.setflags(write=False)
+
+    def rango(self, minimo=None, maximo=None, incluir_maximo=False):
+        """
+        Filas con `minimo` <= valor < `maximo` (<= si `incluir_maximo`), en
+        orden de valor. Es una vista de la permutación: no se debe modificar.
+        """
+        inicio = 0 if minimo is None else np.searchsorted(
+            self.ordenados, self._limite(minimo, arriba=True), 'left')
+        if maximo is None:
+            fin = len(self.orden)
+        elif incluir_maximo:
+            fin = np.searchsorted(self.ordenados, self._limite(maximo, arriba=False), 'right')
+        else:
+            fin = np.searchsorted(self.ordenados, self._limite(maximo, arriba=True), 'left')
+        return self.orden[inicio:fin]
+
+    def _limite(self, valor, arriba):
+        # El límite se pasa al tipo de la columna (si no, searchsorted convierte
+        # la columna entera) redondeando hacia el lado que no cambia el resultado
+        tipo = self.ordenados.dtype.type
+        limite = tipo(valor)
+        if arriba and limite < valor:
+            limite = np.nextafter(limite, tipo(np.inf))
+        elif not arriba and limite > valor:
+            limite = np.nextafter(limite, tipo(-np.inf))
+        return limite
+
+    def contiene(self, filas, minimo=None, maximo=None, incluir_maximo=False):
+        """Máscara de las `filas` cuyo valor está en el rango (los nulos nunca lo están)."""
+        valores = self.valores[filas]
+        mascara = ~np.isnan(valores) if minimo is None else valores >= minimo
+        if maximo is not None:
+            mascara &= valores <= maximo if incluir_maximo else valores < maximo
+        return mascara
+
+
+class IndiceBitmap:
+    """
+    Un bitmap por categoría de una columna categórica (bit i = fila i).
+
+    Args:
+        valores (pandas.Categorical): Valores de la columna.
+    """
+
+    def __init__(self, valores):
+        codigos = np.asarray(valores.codes)
+        self.n = len(codigos)
+        self.bitmaps = {categoria: np.packbits(codigos == k, bitorder='little')
+                        for k, categoria in enumerate(valores.categories)}
+
+    @property
+    def categorias(self):
+        return list(self.bitmaps)
+
+    def bitmap(self, *categorias):
+        """Bitmap de las filas de cualquiera de `categorias` (OR); vacío si no existen."""
+        resultado = np.zeros((self.n + 7) // 8, dtype=np.uint8)
+        for categoria in categorias:
+            if categoria in self.bitmaps:
+                resultado |= self.bitmaps[categoria]
+        return resultado
+
+    def recuento(self, categoria):
+        """Número de filas de `categoria` sin recorrer la columna."""
+        if categoria not in self.bitmaps:
+            return 0
+        return int(np.unpackbits(self.bitmaps[categoria], count=self.n, bitorder='little').sum())
+
+
+def filas_bitmap(bitmap, n):
+    """Posiciones de fila de los bits activos de `bitmap`."""
+    return np.flatnonzero(np.unpackbits(bitmap, count=n, bitorder='little'))
+
+
+def bits(bitmap, filas):
+    """Máscara con el bit de `bitmap` de cada una de `filas`."""
+    filas = np.asarray(filas)
+    return ((bitmap[filas >> 3] >> (filas & 7).astype(np.uint8)) & 1).astype(bool)
+
+
+class IndicesCatalogo:
+    """
+    Índices secundarios de las columnas de un `Catalogo` y API de consulta.
+
+    Args:
+        catalogo (Catalogo): Handle del catálogo.
+        numericas (tuple): Columnas numéricas a indexar, si existen.
+        categoricas (tuple): Columnas categóricas a indexar, si existen.
+    """
+
+    def __init__(self, catalogo, numericas=NUMERICAS, categoricas=CATEGORICAS):
+        self.n = len(catalogo)
+        nombres = set(catalogo.nombres)
+        columnas = catalogo.columnas(*[c for c in numericas + categoricas if c in nombres])
+        self.ordenados = {c: IndiceOrdenado(v) for c, v in columnas.items() if c in numericas}
+        self.bitmaps = {c: IndiceBitmap(v) for c, v in columnas.items() if c in categoricas}
+
+    def rango(self, columna, minimo=None, maximo=None, incluir_maximo=False):
+        """Filas con `minimo` <= `columna` < `maximo`, en orden de valor."""
+        return self.ordenados[columna].rango(minimo, maximo, incluir_maximo)
+
+    def categorias(self, columna, *valores):
+        """Filas (en orden) cuya `columna` es alguno de `valores`."""
+        return filas_bitmap(self.bitmaps[columna].bitmap(*valores), self.n)
+
+    def consulta(self, rangos=None, categorias=None):
+        """
+        Filas que cumplen todos los filtros (AND entre columnas, OR entre los
+        valores de una misma columna categórica).
+
+        Args:
+            rangos (dict): Columna numérica -> (mínimo, máximo), con None para
+                un extremo abierto; el máximo se excluye.
+            categorias (dict): Columna categórica -> lista de valores.
+
+        Returns:
+            numpy.ndarray: Posiciones de fila en orden creciente.
+        """
+        rangos, categorias = rangos or {}, categorias or {}
+        bitmap = None
+        for columna, valores in categorias.items():
+            mascara = self.bitmaps[columna].bitmap(*valores)
+            bitmap = mascara if bitmap is None else bitmap & mascara
+
+        if not rangos:
+            if bitmap is None:
+                return np.arange(self.n)
+            return filas_bitmap(bitmap, self.n)
+
+        # Se parte del rango más selectivo y el resto de filtros se comprueban
+        # solo sobre esas filas
+        candidatos = {c: self.rango(c, *limites) for c, limites in rangos.items()}
+        columna = min(candidatos, key=lambda c: len(candidatos[c]))
+        filas = np.sort(candidatos[columna])
+        for otra, limites in rangos.items():
+            if otra != columna:
+                filas = filas[self.ordenados[otra].contiene(filas, *limites)]
+        if bitmap is not None:
+            filas = filas[bits(bitmap, filas)]
+        return filas
@@ -0,0 +1,174 @@
+'''
+Ingesta por bloques del CSV del catálogo Hipparcos de Kaggle.
+
+El CSV se lee en bloques del tamaño de un grupo de filas, solo con las columnas
+que usa el proyecto y con un tipo fijo para cada una (reales en float32 salvo
+las posiciones, enteros con nulos y cadenas), de modo que pandas no infiere
+tipos ni lee las ~25 columnas que el preprocesamiento descartaba después de
+cargarlas. El preprocesamiento de `utils.funciones` pide los reales en float64
+para imputar exactamente los mismos valores que leía `read_csv`. Cada bloque se escribe directamente como un grupo de filas de dos
+parquets, el del catálogo y el de las columnas de variabilidad, comprimidos y
+con estadísticas por columna; la memoria no depende del tamaño del CSV.
+
+Uso (desde la raíz del proyecto):
+
+    python -m utils.ingesta data/hipparcos.csv
+    python -m utils.ingesta data/hipparcos.csv --salida data/hipparcos_bruto.parquet --compresion snappy
+    python -m utils.ingesta data/hipparcos.csv --reales float64
+'''
+
+import argparse
+import os
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.catalogo import RUTA_VARIABLES
+
+
+RUTA_CSV = 'data/hipparcos.csv'
+RUTA_BRUTO = 'data/hipparcos_bruto.parquet'
+FILAS_GRUPO = 65_536
+COMPRESION = 'zstd'
+
+# Columnas del catálogo que se conservan y su tipo en pandas; las que no están
+# aquí (Proxy, VarFlag, CCDM, Survey, Notes, ...) no se leen
+COLUMNAS_CATALOGO = {
+    'HIP': 'int32', 'RAhms': 'string', 'DEdms': 'string', 'Vmag': 'float32', 'r_Vmag': 'string',
+    # Las posiciones necesitan float64 para no perder los milisegundos de arco
+    'RAdeg': 'float64', 'DEdeg': 'float64',
+    'Plx': 'float32', 'pmRA': 'float32', 'pmDE': 'float32',
+    'e_RAdeg': 'float32', 'e_DEdeg': 'float32', 'e_Plx': 'float32', 'e_pmRA': 'float32', 'e_pmDE': 'float32',
+    'DE:RA': 'float32', 'Plx:RA': 'float32', 'Plx:DE': 'float32', 'pmRA:RA': 'float32',
+    'pmRA:DE': 'float32', 'pmRA:Plx': 'float32', 'pmDE:RA': 'float32', 'pmDE:DE': 'float32',
+    'pmDE:Plx': 'float32', 'pmDE:pmRA': 'float32', 'F1': 'float32', 'F2': 'float32',
+    'BTmag': 'float32', 'e_BTmag': 'float32', 'VTmag': 'float32', 'e_VTmag': 'float32',
+    'B-V': 'float32', 'e_B-V': 'float32', 'r_B-V': 'string',
+    'V-I': 'float32', 'e_V-I': 'float32', 'r_V-I': 'string',
+    'Hpmag': 'float32', 'e_Hpmag': 'float32', 'Hpscat': 'float32', 'o_Hpmag': 'Int32',
+    'Hpmax': 'float32', 'HPmin': 'float32', 'Ncomp': 'Int32', 'HD': 'Int32',
+    '(V-I)red': 'float32', 'SpType': 'string', 'r_SpType': 'string',
+}
+# Columnas de variabilidad, que se guardan aparte en variables.parquet
+COLUMNAS_VARIABLES = {
+    'Period': 'float32', 'HvarType': 'string', 'moreVar': 'float32', 'morePhoto': 'string',
+}
+
+TIPOS_ARROW = {
+    'float32': pa.float32(), 'float64': pa.float64(), 'int32': pa.int32(),
+    'Int32': pa.int32(), 'string': pa.string(),
+}
+
+
+def esquema(columnas, presentes):
+    """Esquema de Arrow de las `columnas` (nombre -> tipo) que están en `presentes`."""
+    return pa.schema([pa.field(nombre, TIPOS_ARROW[tipo], nullable=tipo != 'int32')
+                      for nombre, tipo in columnas.items() if nombre in presentes])
+
+
+class _Escritor:
+    # ParquetWriter sobre un temporal que solo se renombra al terminar bien
+
+    def __init__(self, ruta, esquema, compresion):
+        os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+        self.ruta, self.esquema = ruta, esquema
+        self.temporal = f'{ruta}.{os.getpid()}.tmp'
+        self.escritor = pq.ParquetWriter(self.temporal, esquema, compression=compresion,
+                                         write_statistics=True)
+
+    def escribir(self, bloque):
+        tabla = pa.Table.from_pandas(bloque[self.esquema.names], schema=self.esquema,
+                                     preserve_index=False)
+        self.escritor.write_table(tabla, row_group_size=len(tabla))
+
+    def cerrar(self, correcto):
+        self.escritor.close()
+        if correcto:
+            os.replace(self.temporal, self.ruta)
+        else:
+            os.remove(self.temporal)
+
+
+def ingerir(entrada=RUTA_CSV, salida=RUTA_BRUTO, variables=RUTA_VARIABLES,
+            filas_grupo=FILAS_GRUPO, compresion=COMPRESION, reales='float32'):
+    """
+    Convierte el CSV `entrada` en los parquets `salida` (catálogo) y
+    `variables` (variabilidad), leyendo y escribiendo un grupo de filas cada vez.
+
+    Args:
+        entrada (str): CSV del catálogo Hipparcos.
+        salida (str): Parquet con las columnas de `COLUMNAS_CATALOGO`.
+        variables (str): Parquet con las columnas de `COLUMNAS_VARIABLES`.
+        filas_grupo (int): Filas por bloque de lectura y por grupo de filas.
+        compresion (str): Códec de los parquets ('zstd', 'snappy', 'gzip', 'none').
+        reales (str): Tipo de las columnas float32 ('float32' o 'float64'). En
+            float32, 9.1 se guarda como 9.100000381...: basta para la app, pero
+            no reproduce los valores del CSV.
+
+    Returns:
+        dict: Filas, grupos de filas, segundos, filas por segundo, columnas
+        del CSV que no se han leído y tamaño en bytes de cada parquet escrito.
+        Si el CSV no tiene ninguna columna de uno de los parquets, ese no se escribe.
+    """
+    inicio = time.perf_counter()
+    if reales not in ('float32', 'float64'):
+        raise ValueError(f"reales debe ser 'float32' o 'float64', no {reales!r}")
+    cabecera = pd.read_csv(entrada, nrows=0).columns
+    catalogo, variabilidad = (
+        {nombre: reales if tipo == 'float32' else tipo for nombre, tipo in columnas.items()}
+        for columnas in (COLUMNAS_CATALOGO, COLUMNAS_VARIABLES))
+    esquemas = {salida: esquema(catalogo, cabecera), variables: esquema(variabilidad, cabecera)}
+    tipos = {**catalogo, **variabilidad}
+    usecols = [c for c in cabecera if c in tipos]
+
+    # Un parquet sin columnas en el CSV (p. ej. sin las de variabilidad) no se escribe
+    escritores = [_Escritor(ruta, e, compresion) for ruta, e in esquemas.items() if len(e)]
+    filas = grupos = 0
+    correcto = False
+    try:
+        for bloque in pd.read_csv(entrada, usecols=usecols, chunksize=filas_grupo,
+                                  dtype={c: tipos[c] for c in usecols}):
+            for escritor in escritores:
+                escritor.escribir(bloque)
+            filas += len(bloque)
+            grupos += 1
+        correcto = True
+    finally:
+        for escritor in escritores:
+            escritor.cerrar(correcto)
+
+    segundos = time.perf_counter() - inicio
+    return {'filas': filas, 'grupos': grupos, 'segundos': segundos,
+            'filas_por_segundo': filas / segundos if segundos else 0.0,
+            'sin_leer': [c for c in cabecera if c not in tipos],
+            'bytes': {e.ruta: os.path.getsize(e.ruta) for e in escritores}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Convierte por bloques el CSV del catálogo Hipparcos en parquets tipados.')
+    parser.add_argument('entrada', nargs='?', default=RUTA_CSV,
+                        help='CSV del catálogo (por defecto: %(default)s)')
+    parser.add_argument('--salida', default=RUTA_BRUTO,
+                        help='parquet del catálogo (por defecto: %(default)s)')
+    parser.add_argument('--variables', default=RUTA_VARIABLES,
+                        help='parquet de variabilidad (por defecto: %(default)s)')
+    parser.add_argument('--filas-grupo', type=int, default=FILAS_GRUPO)
+    parser.add_argument('--compresion', default=COMPRESION)
+    parser.add_argument('--reales', choices=['float32', 'float64'], default='float32',
+                        help='tipo de las medidas (por defecto: %(default)s)')
+    args = parser.parse_args(argv)
+
+    r = ingerir(args.entrada, args.salida, args.variables, args.filas_grupo, args.compresion,
+                args.reales)
+    print(f'{r["filas"]} filas en {r["grupos"]} grupos de filas en {r["segundos"]:.2f} s '
+          f'({r["filas_por_segundo"]:,.0f} filas/s)')
+    for ruta, n in r['bytes'].items():
+        print(f'{ruta}: {n / 1e6:.1f} MB')
+    if r['sin_leer']:
+        print(f'Columnas sin leer ({len(r["sin_leer"])}): {", ".join(r["sin_leer"])}')
+
+
+if __name__ == '__main__':
+    main()
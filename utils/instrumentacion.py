@@ -0,0 +1,216 @@
+'''
+Instrumentación de las funciones críticas de la app.
+
+El decorador `instrumentar` registra por función un histograma de latencias, el
+número de filas de entrada y, si se le pasa el contador de la caché que hay
+debajo, los aciertos y fallos de cada llamada. Los resultados se ven en un panel
+de la barra lateral y se exportan en el formato de texto de Prometheus a un
+fichero y, opcionalmente, a un endpoint HTTP local.
+
+Solo se activa con la variable de entorno HIPPARCOS_INSTRUMENTACION=1. Si no
+está activa, `instrumentar` devuelve la función sin envolver y el panel no
+muestra nada, de modo que no añade ningún coste:
+
+    HIPPARCOS_INSTRUMENTACION=1 streamlit run app.py
+    HIPPARCOS_INSTRUMENTACION=1 HIPPARCOS_METRICAS_PUERTO=9464 streamlit run app.py
+'''
+
+import bisect
+import collections
+import functools
+import http.server
+import os
+import threading
+import time
+import pandas as pd
+import streamlit as st
+
+from utils.catalogo import DIRECTORIO_CACHE
+
+
+ACTIVA = os.environ.get('HIPPARCOS_INSTRUMENTACION', '') not in ('', '0')
+RUTA_METRICAS = os.environ.get('HIPPARCOS_METRICAS_FICHERO',
+                               os.path.join(DIRECTORIO_CACHE, 'metricas.prom'))
+PUERTO_METRICAS = int(os.environ.get('HIPPARCOS_METRICAS_PUERTO', 0))
+# Límites superiores (segundos) de las cubetas del histograma de latencias
+LIMITES = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Resultado de una llamada cacheada que no llega a la caché de debajo
+ACIERTO_MEMORIA = 'memoria'
+
+# Nombre de la función -> Metrica
+metricas = {}
+_cerrojo = threading.Lock()
+
+
+class Metrica:
+    """Latencias, filas de entrada, errores y resultados de caché de una función."""
+
+    def __init__(self):
+        self.cubetas = [0] * (len(LIMITES) + 1)
+        self.llamadas = 0
+        self.segundos = 0.0
+        self.filas = 0
+        self.errores = 0
+        self.cache = collections.Counter()
+
+    def cuantil(self, q):
+        """Límite superior de la cubeta que contiene el cuantil `q` de las latencias."""
+        acumulado = 0
+        for limite, n in zip(LIMITES + (float('inf'),), self.cubetas):
+            acumulado += n
+            if acumulado >= q * self.llamadas:
+                return limite
+        return float('inf')
+
+
+def instrumentar(funcion=None, nombre=None, filas=0, cache=None):
+    """
+    Decorador que mide cada llamada a `funcion`. Se coloca por encima de los
+    decoradores de caché para medir también las llamadas que resuelven.
+
+    Args:
+        nombre (str): Nombre de la métrica (por defecto, el de la función).
+        filas (int): Posición del argumento cuya longitud son las filas de
+            entrada, o None si la función no recibe filas.
+        cache (collections.Counter): Contador de aciertos y fallos de la caché
+            que hay por debajo de la de Streamlit. Cada llamada cuenta como el
+            resultado cuyo contador aumenta o, si no aumenta ninguno, como
+            acierto en memoria.
+    """
+    if funcion is None:
+        return functools.partial(instrumentar, nombre=nombre, filas=filas, cache=cache)
+    if not ACTIVA:
+        return funcion
+    nombre = nombre or funcion.__qualname__
+
+    @functools.wraps(funcion)
+    def envoltorio(*args, **kwargs):
+        antes = dict(cache) if cache is not None else None
+        inicio = time.perf_counter()
+        try:
+            resultado = funcion(*args, **kwargs)
+        except Exception:
+            _registrar(nombre, time.perf_counter() - inicio, args, filas, error=True)
+            raise
+        segundos = time.perf_counter() - inicio
+        _registrar(nombre, segundos, args, filas,
+                   origen=_origen(antes, cache) if cache is not None else None)
+        return resultado
+
+    return envoltorio
+
+
+def _origen(antes, cache):
+    for clave, n in cache.items():
+        if n > antes.get(clave, 0):
+            return clave
+    return ACIERTO_MEMORIA
+
+
+def _registrar(nombre, segundos, args, filas, error=False, origen=None):
+    n_filas = len(args[filas]) if filas is not None and len(args) > filas \
+        and hasattr(args[filas], '__len__') else 0
+    with _cerrojo:
+        metrica = metricas.setdefault(nombre, Metrica())
+        metrica.cubetas[bisect.bisect_left(LIMITES, segundos)] += 1
+        metrica.llamadas += 1
+        metrica.segundos += segundos
+        metrica.filas += n_filas
+        metrica.errores += error
+        if origen is not None:
+            metrica.cache[origen] += 1
+
+
+def resumen():
+    """Una fila por función instrumentada con sus llamadas, latencias, filas y caché."""
+    with _cerrojo:
+        filas = []
+        for nombre, m in sorted(metricas.items()):
+            filas.append({
+                'función': nombre, 'llamadas': m.llamadas,
+                'media_ms': 1000 * m.segundos / m.llamadas,
+                'p50_ms': 1000 * m.cuantil(0.5), 'p95_ms': 1000 * m.cuantil(0.95),
+                'filas': m.filas, 'errores': m.errores,
+                **{f'cache_{origen}': n for origen, n in sorted(m.cache.items())},
+            })
+    return filas
+
+
+def texto_prometheus():
+    """Métricas en el formato de exposición de texto de Prometheus."""
+    lineas = ['# HELP hipparcos_llamada_segundos Latencia de las llamadas a cada función.',
+              '# TYPE hipparcos_llamada_segundos histogram']
+    with _cerrojo:
+        elementos = sorted(metricas.items())
+        for nombre, m in elementos:
+            acumulado = 0
+            for limite, n in zip(LIMITES + (float('inf'),), m.cubetas):
+                acumulado += n
+                le = '+Inf' if limite == float('inf') else repr(float(limite))
+                lineas.append(f'hipparcos_llamada_segundos_bucket{{funcion="{nombre}",le="{le}"}} {acumulado}')
+            lineas.append(f'hipparcos_llamada_segundos_sum{{funcion="{nombre}"}} {m.segundos!r}')
+            lineas.append(f'hipparcos_llamada_segundos_count{{funcion="{nombre}"}} {m.llamadas}')
+        lineas += ['# HELP hipparcos_filas_total Filas de entrada procesadas por cada función.',
+                   '# TYPE hipparcos_filas_total counter']
+        lineas += [f'hipparcos_filas_total{{funcion="{nombre}"}} {m.filas}' for nombre, m in elementos]
+        lineas += ['# HELP hipparcos_errores_total Llamadas que terminaron con una excepción.',
+                   '# TYPE hipparcos_errores_total counter']
+        lineas += [f'hipparcos_errores_total{{funcion="{nombre}"}} {m.errores}' for nombre, m in elementos]
+        lineas += ['# HELP hipparcos_cache_total Llamadas por resultado de la caché.',
+                   '# TYPE hipparcos_cache_total counter']
+        lineas += [f'hipparcos_cache_total{{funcion="{nombre}",resultado="{origen}"}} {n}'
+                   for nombre, m in elementos for origen, n in sorted(m.cache.items())]
+    return '\n'.join(lineas) + '\n'
+
+
+def volcar(ruta=RUTA_METRICAS):
+    """Escribe las métricas en `ruta` (reemplazo atómico, para lectores concurrentes)."""
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        f.write(texto_prometheus())
+    os.replace(temporal, ruta)
+
+
+class _Manejador(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        cuerpo = texto_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+@st.cache_resource()
+def servir(puerto=PUERTO_METRICAS):
+    """
+    Sirve las métricas en http://127.0.0.1:`puerto`/metrics desde un hilo. Se
+    arranca una vez por proceso; si el puerto está ocupado (otro proceso de la
+    app ya lo sirve) devuelve None.
+    """
+    try:
+        servidor = http.server.ThreadingHTTPServer(('127.0.0.1', puerto), _Manejador)
+    except OSError:
+        return None
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def panel():
+    """Panel de depuración en la barra lateral; también vuelca las métricas a disco."""
+    if not ACTIVA:
+        return
+    if PUERTO_METRICAS:
+        servir()
+    volcar()
+    expander = st.sidebar.expander("Instrumentación")
+    expander.dataframe(pd.DataFrame(resumen()), hide_index=True)
+    expander.caption(f"Métricas de Prometheus en {RUTA_METRICAS}"
+                     + (f" y en http://127.0.0.1:{PUERTO_METRICAS}/metrics" if PUERTO_METRICAS else ""))
@@ -0,0 +1,166 @@
+'''
+Registro de los modelos de output/ con carga perezosa.
+
+El registro descubre los artefactos del directorio (pickles y modelos exportados
+con `utils.servicio`) y no lee ninguno hasta que se usa: la primera vez que se
+pide un modelo se calcula el hash de su contenido, de modo que los ficheros
+idénticos se cargan una sola vez.
+De cada modelo cargado guarda el tiempo de carga y la memoria que ocupa, estimada
+a partir del artefacto, y si se supera el límite de memoria descarga los que se
+usaron hace más tiempo.
+'''
+
+import collections
+import glob
+import hashlib
+import os
+import threading
+import time
+import joblib
+
+from utils import servicio
+from utils.cache_figuras import huella_fichero
+
+
+DIRECTORIO_MODELOS = 'output'
+# Memoria máxima ocupada por los modelos cargados
+MAX_BYTES_MODELOS = 256 * 2**20
+
+
+class RegistroModelos:
+    """
+    Modelos de un directorio, cargados la primera vez que se piden.
+
+    Args:
+        directorio (str): Directorio donde se buscan los modelos.
+        max_bytes (int): Memoria máxima de los modelos cargados a la vez.
+        convertir (callable, optional): Se aplica a cada pickle recién cargado,
+            p. ej. para pasarlo al formato de servicio con `servicio.convertir`.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_MODELOS, max_bytes=MAX_BYTES_MODELOS, convertir=None):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.convertir = convertir
+        # nombre -> ruta registrada; nombre -> hash del contenido, calculado la
+        # primera vez que se pide; hash -> ruta del artefacto que se carga
+        self.nombres = {}
+        self.huellas = {}
+        self.rutas = {}
+        # hash -> modelo cargado, del usado hace más tiempo al más reciente
+        self.cargados = collections.OrderedDict()
+        self.estadisticas = {}
+        # Peticiones resueltas con un modelo ya cargado y peticiones que lo cargan
+        self.cargas = collections.Counter()
+        self._cerrojo = threading.Lock()
+        self.descubrir()
+
+    def descubrir(self):
+        """Registra cada pickle y cada modelo exportado del directorio por su nombre."""
+        pickles = glob.glob(os.path.join(self.directorio, '*.pkl'))
+        exportados = glob.glob(os.path.join(self.directorio, '**', 'meta.json'), recursive=True)
+        for ruta in sorted(pickles) + sorted(os.path.dirname(m) for m in exportados):
+            nombre = os.path.splitext(os.path.relpath(ruta, self.directorio))[0]
+            self.registrar(nombre, ruta)
+
+    def registrar(self, nombre, *rutas):
+        """
+        Registra `nombre` con la primera de `rutas` que exista, sin leerla. Si
+        su contenido coincide con el de otro modelo, ambos comparten la carga.
+
+        Returns:
+            bool: True si alguna de las rutas existe.
+        """
+        for ruta in rutas:
+            if os.path.exists(ruta):
+                self.nombres[nombre] = ruta
+                self.huellas.pop(nombre, None)
+                return True
+        return False
+
+    def __contains__(self, nombre):
+        return nombre in self.nombres
+
+    def obtener(self, nombre):
+        """Devuelve el modelo `nombre`, cargándolo si es la primera vez que se usa."""
+        with self._cerrojo:
+            huella = self._huella(nombre)
+            if huella in self.cargados:
+                self.cargados.move_to_end(huella)
+                self.cargas['aciertos'] += 1
+            else:
+                self.cargados[huella] = self._cargar(huella)
+                self._desalojar()
+                self.cargas['fallos'] += 1
+            self.estadisticas[huella]['usos'] += 1
+            return self.cargados[huella]
+
+    def resumen(self):
+        """
+        Una fila por modelo registrado con su artefacto, si está cargado, los
+        segundos de carga, la memoria que ocupa y las veces que se ha usado.
+        """
+        filas = []
+        # Otras sesiones pueden cargar o desalojar modelos a la vez
+        with self._cerrojo:
+            for nombre, ruta in self.nombres.items():
+                # Los modelos que aún no se han pedido no tienen hash
+                huella = self.huellas.get(nombre)
+                estadisticas = self.estadisticas.get(huella, {})
+                filas.append({
+                    'modelo': nombre,
+                    'artefacto': self.rutas[huella] if huella else ruta,
+                    'hash': huella[:12] if huella else None,
+                    'cargado': huella in self.cargados,
+                    'carga_s': estadisticas.get('segundos'),
+                    'memoria_mb': estadisticas['bytes'] / 2**20 if estadisticas else None,
+                    'usos': estadisticas.get('usos', 0),
+                })
+        return filas
+
+    def _huella(self, nombre):
+        # Hash del artefacto de `nombre`, calculado solo la primera vez que se pide
+        if nombre not in self.huellas:
+            huella = _huella(self.nombres[nombre])
+            self.huellas[nombre] = huella
+            self.rutas.setdefault(huella, self.nombres[nombre])
+        return self.huellas[nombre]
+
+    def _cargar(self, huella):
+        ruta = self.rutas[huella]
+        inicio = time.perf_counter()
+        if os.path.isdir(ruta):
+            modelo = servicio.cargar(ruta)
+        else:
+            modelo = joblib.load(ruta)
+            if self.convertir is not None:
+                modelo = self.convertir(modelo)
+        segundos = time.perf_counter() - inicio
+
+        usos = self.estadisticas.get(huella, {}).get('usos', 0)
+        self.estadisticas[huella] = {'segundos': segundos, 'bytes': _tamano(modelo, ruta), 'usos': usos}
+        return modelo
+
+    def _desalojar(self):
+        # Descarga los modelos usados hace más tiempo, salvo el último cargado
+        total = sum(self.estadisticas[h]['bytes'] for h in self.cargados)
+        while total > self.max_bytes and len(self.cargados) > 1:
+            huella, _ = self.cargados.popitem(last=False)
+            total -= self.estadisticas[huella]['bytes']
+
+
+def _huella(ruta):
+    # Hash de un fichero o, para un modelo exportado, de todos sus ficheros
+    if not os.path.isdir(ruta):
+        return huella_fichero(ruta)
+    partes = [f'{f}:{huella_fichero(os.path.join(ruta, f))}' for f in sorted(os.listdir(ruta))]
+    return hashlib.sha256('|'.join(partes).encode()).hexdigest()
+
+
+def _tamano(modelo, ruta):
+    # Memoria de un modelo según su artefacto: los arrays de un modelo exportado
+    # (mapeados o no) o el tamaño del pickle, que ocupan sobre todo sus arrays.
+    # No depende de lo que hagan a la vez otros hilos ni de los módulos importados
+    if isinstance(modelo, servicio.ModeloNumpy):
+        return sum(array.nbytes for array in modelo.arrays.values())
+    return os.path.getsize(ruta)
@@ -0,0 +1,268 @@
+'''
+Formato de servicio ligero para los modelos de clasificación de output/.
+
+`exportar` convierte un modelo entrenado de scikit-learn en un directorio con
+un `meta.json` y arrays `.npy`: los coeficientes de la regresión logística, o
+todos los árboles del Gradient Boosting completados y aplanados en arrays de
+variables, umbrales y hojas. `cargar`
+abre esos arrays mapeados en memoria y devuelve un `ModeloNumpy` que predice
+solo con NumPy, sin importar scikit-learn ni deserializar pickles, así que el
+arranque en frío es casi inmediato y los procesos comparten las páginas de los
+arrays.
+
+Exportar los modelos de output/ a output/servicio/ (desde la raíz del proyecto):
+
+    python -m utils.servicio
+'''
+
+import json
+import os
+import numpy as np
+
+
+DIRECTORIO_SERVICIO = 'output/servicio'
+# Filas que se evalúan a la vez en los árboles: limita las comparaciones
+# (filas x nodos) a unas decenas de MB
+FILAS_POR_BLOQUE = 4096
+# Los árboles se completan hasta su profundidad máxima, con 2^profundidad hojas
+# que deben caber en una máscara de 64 bits
+PROFUNDIDAD_MAXIMA = 6
+
+
+def exportar(modelo, directorio):
+    """
+    Guarda `modelo` en `directorio` en el formato de servicio.
+
+    Admite clasificadores lineales con `coef_` (LogisticRegression), también
+    precedidos de un escalado en un Pipeline, y `GradientBoostingClassifier`
+    con pérdida log_loss.
+
+    Args:
+        modelo: Clasificador de scikit-learn ya entrenado.
+        directorio (str): Directorio de destino; se crea si no existe.
+    """
+    meta, arrays = _exportar(modelo)
+    os.makedirs(directorio, exist_ok=True)
+    for nombre, array in arrays.items():
+        np.save(os.path.join(directorio, nombre + '.npy'), np.ascontiguousarray(array))
+    with open(os.path.join(directorio, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=1)
+
+
+def cargar(directorio):
+    """Abre un modelo exportado con `exportar`, con sus arrays mapeados en memoria."""
+    with open(os.path.join(directorio, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    arrays = {nombre[:-4]: np.load(os.path.join(directorio, nombre), mmap_mode='r')
+              for nombre in os.listdir(directorio) if nombre.endswith('.npy')}
+    return ModeloNumpy(meta, arrays)
+
+
+def convertir(modelo):
+    """
+    Como `exportar` + `cargar` pero en memoria: devuelve el `ModeloNumpy` de
+    `modelo` sin escribir ficheros. Lanza TypeError si no se puede exportar.
+    """
+    return ModeloNumpy(*_exportar(modelo))
+
+
+class ModeloNumpy:
+    """
+    Clasificador exportado con la misma interfaz de predicción que scikit-learn
+    (`predict`, `predict_proba`, `decision_function`, `classes_`).
+    """
+
+    def __init__(self, meta, arrays):
+        self.meta = meta
+        self.arrays = arrays
+        self.classes_ = np.asarray(meta['clases'])
+        if meta['columnas'] is not None:
+            self.feature_names_in_ = np.asarray(meta['columnas'], dtype=object)
+        if meta['tipo'] == 'gradient_boosting':
+            self._preparar_arboles()
+
+    def decision_function(self, X):
+        X = np.asarray(X, dtype=np.float64 if self.meta['tipo'] == 'lineal' else np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if self.meta['tipo'] == 'lineal':
+            return X @ self.arrays['coef'].T + self.arrays['intercept']
+        return np.concatenate([self._raw_arboles(X[i:i + FILAS_POR_BLOQUE])
+                               for i in range(0, len(X), FILAS_POR_BLOQUE)])
+
+    def predict_proba(self, X):
+        raw = self.decision_function(X)
+        if self.meta['multinomial']:
+            # Softmax estable
+            raw = np.exp(raw - raw.max(axis=1, keepdims=True))
+        else:
+            # Uno contra el resto: sigmoide por clase y normalización
+            raw = 1 / (1 + np.exp(-raw))
+        return raw / raw.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.decision_function(X), axis=1)]
+
+    def _preparar_arboles(self):
+        # Los árboles están completos y en orden de montículo (hijos de k en
+        # 2k+1 y 2k+2). Cada fila lleva una máscara de bits con las hojas aún
+        # alcanzables; al ir a la derecha en el nodo k se borran las hojas de su
+        # subárbol izquierdo y la hoja de salida es el bit más bajo que queda
+        profundidad = self.meta['profundidad']
+        n_internos, n_hojas = 2**profundidad - 1, 2**profundidad
+        self._tipo_mascara = np.dtype(f'uint{max(8, n_hojas)}')
+
+        def hojas(k):
+            if k >= n_internos:
+                return [k - n_internos]
+            return hojas(2 * k + 1) + hojas(2 * k + 2)
+
+        self._borrar = [self._tipo_mascara.type(sum(1 << h for h in hojas(2 * k + 1)))
+                        for k in range(n_internos)]
+        self._variable = np.asarray(self.arrays['variable']).ravel()
+        self._umbral = np.asarray(self.arrays['umbral']).reshape(-1, 1)
+        n_arboles = self.arrays['hojas'].shape[0]
+        self._primera_hoja = (np.arange(n_arboles) * n_hojas).reshape(-1, 1)
+
+    def _raw_arboles(self, X):
+        n_internos, n_arboles = self.arrays['variable'].shape
+        # Condición de cada nodo interno de cada árbol para cada fila:
+        # (nodos, árboles, filas), contiguo por nodo. Como en scikit-learn, se va
+        # a la derecha si no se cumple x <= umbral
+        derecha = ~(np.ascontiguousarray(X.T)[self._variable] <= self._umbral)
+        derecha = derecha.reshape(n_internos, n_arboles, len(X)).view(np.uint8)
+
+        mascara = np.full((n_arboles, len(X)), ~self._tipo_mascara.type(0))
+        for k, borrar in enumerate(self._borrar):
+            mascara &= ~(derecha[k].astype(self._tipo_mascara) * borrar)
+        # Índice del bit más bajo: exponente de la potencia de 2 aislada
+        hoja = np.frexp((mascara & (~mascara + 1)).astype(np.float64))[1] - 1
+
+        valores = np.asarray(self.arrays['hojas']).ravel()[hoja + self._primera_hoja]
+        n_estimadores, n_clases = len(self.arrays['hojas']) // len(self.classes_), len(self.classes_)
+        contribucion = valores.reshape(n_estimadores, n_clases, len(X)).sum(axis=0)
+        return self.arrays['inicial'] + contribucion.T
+
+
+def _exportar(modelo):
+    final = modelo.steps[-1][1] if hasattr(modelo, 'steps') else modelo
+    if hasattr(final, 'estimators_') and hasattr(final, 'learning_rate') and final is modelo:
+        meta, arrays = _exportar_gradient_boosting(modelo)
+    elif hasattr(final, 'coef_'):
+        meta, arrays = _exportar_lineal(modelo)
+    else:
+        raise TypeError(f'No se puede exportar un {type(modelo).__name__}')
+
+    meta['clases'] = modelo.classes_.tolist()
+    meta['columnas'] = [str(c) for c in getattr(modelo, 'feature_names_in_', [])] or None
+    return meta, arrays
+
+
+def _exportar_lineal(modelo):
+    if hasattr(modelo, 'steps'):
+        # Pipeline (escalado, clasificador): el escalado es afín, x' = a x + b,
+        # así que se integra en los coeficientes: coef·x' + i = (coef a)·x + (coef·b + i)
+        if len(modelo.steps) != 2:
+            raise TypeError('Solo se exportan Pipelines de escalado + clasificador lineal')
+        escalado, modelo = modelo.steps[0][1], modelo.steps[1][1]
+        n = modelo.coef_.shape[1]
+        b = np.asarray(escalado.transform(_como_entrada(escalado, np.zeros((1, n)))))[0]
+        a = np.diag(np.asarray(escalado.transform(_como_entrada(escalado, np.eye(n))))) - b
+        coef, intercept = modelo.coef_ * a, modelo.intercept_ + modelo.coef_ @ b
+    else:
+        coef, intercept = modelo.coef_, modelo.intercept_
+
+    n_clases = len(modelo.classes_)
+    if n_clases == 2:
+        raise TypeError('Solo se exportan clasificadores lineales multiclase')
+    multi_class = getattr(modelo, 'multi_class', 'auto')
+    multinomial = multi_class == 'multinomial' or (
+        multi_class == 'auto' and getattr(modelo, 'solver', 'lbfgs') != 'liblinear')
+    meta = {'tipo': 'lineal', 'multinomial': bool(multinomial)}
+    return meta, {'coef': coef.astype(np.float64), 'intercept': intercept.astype(np.float64)}
+
+
+def _exportar_gradient_boosting(modelo):
+    n_estimadores, n_clases = modelo.estimators_.shape
+    if n_clases < 3:
+        raise TypeError('Solo se exportan Gradient Boosting multiclase')
+    arboles = [modelo.estimators_[i, k].tree_
+               for i in range(n_estimadores) for k in range(n_clases)]
+    profundidad = max(t.max_depth for t in arboles)
+    if profundidad > PROFUNDIDAD_MAXIMA:
+        raise TypeError(f'Árboles de profundidad {profundidad} > {PROFUNDIDAD_MAXIMA}')
+
+    # Cada árbol se completa hasta `profundidad` en orden de montículo: una hoja
+    # que acaba antes se convierte en nodos con umbral infinito que repiten su valor
+    n_internos, n_hojas = 2**profundidad - 1, 2**profundidad
+    variable = np.zeros((n_internos, len(arboles)), dtype=np.int32)
+    umbral = np.full((n_internos, len(arboles)), np.inf)
+    hojas = np.zeros((len(arboles), n_hojas))
+    for j, t in enumerate(arboles):
+        pila = [(0, 0, 0)]
+        while pila:
+            nodo, posicion, nivel = pila.pop()
+            if nivel == profundidad:
+                # La tasa de aprendizaje se aplica ya en la exportación
+                hojas[j, posicion - n_internos] = t.value[nodo, 0, 0] * modelo.learning_rate
+                continue
+            izquierda, derecha = t.children_left[nodo], t.children_right[nodo]
+            if izquierda == -1:
+                izquierda = derecha = nodo
+            else:
+                variable[posicion, j] = t.feature[nodo]
+                umbral[posicion, j] = t.threshold[nodo]
+            pila += [(izquierda, 2 * posicion + 1, nivel + 1), (derecha, 2 * posicion + 2, nivel + 1)]
+
+    # Los umbrales se redondean hacia abajo a float32: para x en float32,
+    # x <= umbral64 equivale a x <= umbral32 y la comparación se hace en float32
+    umbral32 = umbral.astype(np.float32)
+    umbral32 = np.where(umbral32 > umbral, np.nextafter(umbral32, np.float32(-np.inf)), umbral32)
+
+    meta = {'tipo': 'gradient_boosting', 'multinomial': True, 'profundidad': int(profundidad),
+            'clases': modelo.classes_.tolist(), 'columnas': None}
+    arrays = {'variable': variable, 'umbral': umbral32, 'hojas': hojas,
+              'inicial': np.zeros(n_clases)}
+
+    # Predicción inicial (log de las probabilidades a priori): lo que queda de
+    # decision_function al quitar la aportación de los árboles en un punto cualquiera
+    x = np.zeros((1, modelo.n_features_in_), dtype=np.float32)
+    arboles_x = ModeloNumpy(meta, arrays).decision_function(x)[0]
+    arrays['inicial'] = np.asarray(modelo.decision_function(_como_entrada(modelo, x)))[0] - arboles_x
+    del meta['clases'], meta['columnas']
+    return meta, arrays
+
+
+def _como_entrada(modelo, x):
+    # Evita el aviso de scikit-learn si el modelo se entrenó con un DataFrame
+    if hasattr(modelo, 'feature_names_in_'):
+        import pandas as pd
+        return pd.DataFrame(x, columns=modelo.feature_names_in_)
+    return x
+
+
+if __name__ == '__main__':
+    import time
+    import joblib
+    import pandas as pd
+    from utils.clasificacion import MODELOS, nombre_columna
+
+    # Datos aleatorios de comprobación, en el rango de las columnas del catálogo
+    X = pd.DataFrame(np.random.default_rng(0).normal([8, 9, 8.5, 0.7, 0.8, 8, 0.8, 300, 6000, 2, 2],
+                                                     [1.5, 1.5, 1.5, 0.4, 0.4, 1.5, 0.4, 200, 1500, 2, 2],
+                                                     size=(20000, 11)).astype(np.float32))
+    for nombre, ruta in MODELOS.items():
+        modelo = joblib.load(ruta)
+        X.columns = getattr(modelo, 'feature_names_in_', X.columns)
+        destino = os.path.join(DIRECTORIO_SERVICIO, nombre_columna(nombre))
+        exportar(modelo, destino)
+
+        inicio = time.perf_counter()
+        servido = cargar(destino)
+        carga = time.perf_counter() - inicio
+        diferencia = np.abs(servido.predict_proba(X) - modelo.predict_proba(X)).max()
+        coinciden = (servido.predict(X) == modelo.predict(X)).mean()
+        tamano = sum(os.path.getsize(os.path.join(destino, f)) for f in os.listdir(destino))
+        print(f'{nombre}: {os.path.getsize(ruta) / 1024:.0f} KB -> {tamano / 1024:.0f} KB, '
+              f'carga {carga * 1000:.1f} ms, |dif. probabilidad| {diferencia:.1e}, '
+              f'predicciones iguales {coinciden:.2%}')